@@ -1,9 +1,12 @@
 from moziris.api.enums import (
     Alignment,
     Button,
+    CaptureBackend,
     Color,
     LanguageCode,
     Locales,
+    MatcherType,
+    OcrBackend,
     OSPlatform,
 )
 from moziris.api.errors import *
@@ -21,7 +24,7 @@ from moziris.api.keyboard.keyboard_util import (
     is_shift_character,
 )
 from moziris.api.keyboard.keyboard import key_down, key_up, type
-from moziris.api.location import Location
+from moziris.api.location import Location, LocationCollection
 from moziris.api.mouse.mouse_controller import Mouse
 from moziris.api.mouse.mouse import *
 from moziris.api.os_helpers import *
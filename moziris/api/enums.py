@@ -200,6 +200,29 @@ class MatchTemplateType(Enum):
     MULTIPLE = 1
 
 
+class MatcherType(str, Enum):
+    AUTO = "auto"
+    OPENCV = "opencv"
+    PYRAMID = "pyramid"
+    FFT = "fft"
+    UMAT = "umat"
+    NUMPY = "numpy"
+    FEATURES = "features"
+
+
+class CaptureBackend(str, Enum):
+    AUTO = "auto"
+    X11_SHM = "x11_shm"
+    MSS = "mss"
+    PYAUTOGUI = "pyautogui"
+
+
+class OcrBackend(str, Enum):
+    AUTO = "auto"
+    TESSEROCR = "tesserocr"
+    PYTESSERACT = "pytesseract"
+
+
 class OSPlatform(str, Enum):
     WINDOWS = "win"
     LINUX = "linux"
@@ -3,19 +3,56 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 
+import logging
 import time
 
 from moziris.api.enums import Color
 from moziris.api.enums import MatchTemplateType
-from moziris.api.errors import FindError
-from moziris.api.finder.image_search import image_find, match_template, image_vanish
+from moziris.api.errors import FindError, ScreenshotError
+from moziris.api.finder.image_search import (
+    get_region_screenshot,
+    image_find,
+    match_template,
+    image_vanish,
+    WaitScheduler,
+)
 from moziris.api.finder.pattern import Pattern
 from moziris.api.finder.text_search import text_find, text_find_all
 from moziris.api.highlight.screen_highlight import ScreenHighlight, HighlightRectangle
 from moziris.api.location import Location
 from moziris.api.rectangle import Rectangle
+from moziris.api.screen.screenshot_image import is_frozen
 from moziris.api.settings import Settings
 
+# The names imported above were exported to moziris.api before this list was added.
+__all__ = [
+    "Color",
+    "FindError",
+    "HighlightRectangle",
+    "Location",
+    "MatchTemplateType",
+    "Pattern",
+    "Rectangle",
+    "ScreenHighlight",
+    "Settings",
+    "exists",
+    "find",
+    "find_all",
+    "find_any",
+    "highlight",
+    "image_find",
+    "image_vanish",
+    "match_template",
+    "text_find",
+    "text_find_all",
+    "time",
+    "wait",
+    "wait_any",
+    "wait_vanish",
+]
+
+logger = logging.getLogger(__name__)
+
 
 def highlight(
     region=None, seconds=None, color=None, ps=None, location=None, text_location=None
@@ -98,15 +135,21 @@ def find(ps: Pattern or str, region: Rectangle = None) -> Location or FindError:
             raise FindError("Unable to find text %s" % ps)
 
 
-def find_all(ps: Pattern or str, region: Rectangle = None):
+def find_all(ps: Pattern or str, region: Rectangle = None, max_results: int = None):
     """Look for all matches of a Pattern or image.
 
     :param ps: Pattern or String.
     :param region: Rectangle object in order to minimize the area.
-    :return: Location object or FindError.
+    :param max_results: Maximum number of Pattern matches, Settings.max_find_results if None.
+    :return: LocationCollection of Pattern matches, list of text Locations or FindError.
+
+    Pattern matches are ordered from top to bottom and left to right. When there are more
+    than max_results matches, the most similar ones are returned.
     """
     if isinstance(ps, Pattern):
-        images_found = match_template(ps, region, MatchTemplateType.MULTIPLE)
+        images_found = match_template(
+            ps, region, MatchTemplateType.MULTIPLE, max_results=max_results
+        ).sort_by_position()
         if len(images_found) > 0:
             if Settings.highlight:
                 highlight(region=region, ps=ps, location=images_found)
@@ -128,6 +171,96 @@ def find_all(ps: Pattern or str, region: Rectangle = None):
             raise FindError("Unable to find text %s" % ps)
 
 
+def _match_any(ps_list, region: Rectangle = None):
+    """Search a list of Patterns or strings in one screenshot of the region.
+
+    :param ps_list: List of Patterns or Strings, searched in the given order.
+    :param region: Rectangle object in order to minimize the area.
+    :return: Pair of the index of the first item found and its Location, or None.
+    """
+    for ps in ps_list:
+        if isinstance(ps, str) and not Settings.OCR_ENABLED:
+            raise FindError("OCR is not enabled, cannot search for text.")
+        elif not isinstance(ps, (Pattern, str)):
+            raise ValueError("Invalid input")
+
+    try:
+        stack_image = get_region_screenshot(region)
+    except ScreenshotError:
+        logger.warning("Screenshot failed.")
+        return None
+
+    for index, ps in enumerate(ps_list):
+        if isinstance(ps, Pattern):
+            image_found = match_template(
+                ps, region, MatchTemplateType.SINGLE, stack_image
+            )
+            if len(image_found) > 0:
+                if Settings.highlight:
+                    highlight(region=region, ps=ps, location=image_found)
+                return index, image_found[0]
+        else:
+            text_found = text_find(ps, region, stack_image)
+            if len(text_found) > 0:
+                if Settings.highlight:
+                    highlight(region=region, ps=ps, text_location=text_found)
+                return index, Location(text_found[0].x, text_found[0].y)
+    return None
+
+
+def _get_names(ps_list):
+    return ", ".join(
+        ps.get_filename() if isinstance(ps, Pattern) else ps for ps in ps_list
+    )
+
+
+def find_any(ps_list, region: Rectangle = None) -> (int, Location) or FindError:
+    """Look for the first match of several Patterns or strings, using a single screenshot.
+
+    :param ps_list: List of Patterns or Strings, searched in the given order.
+    :param region: Rectangle object in order to minimize the area.
+    :return: Pair of the index of the item found in ps_list and its Location.
+    """
+    found = _match_any(ps_list, region)
+    if found is None:
+        raise FindError("Unable to find any of %s" % _get_names(ps_list))
+    return found
+
+
+def wait_any(
+    ps_list, timeout: float = None, region: Rectangle = None
+) -> (int, Location) or FindError:
+    """Wait until one of several Patterns or strings appears.
+
+    Every attempt takes a single screenshot and searches all items in it, so waiting for
+    N candidates costs at most one timeout instead of N. Inside a freeze() block containing
+    the region, a single attempt is made.
+
+    :param ps_list: List of Patterns or Strings, searched in the given order.
+    :param timeout: Number as maximum waiting time in seconds.
+    :param region: Rectangle object in order to minimize the area.
+    :return: Pair of the index of the item found in ps_list and its Location.
+    """
+    if timeout is None:
+        timeout = Settings.auto_wait_timeout
+    if is_frozen(region):
+        timeout = 0
+
+    scheduler = WaitScheduler("Wait any: %s" % _get_names(ps_list), timeout)
+    while scheduler.next_attempt():
+        logger.debug(
+            "Wait any: {} - {} seconds remaining".format(
+                _get_names(ps_list), scheduler.remaining()
+            )
+        )
+        found = _match_any(ps_list, region)
+        if found is not None:
+            scheduler.finish(True)
+            return found
+    scheduler.finish(False)
+    raise FindError("Unable to find any of %s" % _get_names(ps_list))
+
+
 def wait(ps, timeout=None, region=None) -> bool or FindError:
     """Verify that a Pattern or str appears.
 
@@ -0,0 +1,101 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import difflib
+
+import numpy as np
+
+# Code point padding the end of the shorter tokens, which matches no character.
+PADDING = -1
+
+
+class TokenArray:
+    """Texts packed into one array of code points, to be scored against a query at once.
+
+    Each row holds the code points of a text, padded to the length of the longest text.
+    The texts are packed once and can then be scored against any number of queries.
+    """
+
+    def __init__(self, texts: list):
+        self.texts = list(texts)
+        self.lengths = np.array([len(text) for text in self.texts], dtype=np.int64)
+        width = int(self.lengths.max()) if len(self.texts) > 0 else 0
+        self.codes = np.full((len(self.texts), width), PADDING, dtype=np.int32)
+        if width > 0:
+            characters = np.frombuffer(
+                "".join(self.texts).encode("utf-32-le"), dtype=np.uint32
+            )
+            self.codes[np.arange(width) < self.lengths[:, np.newaxis]] = characters
+
+    def __len__(self):
+        return len(self.texts)
+
+
+def get_similarities(query: str, tokens: TokenArray, indices=None) -> np.ndarray:
+    """Scores a query against tokens with their normalized edit distance.
+
+    The similarity of two texts is 1 - d / (len(a) + len(b)), d being the number of
+    characters to insert or delete to turn one text into the other. It is 2 * M / T, M
+    being the length of their longest common subsequence and T their total length. The
+    ratio() of difflib.SequenceMatcher is 2 * M / T with M the size of the matching blocks
+    it finds, which are a common subsequence, so it is never above this similarity.
+
+    The longest common subsequences of all tokens are computed together, one row of the
+    dynamic programming table per character of the query.
+
+    :param query: Text to score.
+    :param tokens: TokenArray of the texts to score the query against.
+    :param indices: Indices of the tokens to score, all tokens if None.
+    :return: Array of similarities between 0 and 1, one per scored token.
+    """
+    codes, lengths = tokens.codes, tokens.lengths
+    if indices is not None:
+        codes, lengths = codes[indices], lengths[indices]
+
+    common = np.zeros((len(codes), codes.shape[1] + 1), dtype=np.int32)
+    candidate = np.empty_like(common)
+    for character in query:
+        # The longest common subsequence ending at or before each character of the token,
+        # either extended by a match or kept from the previous character of the query.
+        candidate[:, 0] = 0
+        np.add(common[:, :-1], codes == ord(character), out=candidate[:, 1:])
+        np.maximum(candidate, common, out=candidate)
+        np.maximum.accumulate(candidate, axis=1, out=common)
+
+    matches = common[np.arange(len(codes)), lengths]
+    total = len(query) + lengths
+    return np.where(total > 0, 2.0 * matches / np.maximum(total, 1), 1.0)
+
+
+def get_close_matches(
+    query: str, tokens: TokenArray, cutoff: float, indices=None
+) -> list:
+    """Finds the tokens similar to a query, like difflib.get_close_matches().
+
+    The similarities of all tokens are computed first, and only the tokens above the
+    cutoff are compared with difflib, which never gives a higher score. The matches are
+    the same as those of difflib, each token being compared with it at most once.
+
+    :param query: Text to search.
+    :param tokens: TokenArray of the texts to search in.
+    :param cutoff: Minimum similarity of a token.
+    :param indices: Indices of the tokens to search in, all tokens if None.
+    :return: List of token indices, the most similar first and in token order if equal.
+    """
+    similarities = get_similarities(query, tokens, indices)
+    candidates = np.flatnonzero(similarities >= cutoff)
+    if indices is not None:
+        candidates = np.asarray(indices, dtype=np.int64)[candidates]
+
+    matcher = difflib.SequenceMatcher()
+    matcher.set_seq2(query)
+    matches = []
+    for index in candidates.tolist():
+        matcher.set_seq1(tokens.texts[index])
+        ratio = matcher.ratio()
+        if ratio >= cutoff:
+            matches.append((-ratio, index))
+    matches.sort()
+    return [index for ratio, index in matches]
@@ -0,0 +1,171 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import logging
+import os
+import threading
+import time
+
+from moziris.api.os_helpers import OSHelper
+from moziris.api.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of seconds between two checks of the directory modification times.
+INDEX_CHECK_INTERVAL = 2.0
+# The default file systems of Windows and macOS ignore the case of file names.
+CASE_INSENSITIVE_FILE_SYSTEM = OSHelper.is_windows() or OSHelper.is_mac()
+
+
+class _ImageIndex:
+    """Index of the images directories of the test packages.
+
+    Each 'images' directory is listed once, when the first Pattern of a test module in its
+    package is resolved. Lookups are then answered from the listing, which is rebuilt when
+    the modification time of one of its directories changes.
+
+    File names are compared ignoring case on Windows and macOS, whose default file systems
+    are case insensitive, and the paths returned have the case of the files on disk.
+
+    Lookups also record the images that could not be found, and the images that hide other
+    candidates with a lower priority, e.g. a platform image hiding a common one.
+    """
+
+    def __init__(self):
+        self.missing = {}
+        self.shadowed = {}
+        self._roots = {}
+        self._os_directory = None
+        self._lock = threading.Lock()
+
+    def find(self, module_directory: str, image: str):
+        """Returns the path of an image for the current platform and locale.
+
+        :param module_directory: Directory of the test module.
+        :param image: String filename of image.
+        :return: Full path to image on disk, or None if it doesn't exist.
+        """
+        images_directory = os.path.join(module_directory, "images")
+        listing = self._get_listing(images_directory)
+        file_name = image.split(".")[0]
+        names = [image, "%s@2x.png" % file_name]
+
+        candidates = []
+        for directory in self._get_search_directories(images_directory):
+            files = listing.get(_normcase(directory), {})
+            for name in names:
+                name = files.get(_normcase(name))
+                if name is not None:
+                    candidates.append(os.path.join(directory, name))
+
+        requested = os.path.join(images_directory, image)
+        if len(candidates) == 0:
+            self.missing[requested] = self.missing.get(requested, 0) + 1
+            return None
+        self.missing.pop(requested, None)
+        if len(candidates) > 1:
+            self.shadowed[candidates[0]] = candidates[1:]
+        return candidates[0]
+
+    def get_images(self, module_directory: str) -> list:
+        """Returns the paths of all images a test module resolves, for the current platform and locale.
+
+        :param module_directory: Directory of the test module.
+        :return: List of full paths, without the images hidden by others.
+        """
+        images_directory = os.path.join(module_directory, "images")
+        listing = self._get_listing(images_directory)
+        names = []
+        for directory in self._get_search_directories(images_directory):
+            for name in sorted(listing.get(_normcase(directory), {}).values()):
+                base, extension = os.path.splitext(name)
+                if base.endswith("@2x"):
+                    name = base[: -len("@2x")] + extension
+                if name not in names:
+                    names.append(name)
+        paths = []
+        for name in names:
+            path = self.find(module_directory, name)
+            if path is not None and path not in paths:
+                paths.append(path)
+        return paths
+
+    def get_report(self) -> dict:
+        """Returns the images not found and the images hidden by others."""
+        return {"missing": sorted(self.missing), "shadowed": dict(self.shadowed)}
+
+    def _get_search_directories(self, images_directory: str) -> list:
+        """Returns the directories of an images directory, from the highest priority:
+
+        - current platform locale folder
+        - common locale folder
+        - current platform root
+        - common root
+        """
+        platform_directory = os.path.join(images_directory, self._get_os_directory())
+        common_directory = os.path.join(images_directory, "common")
+        directories = []
+        if Settings.locale != "":
+            directories.append(os.path.join(platform_directory, Settings.locale))
+            directories.append(os.path.join(common_directory, Settings.locale))
+        directories.append(platform_directory)
+        directories.append(common_directory)
+        return directories
+
+    def _get_os_directory(self) -> str:
+        if self._os_directory is None:
+            if OSHelper.get_os_version() == "win7":
+                self._os_directory = "win7"
+            else:
+                self._os_directory = OSHelper.get_os().value
+        return self._os_directory
+
+    def _get_listing(self, images_directory: str) -> dict:
+        with self._lock:
+            root = self._roots.get(images_directory)
+            now = time.monotonic()
+            if root is None or (
+                now - root["checked"] > INDEX_CHECK_INTERVAL and _is_changed(root)
+            ):
+                root = _list_directory(images_directory)
+                self._roots[images_directory] = root
+            root["checked"] = now
+            return root["files"]
+
+
+def _list_directory(images_directory: str) -> dict:
+    """Lists the files and modification times of all directories of an images tree."""
+    files = {}
+    modified = {}
+    for dir_path, sub_dirs, all_files in os.walk(images_directory):
+        files[_normcase(dir_path)] = {_normcase(name): name for name in all_files}
+        try:
+            modified[dir_path] = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            pass
+    modified.setdefault(images_directory, None)
+    logger.debug("Indexed %s image directories in %s" % (len(files), images_directory))
+    return {"files": files, "modified": modified, "checked": time.monotonic()}
+
+
+def _normcase(path: str) -> str:
+    """Returns a path in the case compared by the file system of the platform."""
+    if CASE_INSENSITIVE_FILE_SYSTEM:
+        return os.path.normcase(path).lower()
+    return path
+
+
+def _is_changed(root: dict) -> bool:
+    for directory, modified in root["modified"].items():
+        try:
+            if os.stat(directory).st_mtime_ns != modified:
+                return True
+        except OSError:
+            if modified is not None:
+                return True
+    return False
+
+
+ImageIndex = _ImageIndex()
@@ -5,11 +5,11 @@
 
 import datetime
 import logging
+import time
 
 import cv2
 import numpy as np
 
-
 try:
     import Image
 except ImportError:
@@ -17,20 +17,116 @@ except ImportError:
 
 from moziris.api.enums import MatchTemplateType
 from moziris.api.errors import ScreenshotError
+from moziris.api.finder.location_hints import LocationHints
+from moziris.api.finder.matchers import get_matcher
 from moziris.api.finder.pattern import Pattern
-from moziris.api.location import Location
+from moziris.api.location import LocationCollection
 from moziris.api.rectangle import Rectangle
 from moziris.api.save_debug_image.save_image import save_debug_image
+from moziris.api.screen.capture_thread import CaptureThread
 from moziris.api.screen.display import DisplayCollection
-from moziris.api.screen.screenshot_image import ScreenshotImage
+from moziris.api.screen.screenshot_image import (
+    ScreenshotImage,
+    _region_in_display_list,
+    frozen_screenshot,
+    get_display_executor,
+    is_frozen,
+)
 from moziris.api.settings import Settings
 
 
 logger = logging.getLogger(__name__)
 
-FIND_METHOD = cv2.TM_CCOEFF_NORMED
 last_image_write_time = datetime.datetime.now()
 
+# Adaptive back off multiplies the interval between attempts after every miss, up to a maximum.
+WAIT_BACKOFF_FACTOR = 1.5
+WAIT_BACKOFF_MAX_INTERVAL = 1.0
+
+
+class WaitScheduler:
+    """Paces the attempts of a waiting operation to Settings.wait_scan_rate attempts per second.
+
+    The first attempt starts immediately and the last one exactly at the deadline, so a wait
+    always gets a final chance no matter how the scan rate divides the timeout. With
+    Settings.wait_scan_backoff the interval grows after every unsuccessful attempt.
+
+    Usage::
+
+        scheduler = WaitScheduler("Image find", timeout)
+        while scheduler.next_attempt():
+            if search():
+                return scheduler.finish(True)
+        scheduler.finish(False)
+    """
+
+    last_attempts = 0
+
+    def __init__(
+        self, name: str, timeout: float, scan_rate: float = None, backoff: bool = None
+    ):
+        if scan_rate is None:
+            scan_rate = Settings.wait_scan_rate
+        if backoff is None:
+            backoff = Settings.wait_scan_backoff
+
+        self.name = name
+        self.attempts = 0
+        self._base_interval = 1.0 / scan_rate if scan_rate > 0 else 0.0
+        self._interval = self._base_interval
+        self._backoff = backoff
+        self._start_time = time.monotonic()
+        self._deadline = self._start_time + max(timeout, 0)
+        self._last_attempt_time = None
+        self._is_final_attempt = False
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline."""
+        return max(self._deadline - time.monotonic(), 0.0)
+
+    def next_attempt(self) -> bool:
+        """Sleeps until the next attempt is due.
+
+        :return: True if another attempt should be made, False once the final attempt is done.
+        """
+        if self._is_final_attempt:
+            return False
+
+        now = time.monotonic()
+        if self._last_attempt_time is not None:
+            if self._backoff:
+                self._interval = min(
+                    self._interval * WAIT_BACKOFF_FACTOR,
+                    max(WAIT_BACKOFF_MAX_INTERVAL, self._base_interval),
+                )
+            next_time = min(self._last_attempt_time + self._interval, self._deadline)
+            if now < next_time:
+                time.sleep(next_time - now)
+                now = next_time
+
+        self._is_final_attempt = now >= self._deadline
+        self._last_attempt_time = now
+        self.attempts += 1
+        return True
+
+    def finish(self, success: bool) -> bool:
+        """Logs and records how many attempts the wait used.
+
+        :param success: Result of the waiting operation.
+        :return: The success value, unchanged.
+        """
+        WaitScheduler.last_attempts = self.attempts
+        logger.debug(
+            "%s %s after %s attempts in %.2f seconds."
+            % (
+                self.name,
+                "succeeded" if success else "timed out",
+                self.attempts,
+                time.monotonic() - self._start_time,
+            )
+        )
+        return success
+
 
 def _is_pattern_size_correct(pattern, region):
     """validates that the pattern is inside the region."""
@@ -57,98 +153,274 @@ def _is_pattern_size_correct(pattern, region):
     return is_correct
 
 
+def get_region_screenshot(
+    region: Rectangle = None, after: float = None
+) -> ScreenshotImage:
+    """Capture a Region or full screen once, so that it can be searched several times.
+
+    While the capture thread runs, the region is cropped from the newest frame of its display
+    instead of grabbing the screen.
+
+    :param Region region: Region object.
+    :param float after: Monotonic time the screenshot must be taken after, the time of the
+    call if None.
+    :return: ScreenshotImage of the region.
+    """
+    if region is None:
+        region = DisplayCollection[0].bounds
+    screen_id = _region_in_display_list(region)
+    if CaptureThread.is_running() and screen_id is not None:
+        if after is None:
+            after = time.monotonic()
+        frame = CaptureThread.get_frame(screen_id, after)
+        if frame is not None:
+            return ScreenshotImage(region=region, screen_id=screen_id, source=frame)
+    return ScreenshotImage(region=region, screen_id=screen_id)
+
+
+def freeze(region: Rectangle = None):
+    """Capture a Region or full screen once and reuse it for all finds inside the region.
+
+    Usage::
+
+        with freeze(region):
+            exists(first_pattern)
+            find(second_pattern)
+
+    The screen can't change inside the block, so waiting operations make a single attempt
+    on the frozen frame and return at once instead of waiting for their timeout.
+
+    :param Region region: Region object.
+    :return: Context manager yielding the frozen ScreenshotImage.
+    """
+    return frozen_screenshot(get_region_screenshot(region))
+
+
 def match_template(
     pattern: Pattern,
     region: Rectangle = None,
     match_type: MatchTemplateType = MatchTemplateType.SINGLE,
-):
+    stack_image: ScreenshotImage = None,
+    search_area: Rectangle = None,
+    max_results: int = None,
+) -> LocationCollection:
     """Find a pattern in a Region or full screen
 
     :param Pattern pattern: Image details
     :param Region region: Region object.
     :param MatchTemplateType match_type: Type of match_template (single or multiple)
-    :return: Location.
+    :param ScreenshotImage stack_image: Screenshot of the region to search, a new one is taken if None.
+    :param Rectangle search_area: Part of the screenshot to search, relative to the region. Whole screenshot if None.
+    :param int max_results: Maximum number of multiple matches, Settings.max_find_results if None.
+    :return: LocationCollection, best match first.
+
+    With Settings.location_hints, a single match is first searched around the location where
+    the same image was last found, and in the whole search area only if that fails. The
+    match found around that location is returned even if a better one exists elsewhere.
+
+    With Settings.search_all_displays and no region, every display is searched.
     """
+    if max_results is None:
+        max_results = Settings.max_find_results
+
     if region is None:
+        if stack_image is None and _is_all_displays_search():
+            return _match_all_displays(pattern, match_type, max_results)
         region = DisplayCollection[0].bounds
 
-    locations_list = []
-    save_img_location_list = []
     if not isinstance(match_type, MatchTemplateType):
         logger.warning(
             "%s should be an instance of `%s`" % (match_type, MatchTemplateType)
         )
-        return []
+        return LocationCollection()
     try:
-        stack_image = ScreenshotImage(
-            region=region, screen_id=_region_in_display_list(region)
-        )
+        if stack_image is None:
+            stack_image = get_region_screenshot(region)
         precision = pattern.similarity
         if precision == 0.99:
-            logger.debug("Searching image with similarity %s" % precision)
-            res = cv2.matchTemplate(
-                stack_image.get_color_array(), pattern.get_color_array(), FIND_METHOD
-            )
+            stack_array = stack_image.get_color_array()
+            pattern_array = pattern.get_color_array()
         else:
-            logger.debug("Searching image with similarity %s" % precision)
-            res = cv2.matchTemplate(
-                stack_image.get_gray_array(), pattern.get_gray_array(), FIND_METHOD
-            )
+            stack_array = stack_image.get_gray_array()
+            pattern_array = pattern.get_gray_array()
+
+        matcher = pattern.matcher if pattern.matcher is not None else Settings.matcher
+        logger.debug(
+            "Searching image with similarity %s using %s matcher"
+            % (precision, getattr(matcher, "value", matcher))
+        )
 
-        if match_type is MatchTemplateType.SINGLE:
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-            logger.debug("Min location %s and max location %s" % (min_val, max_val))
-            if max_val >= precision:
-                locations_list.append(
-                    Location(max_loc[0] + region.x, max_loc[1] + region.y)
+        save_img_locations = LocationCollection()
+        if (
+            Settings.location_hints
+            and match_type is MatchTemplateType.SINGLE
+            and search_area is None
+        ):
+            hint_area = LocationHints.get_search_area(
+                pattern, region, stack_image.width, stack_image.height
+            )
+            if hint_area is not None:
+                save_img_locations = _match_area(
+                    matcher,
+                    stack_array,
+                    pattern_array,
+                    precision,
+                    match_type,
+                    max_results,
+                    hint_area,
                 )
-                save_img_location_list.append(Location(max_loc[0], max_loc[1]))
-        elif match_type is MatchTemplateType.MULTIPLE:
-            loc = np.where(res >= precision)
-            for pt in zip(*loc[::-1]):
-                save_img_location = Location(pt[0], pt[1])
-                location = Location(pt[0] + region.x, pt[1] + region.y)
-                save_img_location_list.append(save_img_location)
-                locations_list.append(location)
+                LocationHints.record(len(save_img_locations) > 0)
+
+        if len(save_img_locations) == 0:
+            save_img_locations = _match_area(
+                matcher,
+                stack_array,
+                pattern_array,
+                precision,
+                match_type,
+                max_results,
+                search_area,
+            )
+
+        locations = save_img_locations.offset(region.x, region.y)
+        if Settings.location_hints and match_type is MatchTemplateType.SINGLE:
+            if len(locations) > 0:
+                LocationHints.update(pattern, locations[0])
 
         # Limit debug image creation to one per second to avoid creating unnecessary images.
         global last_image_write_time
         next_write_time = last_image_write_time + datetime.timedelta(seconds=1)
         if datetime.datetime.now() > next_write_time:
-            save_debug_image(pattern, stack_image, save_img_location_list)
+            save_debug_image(pattern, stack_image, save_img_locations)
             last_image_write_time = datetime.datetime.now()
 
     except ScreenshotError:
         logger.warning("Screenshot failed.")
-        return []
+        return LocationCollection()
 
-    return locations_list
+    return locations
 
 
-def _region_in_display_list(region=None):
-    r_x = region.x
-    r_y = region.y
-    r_w = region.width
-    r_h = region.height
+def _is_all_displays_search() -> bool:
+    return Settings.search_all_displays and len(DisplayCollection) > 1
 
-    for index, display in enumerate(DisplayCollection):
-        d_x = display.bounds.x
-        d_y = display.bounds.y
-        d_w = display.bounds.width
-        d_h = display.bounds.height
 
-        if (
-            r_x >= d_x
-            and r_x - d_x + r_w <= d_w
-            and r_y >= d_y
-            and r_y - d_y + r_h <= d_h
-        ):
-            return index
+def _get_all_displays_bounds() -> Rectangle:
+    """Returns the Rectangle containing every display, in global coordinates."""
+    x = min(display.bounds.x for display in DisplayCollection)
+    y = min(display.bounds.y for display in DisplayCollection)
+    x_end = max(
+        display.bounds.x + display.bounds.width for display in DisplayCollection
+    )
+    y_end = max(
+        display.bounds.y + display.bounds.height for display in DisplayCollection
+    )
+    return Rectangle(x, y, x_end - x, y_end - y)
+
+
+def _match_all_displays(pattern, match_type, max_results) -> LocationCollection:
+    """Searches every display concurrently, each with its own scale.
+
+    :return: LocationCollection in global coordinates, best match first.
+    """
+    results = list(
+        get_display_executor().map(
+            lambda display: match_template(
+                pattern, display.bounds, match_type, max_results=max_results
+            ),
+            DisplayCollection,
+        )
+    )
+    positions = np.concatenate([result.positions for result in results])
+    scores = np.concatenate([result.scores for result in results])
+    order = np.argsort(-scores, kind="stable")
+    if match_type is MatchTemplateType.SINGLE:
+        order = order[:1]
+    else:
+        order = order[:max_results]
+    return LocationCollection(positions[order], scores[order])
+
+
+def _match_area(
+    matcher,
+    stack_array,
+    pattern_array,
+    precision,
+    match_type,
+    max_results,
+    search_area=None,
+):
+    """Runs a matcher on a part of the screenshot.
+
+    :return: LocationCollection relative to the whole screenshot.
+    """
+    if search_area is not None:
+        stack_array = stack_array[
+            search_area.y : search_area.y + search_area.height,
+            search_area.x : search_area.x + search_area.width,
+        ]
+    positions, scores = get_matcher(matcher)(
+        stack_array, pattern_array, precision, match_type, max_results
+    )
+    locations = LocationCollection(positions, scores)
+    if search_area is not None:
+        return locations.offset(search_area.x, search_area.y)
+    return locations
+
+
+def _get_changed_area(previous_image, stack_image):
+    """Compares two screenshots of the same region.
+
+    :param ScreenshotImage previous_image: Screenshot from the previous search.
+    :param ScreenshotImage stack_image: Current screenshot.
+    :return: Rectangle bounding the changed pixels, or None if fewer than
+    Settings.observe_min_changed_pixels pixels changed.
+    """
+    previous_array = previous_image.get_gray_array()
+    current_array = stack_image.get_gray_array()
+    if previous_array.shape != current_array.shape:
+        return Rectangle(0, 0, stack_image.width, stack_image.height)
+
+    diff = cv2.absdiff(previous_array, current_array)
+    changed_pixels = cv2.countNonZero(diff)
+    if changed_pixels == 0 or changed_pixels < Settings.observe_min_changed_pixels:
+        return None
+
+    x, y, width, height = cv2.boundingRect(diff)
+    return Rectangle(x, y, width, height)
+
+
+def _get_search_area(changed_area, pattern, stack_image):
+    """Expands a changed area to contain every pattern position that overlaps it."""
+    p_width, p_height = pattern.get_size()
+    x = max(changed_area.x - p_width + 1, 0)
+    y = max(changed_area.y - p_height + 1, 0)
+    x_end = min(changed_area.x + changed_area.width + p_width - 1, stack_image.width)
+    y_end = min(changed_area.y + changed_area.height + p_height - 1, stack_image.height)
+    return Rectangle(x, y, x_end - x, y_end - y)
+
+
+def _is_overlapping(first, second):
+    """Checks if two Rectangle objects overlap."""
+    return (
+        first.x < second.x + second.width
+        and second.x < first.x + first.width
+        and first.y < second.y + second.height
+        and second.y < first.y + first.height
+    )
 
 
 def image_find(pattern, timeout=None, region=None):
     """ Search for an image in a Region or full screen.
 
+    Attempts are paced by a WaitScheduler. Only the first attempt searches the whole
+    region. Later attempts search only around the pixels that changed since the last
+    search, and are skipped if fewer than Settings.observe_min_changed_pixels pixels changed.
+    While the capture thread runs, each attempt searches a newer frame than the previous one.
+    With Settings.search_all_displays and no region, the displays are stitched into one
+    screenshot, so that the change detection still applies. Inside a freeze() block
+    containing the region, a single attempt is made.
+
     :param Pattern pattern: Name of the searched image.
     :param timeout: Number as maximum waiting time in seconds.
     :param Region region: Region object.
@@ -157,24 +429,48 @@ def image_find(pattern, timeout=None, region=None):
     if not _is_pattern_size_correct(pattern, region):
         return None
 
+    if region is None and _is_all_displays_search():
+        region = _get_all_displays_bounds()
+
     if timeout is None:
         timeout = Settings.auto_wait_timeout
+    if is_frozen(region):
+        timeout = 0
 
-    start_time = datetime.datetime.now()
-    end_time = start_time + datetime.timedelta(seconds=timeout)
+    scheduler = WaitScheduler("Image find: %s" % pattern.get_filename(), timeout)
+    searched_image = None
+    last_timestamp = None
 
-    while start_time < end_time:
-        time_remaining = end_time - start_time
+    while scheduler.next_attempt():
         logger.debug(
             "Image find: {} - {} seconds remaining".format(
-                pattern.get_filename(), time_remaining
+                pattern.get_filename(), scheduler.remaining()
             )
         )
-        pos = match_template(pattern, region, MatchTemplateType.SINGLE)
-        start_time = datetime.datetime.now()
+        try:
+            stack_image = get_region_screenshot(region, last_timestamp)
+        except ScreenshotError:
+            logger.warning("Screenshot failed.")
+            continue
+        last_timestamp = stack_image.timestamp
+
+        search_area = None
+        if searched_image is not None:
+            changed_area = _get_changed_area(searched_image, stack_image)
+            if changed_area is None:
+                logger.debug("Region unchanged, skipping search.")
+                continue
+            search_area = _get_search_area(changed_area, pattern, stack_image)
+
+        pos = match_template(
+            pattern, region, MatchTemplateType.SINGLE, stack_image, search_area
+        )
+        searched_image = stack_image
 
         if len(pos) == 1:
+            scheduler.finish(True)
             return pos[0]
+    scheduler.finish(False)
     return None
 
 
@@ -183,6 +479,10 @@ def image_vanish(
 ) -> None or bool:
     """ Search if an image is NOT in a Region or full screen.
 
+    Attempts are paced by a WaitScheduler. After the first attempt, the region is searched
+    again only when the pixels that changed since the last search overlap the last match.
+    Inside a freeze() block containing the region, a single attempt is made.
+
     :param Pattern pattern: Name of the searched image.
     :param timeout: Number as maximum waiting time in seconds.
     :param Region region: Region object.
@@ -191,23 +491,53 @@ def image_vanish(
     if not _is_pattern_size_correct(pattern, region):
         return None
 
+    if region is None and _is_all_displays_search():
+        region = _get_all_displays_bounds()
+
+    if is_frozen(region):
+        timeout = 0
+
     pattern_found = True
 
-    start_time = datetime.datetime.now()
-    end_time = start_time + datetime.timedelta(seconds=timeout)
+    scheduler = WaitScheduler("Image vanish: %s" % pattern.get_filename(), timeout)
+    searched_image = None
+    found_area = None
+    last_timestamp = None
 
-    while pattern_found and start_time < end_time:
-        time_remaining = end_time - start_time
+    while pattern_found and scheduler.next_attempt():
         logger.debug(
             "Image vanish: {} - {} seconds remaining".format(
-                pattern.get_filename(), time_remaining
+                pattern.get_filename(), scheduler.remaining()
             )
         )
-        image_found = match_template(pattern, region, MatchTemplateType.SINGLE)
+        try:
+            stack_image = get_region_screenshot(region, last_timestamp)
+        except ScreenshotError:
+            logger.warning("Screenshot failed.")
+            continue
+        last_timestamp = stack_image.timestamp
+
+        if searched_image is not None:
+            changed_area = _get_changed_area(searched_image, stack_image)
+            if changed_area is None or not _is_overlapping(changed_area, found_area):
+                logger.debug("Last match unchanged, skipping search.")
+                continue
+
+        image_found = match_template(
+            pattern, region, MatchTemplateType.SINGLE, stack_image
+        )
+        searched_image = stack_image
         if len(image_found) == 0:
             pattern_found = False
         else:
             pattern_found = True
-        start_time = datetime.datetime.now()
+            p_width, p_height = pattern.get_size()
+            found_area = Rectangle(
+                image_found[0].x - stack_image.region.x,
+                image_found[0].y - stack_image.region.y,
+                p_width,
+                p_height,
+            )
 
+    scheduler.finish(not pattern_found)
     return None if pattern_found else True
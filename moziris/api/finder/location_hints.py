@@ -0,0 +1,127 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import json
+import logging
+import os
+
+from moziris.api.location import Location
+from moziris.api.rectangle import Rectangle
+from moziris.api.screen.display import DisplayCollection
+from moziris.api.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+HINT_PADDING = 20
+HINTS_FILE_NAME = "location_hints.json"
+
+
+class _LocationHints:
+    """Remembers where each Pattern image was last found, for the current display geometry.
+
+    match_template first searches a small area around the last known location and falls back
+    to the whole region on a miss. The hit and miss counters show how well the hints work.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._hints = {}
+        self._loaded = False
+
+    def get_search_area(self, pattern, region: Rectangle, width: int, height: int):
+        """Returns the area around the last known location of a pattern.
+
+        :param Pattern pattern: The searched Pattern.
+        :param Rectangle region: The searched region.
+        :param width: Width of the screenshot of the region.
+        :param height: Height of the screenshot of the region.
+        :return: Rectangle relative to the region, or None if there is no usable hint.
+        """
+        hint = self._get_display_hints().get(pattern.get_file_path())
+        if hint is None:
+            return None
+
+        p_width, p_height = pattern.get_size()
+        x = max(hint[0] - region.x - HINT_PADDING, 0)
+        y = max(hint[1] - region.y - HINT_PADDING, 0)
+        x_end = min(hint[0] - region.x + p_width + HINT_PADDING, width)
+        y_end = min(hint[1] - region.y + p_height + HINT_PADDING, height)
+        if x_end - x < p_width or y_end - y < p_height:
+            return None
+        return Rectangle(x, y, x_end - x, y_end - y)
+
+    def update(self, pattern, location: Location):
+        """Stores the location where a pattern was found."""
+        self._get_display_hints()[pattern.get_file_path()] = [
+            int(location.x),
+            int(location.y),
+        ]
+
+    def record(self, hit: bool):
+        """Counts a search that used a hint."""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get_stats(self) -> dict:
+        """Returns the hit and miss counters of the hint searches."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
+
+    def save(self):
+        """Writes the hints to the working directory, so later runs can start with them."""
+        path = _get_hints_file()
+        try:
+            with open(path, "w") as f:
+                json.dump(self._hints, f)
+            logger.debug("Saved location hints to %s: %s" % (path, self.get_stats()))
+        except (IOError, OSError) as e:
+            logger.warning("Unable to save location hints: %s" % e)
+
+    def _get_display_hints(self) -> dict:
+        if not self._loaded:
+            self._loaded = True
+            if Settings.persist_location_hints:
+                self._load()
+        return self._hints.setdefault(_get_display_geometry(), {})
+
+    def _load(self):
+        path = _get_hints_file()
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r") as f:
+                self._hints = json.load(f)
+            logger.debug("Loaded location hints from %s" % path)
+        except (IOError, OSError, ValueError) as e:
+            logger.warning("Unable to load location hints: %s" % e)
+
+
+def _get_hints_file():
+    return os.path.join(Settings.work_dir, HINTS_FILE_NAME)
+
+
+def _get_display_geometry() -> str:
+    """Returns a key describing the position, size and scale of all displays."""
+    return ";".join(
+        "%s,%s,%s,%s@%s"
+        % (
+            display.bounds.x,
+            display.bounds.y,
+            display.bounds.width,
+            display.bounds.height,
+            display.scale,
+        )
+        for display in DisplayCollection
+    )
+
+
+LocationHints = _LocationHints()
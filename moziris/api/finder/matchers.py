@@ -0,0 +1,694 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Template matching backends used by match_template.
+
+A matcher is a function with the signature:
+
+    matcher(image, template, precision, match_type, max_results=None) -> (positions, scores)
+
+where positions is an (N, 2) array of (x, y) match locations relative to the image and
+scores the matching similarities. Single matches return at most one position, multiple
+matches return the non-maximum suppressed positions in order of decreasing similarity.
+
+The built-in matchers are listed in MatcherType, more can be added with register_matcher.
+"""
+
+import logging
+import weakref
+
+import cv2
+import numpy as np
+
+from moziris.api.enums import MatchTemplateType, MatcherType
+from moziris.api.screen.buffer_pool import BufferPool
+
+logger = logging.getLogger(__name__)
+
+FIND_METHOD = cv2.TM_CCOEFF_NORMED
+
+# The pattern is never downscaled below this many pixels on its shortest side.
+PYRAMID_MIN_PATTERN_SIZE = 12
+PYRAMID_MAX_LEVELS = 3
+# Downscaling blurs the pattern, so coarse candidates are accepted slightly below the precision.
+PYRAMID_COARSE_TOLERANCE = 0.15
+PYRAMID_MAX_CANDIDATES = 25
+PYRAMID_REFINE_MARGIN = 2
+
+# Number of positions checked against the suppression mask at once by _select_peaks.
+PEAKS_BATCH_SIZE = 1024
+
+# The FFT matcher is faster than matchTemplate once the pattern covers most of the image,
+# i.e. when there are few positions to correlate relative to the image size.
+FFT_MAX_RESULT_AREA_RATIO = 0.15
+FFT_MIN_IMAGE_AREA = 100000
+
+# ORB keypoints near the image border are dropped, so patterns are padded before detection.
+FEATURE_PATCH_SIZE = 15
+FEATURE_TEMPLATE_MAX_KEYPOINTS = 500
+# Number of image pixels per keypoint kept in the searched image.
+FEATURE_PIXELS_PER_KEYPOINT = 200
+FEATURE_RATIO_TEST = 0.8
+FEATURE_MIN_INLIERS = 4
+FEATURE_RANSAC_THRESHOLD = 3.0
+FEATURE_MIN_SCALE = 0.5
+FEATURE_MAX_SCALE = 3.0
+# Keypoint scale estimates are noisy, those this close to 1 are taken as the pattern size.
+FEATURE_SCALE_SNAP = 0.03
+
+
+def match_opencv(image, template, precision, match_type, max_results=None):
+    """Single pass template matching over the full resolution image.
+
+    :param image: Array of the searched image.
+    :param template: Array of the pattern, same number of channels as image.
+    :param precision: Minimum similarity of a match.
+    :param MatchTemplateType match_type: Type of match_template (single or multiple)
+    :param max_results: Maximum number of multiple matches, all of them if None.
+    :return: Pair of arrays, the (x, y) positions relative to the image and their scores.
+    """
+    res = cv2.matchTemplate(
+        image,
+        template,
+        FIND_METHOD,
+        result=BufferPool.acquire(_get_result_shape(image, template), np.float32),
+    )
+    try:
+        if match_type is MatchTemplateType.SINGLE:
+            return _get_best_match(res, precision)
+        return _select_peaks(
+            *_get_peaks(res, template, precision), template, max_results
+        )
+    finally:
+        BufferPool.release(res)
+
+
+def match_pyramid(image, template, precision, match_type, max_results=None):
+    """Coarse-to-fine template matching.
+
+    The image and the pattern are downscaled with a Gaussian pyramid and searched at the
+    lowest level. Only the areas around the coarse candidates are then matched again at
+    full resolution, so the returned positions and similarities are the same as for
+    match_opencv.
+
+    :param image: Array of the searched image.
+    :param template: Array of the pattern, same number of channels as image.
+    :param precision: Minimum similarity of a match.
+    :param MatchTemplateType match_type: Type of match_template (single or multiple)
+    :param max_results: Maximum number of multiple matches, all of them if None.
+    :return: Pair of arrays, the (x, y) positions relative to the image and their scores.
+    """
+    levels = _get_pyramid_levels(template)
+    if levels == 0:
+        logger.debug("Pattern too small for pyramid search, using a single pass.")
+        return match_opencv(image, template, precision, match_type, max_results)
+
+    coarse_image = image
+    coarse_template = template
+    for _ in range(levels):
+        coarse_image = cv2.pyrDown(coarse_image)
+        coarse_template = cv2.pyrDown(coarse_template)
+
+    coarse_res = cv2.matchTemplate(coarse_image, coarse_template, FIND_METHOD)
+    threshold = precision - PYRAMID_COARSE_TOLERANCE
+    mask = np.uint8(coarse_res >= threshold)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask)
+
+    # Label 0 is the background.
+    candidates = stats[1:]
+    if len(candidates) == 0:
+        return _no_match()
+
+    if len(candidates) > PYRAMID_MAX_CANDIDATES:
+        if match_type is MatchTemplateType.MULTIPLE:
+            logger.debug(
+                "Too many pyramid candidates (%s), using a single pass."
+                % len(candidates)
+            )
+            return match_opencv(image, template, precision, match_type, max_results)
+        peaks = [
+            coarse_res[y : y + h, x : x + w].max() for x, y, w, h, area in candidates
+        ]
+        candidates = candidates[np.argsort(peaks)[::-1][:PYRAMID_MAX_CANDIDATES]]
+
+    factor = 2 ** levels
+    pad = factor + PYRAMID_REFINE_MARGIN
+    t_height, t_width = template.shape[:2]
+    res_width = image.shape[1] - t_width + 1
+    res_height = image.shape[0] - t_height + 1
+
+    results = []
+    for x, y, w, h, area in candidates:
+        x_start = max(x * factor - pad, 0)
+        y_start = max(y * factor - pad, 0)
+        x_end = min((x + w - 1) * factor + pad, res_width - 1)
+        y_end = min((y + h - 1) * factor + pad, res_height - 1)
+        if x_start > x_end or y_start > y_end:
+            continue
+
+        window = image[y_start : y_end + t_height, x_start : x_end + t_width]
+        res = cv2.matchTemplate(window, template, FIND_METHOD)
+
+        if match_type is MatchTemplateType.SINGLE:
+            positions, scores = _get_best_match(res, -1)
+        else:
+            positions, scores = _get_peaks(res, template, precision)
+        results.append((positions + (x_start, y_start), scores))
+
+    if len(results) == 0:
+        return _no_match()
+    positions = np.concatenate([positions for positions, scores in results])
+    scores = np.concatenate([scores for positions, scores in results])
+
+    if match_type is MatchTemplateType.SINGLE:
+        best = int(np.argmax(scores))
+        logger.debug("Pyramid search best similarity %s" % scores[best])
+        if scores[best] < precision:
+            return _no_match()
+        return positions[best : best + 1], scores[best : best + 1]
+    # Refined windows can overlap, so duplicates are removed across all of them.
+    return _select_peaks(positions, scores, template, max_results)
+
+
+def match_fft(image, template, precision, match_type, max_results=None):
+    """Template matching with the normalized cross-correlation computed in the frequency domain.
+
+    The scores are equivalent to the TM_CCOEFF_NORMED method of match_opencv.
+
+    :param image: Array of the searched image.
+    :param template: Array of the pattern, same number of channels as image.
+    :param precision: Minimum similarity of a match.
+    :param MatchTemplateType match_type: Type of match_template (single or multiple)
+    :param max_results: Maximum number of multiple matches, all of them if None.
+    :return: Pair of arrays, the (x, y) positions relative to the image and their scores.
+    """
+    res = _fft_ccoeff_normed(image, template)
+    if match_type is MatchTemplateType.SINGLE:
+        return _get_best_match(res, precision)
+    return _select_peaks(*_get_peaks(res, template, precision), template, max_results)
+
+
+def match_auto(image, template, precision, match_type, max_results=None):
+    """Chooses between match_opencv and match_fft from the size of the pattern and image."""
+    if _is_fft_faster(image, template):
+        return match_fft(image, template, precision, match_type, max_results)
+    return match_opencv(image, template, precision, match_type, max_results)
+
+
+def _is_fft_faster(image, template) -> bool:
+    i_height, i_width = image.shape[:2]
+    t_height, t_width = template.shape[:2]
+    image_area = i_height * i_width
+    result_area = (i_height - t_height + 1) * (i_width - t_width + 1)
+    return (
+        image_area >= FFT_MIN_IMAGE_AREA
+        and result_area <= FFT_MAX_RESULT_AREA_RATIO * image_area
+    )
+
+
+def _fft_ccoeff_normed(image, template):
+    """Computes the same result as cv2.matchTemplate with TM_CCOEFF_NORMED, using DFTs.
+
+    The numerator is the cross-correlation of the image with the zero mean pattern, the
+    denominator combines the pattern norm with the window variances from integral images.
+    Color images are handled like OpenCV does, summing both terms over the channels.
+    """
+    i_height, i_width = image.shape[:2]
+    t_height, t_width = template.shape[:2]
+    res_height = i_height - t_height + 1
+    res_width = i_width - t_width + 1
+    dft_height = cv2.getOptimalDFTSize(i_height)
+    dft_width = cv2.getOptimalDFTSize(i_width)
+    area = t_height * t_width
+
+    if image.ndim == 3:
+        channels = zip(cv2.split(image), cv2.split(template))
+    else:
+        channels = [(image, template)]
+
+    numerator = np.zeros((res_height, res_width), np.float32)
+    window_variance = np.zeros((res_height, res_width), np.float64)
+    template_norm = 0.0
+    for image_channel, template_channel in channels:
+        zero_mean_template = np.float32(template_channel)
+        zero_mean_template -= float(zero_mean_template.mean())
+        template_norm += cv2.norm(zero_mean_template, cv2.NORM_L2SQR)
+
+        image_spectrum = cv2.dft(
+            cv2.copyMakeBorder(
+                np.float32(image_channel),
+                0,
+                dft_height - i_height,
+                0,
+                dft_width - i_width,
+                cv2.BORDER_CONSTANT,
+                value=0,
+            )
+        )
+        template_spectrum = cv2.dft(
+            cv2.copyMakeBorder(
+                zero_mean_template,
+                0,
+                dft_height - t_height,
+                0,
+                dft_width - t_width,
+                cv2.BORDER_CONSTANT,
+                value=0,
+            ),
+            nonzeroRows=t_height,
+        )
+        correlation = cv2.idft(
+            cv2.mulSpectrums(image_spectrum, template_spectrum, 0, conjB=True),
+            flags=cv2.DFT_SCALE,
+            nonzeroRows=res_height,
+        )
+        numerator += correlation[:res_height, :res_width]
+
+        sums, square_sums = cv2.integral2(
+            image_channel, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F
+        )
+        window_sum = _get_window_sums(sums, t_width, t_height)
+        window_variance += (
+            _get_window_sums(square_sums, t_width, t_height)
+            - window_sum * window_sum / area
+        )
+
+    if template_norm < np.finfo(float).eps:
+        # Same as OpenCV, a flat pattern matches everywhere.
+        return np.ones((res_height, res_width), np.float32)
+
+    denominator = np.float32(np.sqrt(np.maximum(window_variance, 0) * template_norm))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res = numerator / denominator
+
+    # Flat windows and rounding errors are clamped the way OpenCV does it.
+    abs_numerator = np.abs(numerator)
+    invalid = ~(abs_numerator < denominator)
+    if invalid.any():
+        res[invalid] = np.where(
+            abs_numerator[invalid] < denominator[invalid] * 1.125,
+            np.sign(numerator[invalid]),
+            0,
+        )
+    return res
+
+
+def _get_window_sums(integral, width, height):
+    """Returns the sum of every width x height window from an integral image."""
+    return (
+        integral[height:, width:]
+        - integral[:-height, width:]
+        - integral[height:, :-width]
+        + integral[:-height, :-width]
+    )
+
+
+def match_umat(image, template, precision, match_type, max_results=None):
+    """Single pass template matching through the OpenCV transparent API.
+
+    The images are uploaded as UMat so OpenCV can run matchTemplate on an OpenCL device,
+    such as the CPU OpenCL runtime. Without OpenCL this is the same as match_opencv.
+
+    :param image: Array of the searched image.
+    :param template: Array of the pattern, same number of channels as image.
+    :param precision: Minimum similarity of a match.
+    :param MatchTemplateType match_type: Type of match_template (single or multiple)
+    :param max_results: Maximum number of multiple matches, all of them if None.
+    :return: Pair of arrays, the (x, y) positions relative to the image and their scores.
+    """
+    res = cv2.matchTemplate(cv2.UMat(image), cv2.UMat(template), FIND_METHOD).get()
+    if match_type is MatchTemplateType.SINGLE:
+        return _get_best_match(res, precision)
+    return _select_peaks(*_get_peaks(res, template, precision), template, max_results)
+
+
+def match_numpy(image, template, precision, match_type, max_results=None):
+    """Reference template matching, with the similarity computed by NumPy alone.
+
+    The scores are computed in double precision without OpenCV, which makes this matcher
+    the reference the other ones are compared with. It is too slow for regular use.
+
+    :param image: Array of the searched image.
+    :param template: Array of the pattern, same number of channels as image.
+    :param precision: Minimum similarity of a match.
+    :param MatchTemplateType match_type: Type of match_template (single or multiple)
+    :param max_results: Maximum number of multiple matches, all of them if None.
+    :return: Pair of arrays, the (x, y) positions relative to the image and their scores.
+    """
+    res = _numpy_ccoeff_normed(image, template)
+    if match_type is MatchTemplateType.SINGLE:
+        if res.size == 0 or res.max() < precision:
+            return _no_match()
+        y, x = np.unravel_index(np.argmax(res), res.shape)
+        return np.array([[x, y]]), np.array([res[y, x]])
+    return _select_peaks(*_get_peaks(res, template, precision), template, max_results)
+
+
+def _numpy_ccoeff_normed(image, template):
+    """Normalized correlation coefficient of the pattern at every position of the image."""
+    i_height, i_width = image.shape[:2]
+    t_height, t_width = template.shape[:2]
+    res_height = i_height - t_height + 1
+    res_width = i_width - t_width + 1
+    area = t_height * t_width
+    image = image.reshape(i_height, i_width, -1).astype(np.float64)
+    template = template.reshape(t_height, t_width, -1).astype(np.float64)
+    template = template - template.mean(axis=(0, 1))
+
+    numerator = np.zeros((res_height, res_width))
+    window_variance = np.zeros((res_height, res_width))
+    for channel in range(image.shape[2]):
+        correlation = np.fft.irfft2(
+            np.fft.rfft2(image[:, :, channel])
+            * np.conj(np.fft.rfft2(template[:, :, channel], image.shape[:2])),
+            image.shape[:2],
+        )
+        numerator += correlation[:res_height, :res_width]
+
+        sums = np.pad(image[:, :, channel], ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+        square_sums = (
+            np.pad(image[:, :, channel] ** 2, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+        )
+        window_sum = _get_window_sums(sums, t_width, t_height)
+        window_variance += (
+            _get_window_sums(square_sums, t_width, t_height)
+            - window_sum * window_sum / area
+        )
+
+    denominator = np.sqrt(np.maximum(window_variance, 0) * np.sum(template ** 2))
+    res = np.zeros((res_height, res_width))
+    np.divide(numerator, denominator, out=res, where=denominator > 1e-6)
+    return np.clip(res, -1, 1)
+
+
+def match_features(image, template, precision, match_type, max_results=None):
+    """Scale tolerant matching, for patterns shown larger or smaller than their image file.
+
+    ORB keypoints of the pattern are matched with the keypoints of the image to estimate the
+    scale and location of the pattern in a single pass, e.g. under browser zoom or on a
+    display with another DPI. The pattern is then resized to that scale and the match is
+    verified with matchTemplate, so the scores compare with the other matchers. A single
+    match is also verified one pixel larger and smaller, as the estimate is noisy. If the
+    keypoints don't give a usable estimate or the match is not verified, the pattern is
+    searched at its own size.
+
+    The returned positions are those of a box of the original pattern size centered on the
+    match, so the center of the found location is the center of the scaled pattern.
+
+    :param image: Array of the searched image.
+    :param template: Array of the pattern, same number of channels as image.
+    :param precision: Minimum similarity of a match.
+    :param MatchTemplateType match_type: Type of match_template (single or multiple)
+    :param max_results: Maximum number of multiple matches, all of them if None.
+    :return: Pair of arrays, the (x, y) positions relative to the image and their scores.
+    """
+    estimate = _estimate_scale(image, template)
+    if estimate is None:
+        logger.debug("No scale estimate from keypoints, searching at the pattern size.")
+        return match_opencv(image, template, precision, match_type, max_results)
+
+    scale, x, y = estimate
+    if abs(scale - 1) <= FEATURE_SCALE_SNAP:
+        scale = 1.0
+    logger.debug("Pattern found by keypoints at scale %.3f" % scale)
+
+    scales = [scale]
+    if match_type is MatchTemplateType.SINGLE and scale != 1.0:
+        pixel = 1.0 / max(template.shape[:2])
+        scales += [scale + pixel, scale - pixel]
+    for candidate in scales:
+        positions, scores = _match_at_scale(
+            image, template, candidate, x, y, precision, match_type, max_results
+        )
+        if len(positions) > 0:
+            return positions, scores
+
+    if scale == 1.0 and match_type is not MatchTemplateType.SINGLE:
+        return positions, scores
+    logger.debug("Keypoint match not verified, searching at the pattern size.")
+    return match_opencv(image, template, precision, match_type, max_results)
+
+
+def _match_at_scale(image, template, scale, x, y, precision, match_type, max_results):
+    """Searches the pattern resized to a scale, a single match only around (x, y).
+
+    :return: Pair of arrays, the positions of boxes of the original pattern size centered
+        on the matches and their scores.
+    """
+    t_height, t_width = template.shape[:2]
+    s_width, s_height = int(round(t_width * scale)), int(round(t_height * scale))
+    if s_width > image.shape[1] or s_height > image.shape[0]:
+        return _no_match()
+    if scale == 1.0:
+        scaled_template = template
+    else:
+        scaled_template = cv2.resize(
+            template,
+            (s_width, s_height),
+            interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR,
+        )
+
+    if match_type is MatchTemplateType.SINGLE:
+        margin = max(int(FEATURE_RANSAC_THRESHOLD * scale), 2) + 1
+        x_start = min(max(int(x) - margin, 0), image.shape[1] - s_width)
+        y_start = min(max(int(y) - margin, 0), image.shape[0] - s_height)
+        window = image[
+            y_start : min(y_start + s_height + 2 * margin, image.shape[0]),
+            x_start : min(x_start + s_width + 2 * margin, image.shape[1]),
+        ]
+        positions, scores = match_opencv(window, scaled_template, precision, match_type)
+        positions = positions + (x_start, y_start)
+    else:
+        positions, scores = match_opencv(
+            image, scaled_template, precision, match_type, max_results
+        )
+
+    offset = (
+        int(round((s_width - t_width) / 2)),
+        int(round((s_height - t_height) / 2)),
+    )
+    return positions + offset, scores
+
+
+def _estimate_scale(image, template):
+    """Estimates the scale and top left corner of the pattern from matching keypoints.
+
+    :return: Tuple (scale, x, y) or None if the keypoints don't agree on a transformation.
+    """
+    template_keypoints, template_descriptors = _get_template_features(template)
+    if template_descriptors is None or len(template_keypoints) < FEATURE_MIN_INLIERS:
+        return None
+
+    max_keypoints = max(int(image.size / FEATURE_PIXELS_PER_KEYPOINT), 500)
+    image_keypoints, image_descriptors = _detect_features(image, max_keypoints)
+    if image_descriptors is None or len(image_keypoints) < FEATURE_MIN_INLIERS:
+        return None
+
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(
+        template_descriptors, image_descriptors, k=2
+    )
+    good = [
+        pair[0]
+        for pair in matches
+        if len(pair) == 2 and pair[0].distance < FEATURE_RATIO_TEST * pair[1].distance
+    ]
+    if len(good) < FEATURE_MIN_INLIERS:
+        return None
+
+    source = np.float32([template_keypoints[m.queryIdx].pt for m in good])
+    destination = np.float32([image_keypoints[m.trainIdx].pt for m in good])
+    transform, inliers = cv2.estimateAffinePartial2D(
+        source,
+        destination,
+        method=cv2.RANSAC,
+        ransacReprojThreshold=FEATURE_RANSAC_THRESHOLD,
+    )
+    if transform is None or int(inliers.sum()) < FEATURE_MIN_INLIERS:
+        return None
+
+    scale = float(np.hypot(transform[0, 0], transform[1, 0]))
+    if not FEATURE_MIN_SCALE <= scale <= FEATURE_MAX_SCALE:
+        return None
+    return scale, transform[0, 2], transform[1, 2]
+
+
+_template_features = {}
+
+
+def _get_template_features(template):
+    """Returns the keypoints of a pattern array, detected once for each array.
+
+    Patterns keep their arrays, so the keypoints of a Pattern are computed once. Entries
+    are dropped when the array is garbage collected.
+    """
+    key = id(template)
+    cached = _template_features.get(key)
+    if cached is None or cached[0]() is not template:
+        keypoints, descriptors = _detect_features(
+            template, FEATURE_TEMPLATE_MAX_KEYPOINTS, FEATURE_PATCH_SIZE + 1
+        )
+        reference = weakref.ref(template, lambda _: _template_features.pop(key, None))
+        cached = (reference, keypoints, descriptors)
+        _template_features[key] = cached
+    return cached[1], cached[2]
+
+
+def _detect_features(array, max_keypoints, border=0):
+    """Detects ORB keypoints, with coordinates relative to the unpadded array."""
+    if array.ndim == 3:
+        array = cv2.cvtColor(array, cv2.COLOR_BGR2GRAY)
+    if border > 0:
+        array = cv2.copyMakeBorder(
+            array, border, border, border, border, cv2.BORDER_REPLICATE
+        )
+    detector = cv2.ORB_create(
+        nfeatures=max_keypoints,
+        edgeThreshold=FEATURE_PATCH_SIZE,
+        patchSize=FEATURE_PATCH_SIZE,
+    )
+    keypoints, descriptors = detector.detectAndCompute(array, None)
+    if border > 0:
+        for keypoint in keypoints:
+            keypoint.pt = (keypoint.pt[0] - border, keypoint.pt[1] - border)
+    return keypoints, descriptors
+
+
+def _get_result_shape(image, template):
+    """Returns the shape of the matchTemplate result of a pattern in an image."""
+    return (
+        image.shape[0] - template.shape[0] + 1,
+        image.shape[1] - template.shape[1] + 1,
+    )
+
+
+def _no_match():
+    return np.zeros((0, 2), dtype=int), np.zeros(0)
+
+
+def _get_best_match(res, precision):
+    """Returns the position of the highest similarity in a matchTemplate result."""
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+    logger.debug("Min location %s and max location %s" % (min_val, max_val))
+    if max_val >= precision:
+        return np.array([max_loc]), np.array([max_val])
+    return _no_match()
+
+
+def _get_peaks(res, template, precision):
+    """Returns the local maxima of a matchTemplate result above the precision.
+
+    A position is kept only if it has the highest similarity within half a pattern size,
+    so a single match doesn't produce a cluster of neighbouring positions.
+    """
+    mask = res >= precision
+    if not mask.any():
+        return _no_match()
+
+    t_height, t_width = template.shape[:2]
+    kernel = np.ones((t_height // 2 * 2 + 1, t_width // 2 * 2 + 1), np.uint8)
+    local_max = cv2.dilate(res, kernel, dst=BufferPool.acquire(res.shape, res.dtype))
+    ys, xs = np.nonzero(mask & (res >= local_max))
+    BufferPool.release(local_max)
+    return np.column_stack((xs, ys)), res[ys, xs]
+
+
+def _select_peaks(positions, scores, template, max_results=None):
+    """Non-maximum suppression of match positions.
+
+    Positions are taken in order of decreasing similarity and dropped if they are closer
+    than half a pattern size to a position already taken, e.g. on plateaus of equal
+    similarity.
+
+    The area around every taken position is marked in a mask, so each position is checked
+    with a single lookup. The positions of a batch already marked are dropped at once, so
+    a large plateau doesn't need a check per position.
+
+    :return: Pair of arrays, the kept positions and their scores, best match first.
+    """
+    t_height, t_width = template.shape[:2]
+    min_dx = max(t_width // 2, 1)
+    min_dy = max(t_height // 2, 1)
+
+    order = np.argsort(-scores, kind="stable")
+    positions = positions[order]
+    scores = scores[order]
+
+    limit = len(positions) if max_results is None else min(max_results, len(positions))
+    if limit == 0:
+        return positions[:0], scores[:0]
+
+    # Mask coordinates, with room for the suppressed area around the first positions.
+    origin = positions.min(axis=0) - (min_dx - 1, min_dy - 1)
+    xs, ys = (positions - origin).T
+    suppressed = np.zeros((int(ys.max()) + min_dy, int(xs.max()) + min_dx), bool)
+
+    kept = []
+    for start in range(0, len(positions), PEAKS_BATCH_SIZE):
+        batch_xs = xs[start : start + PEAKS_BATCH_SIZE]
+        batch_ys = ys[start : start + PEAKS_BATCH_SIZE]
+        candidates = np.flatnonzero(~suppressed[batch_ys, batch_xs])
+        for index, x, y in zip(
+            (candidates + start).tolist(),
+            batch_xs[candidates].tolist(),
+            batch_ys[candidates].tolist(),
+        ):
+            if suppressed[y, x]:
+                continue
+            kept.append(index)
+            if len(kept) == limit:
+                return positions[kept], scores[kept]
+            suppressed[y - min_dy + 1 : y + min_dy, x - min_dx + 1 : x + min_dx] = True
+    return positions[kept], scores[kept]
+
+
+def _get_pyramid_levels(template) -> int:
+    """Returns how many times the pattern can be halved before it gets too small."""
+    shortest_side = min(template.shape[:2])
+    levels = 0
+    while (
+        levels < PYRAMID_MAX_LEVELS
+        and shortest_side >> (levels + 1) >= PYRAMID_MIN_PATTERN_SIZE
+    ):
+        levels += 1
+    return levels
+
+
+_MATCHERS = {
+    MatcherType.AUTO: match_auto,
+    MatcherType.OPENCV: match_opencv,
+    MatcherType.PYRAMID: match_pyramid,
+    MatcherType.FFT: match_fft,
+    MatcherType.UMAT: match_umat,
+    MatcherType.NUMPY: match_numpy,
+    MatcherType.FEATURES: match_features,
+}
+
+
+def register_matcher(name: str, matcher):
+    """Adds a matcher backend, or replaces the built-in one with the same name.
+
+    The backend can then be selected by name with Settings.matcher or Pattern.use_matcher().
+
+    :param name: Name of the backend.
+    :param matcher: Function with the matcher signature described in this module.
+    :return: The matcher function.
+    """
+    _MATCHERS[name] = matcher
+    return matcher
+
+
+def get_matcher(matcher):
+    """Returns the matching function for a MatcherType or the name of a registered backend."""
+    try:
+        return _MATCHERS[matcher]
+    except KeyError:
+        raise ValueError(
+            "Unknown matcher %s, choose from: %s"
+            % (matcher, ", ".join(get_matcher_names()))
+        )
+
+
+def get_matcher_names() -> list:
+    """Returns the names of all registered matchers."""
+    return [str(getattr(name, "value", name)) for name in _MATCHERS]
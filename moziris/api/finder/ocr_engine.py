@@ -0,0 +1,216 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import importlib.util
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytesseract
+
+from moziris.api.enums import OcrBackend
+from moziris.api.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Header line of the TSV output of Tesseract, which tesserocr leaves out.
+TSV_HEADER = (
+    "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num"
+    "\tleft\ttop\twidth\theight\tconf\ttext"
+)
+OCR_LANGUAGE = "eng"
+# OpenMP threads of each Tesseract worker, as the workers already use several cores.
+OCR_WORKER_THREAD_LIMIT = 1
+
+# tesserocr loads Tesseract and its OpenMP runtime, so it is only imported when first used.
+_tesserocr_found = importlib.util.find_spec("tesserocr") is not None
+_tesserocr = None
+_tesserocr_error = None
+
+
+class _OcrEngine:
+    """Runs Tesseract on images, through the backend selected by Settings.ocr_backend.
+
+    The tesserocr backend keeps one Tesseract instance loaded per thread and passes it the
+    pixels of the image directly. The pytesseract backend starts a tesseract process and
+    writes a temporary image file for every call. Both return the same TSV text, and
+    pytesseract is used whenever tesserocr is not installed or fails.
+
+    Several images can be recognized at once by a pool of worker processes, each keeping
+    its own Tesseract instance loaded between text searches.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.seconds = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_size = 0
+
+    def get_backend(self) -> OcrBackend:
+        """Returns the backend used for the next calls, resolving OcrBackend.AUTO."""
+        backend = Settings.ocr_backend
+        if backend == OcrBackend.AUTO:
+            if is_tesserocr_installed():
+                return OcrBackend.TESSEROCR
+            return OcrBackend.PYTESSERACT
+        return backend
+
+    def image_to_data(self, image, backend: OcrBackend = None) -> str:
+        """Recognizes the words of an image.
+
+        :param image: PIL image or numpy array, gray or RGB.
+        :param backend: Backend to use, the one selected by Settings.ocr_backend if None.
+        :return: TSV text with a header line, like pytesseract.image_to_data().
+        """
+        if backend is None:
+            backend = self.get_backend()
+        start = time.perf_counter()
+        if backend == OcrBackend.TESSEROCR:
+            try:
+                data = self._tesserocr_image_to_data(np.asarray(image))
+            except (RuntimeError, ImportError) as e:
+                logger.debug("tesserocr failed, using pytesseract: %s" % e)
+                backend = OcrBackend.PYTESSERACT
+        if backend == OcrBackend.PYTESSERACT:
+            data = pytesseract.image_to_data(image)
+        self._record(backend, time.perf_counter() - start)
+        return data
+
+    def image_to_data_all(self, images: list) -> list:
+        """Recognizes the words of several images in parallel.
+
+        The images are sent to a pool of at most Settings.ocr_workers worker processes,
+        leaving one core free for the browser under test. They are recognized one after
+        the other in this process if only one worker is allowed or the pool fails.
+
+        :param images: List of PIL images or numpy arrays.
+        :return: List of TSV texts, in the order of the images.
+        """
+        pool = self._get_pool(len(images))
+        if pool is None:
+            return [self.image_to_data(image) for image in images]
+
+        backend = self.get_backend()
+        arrays = [np.asarray(image) for image in images]
+        start = time.perf_counter()
+        try:
+            results = list(
+                pool.map(_worker_image_to_data, arrays, [backend] * len(arrays))
+            )
+        except (BrokenProcessPool, OSError) as e:
+            logger.warning("OCR worker pool failed, running OCR in process: %s" % e)
+            self.shutdown()
+            return [self.image_to_data(image) for image in images]
+        self._record("%s_workers" % backend.value, time.perf_counter() - start)
+        return results
+
+    def shutdown(self):
+        """Stops the worker processes, they are started again when needed."""
+        with self._lock:
+            pool, self._pool, self._pool_size = self._pool, None, 0
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _get_pool(self, count):
+        workers = min(Settings.ocr_workers, count, max((os.cpu_count() or 1) - 1, 1))
+        if workers <= 1:
+            return None
+        with self._lock:
+            if self._pool is None or self._pool_size != workers:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                # Tesseract reads the OpenMP thread limit when it is loaded, so the workers
+                # are new processes setting the limit before their first text search loads
+                # it, instead of forks of this process which may have already loaded it.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+                self._pool_size = workers
+            return self._pool
+
+    def get_stats(self) -> dict:
+        """Returns the number of calls and their average duration in ms, for each backend
+        and for the batches of each backend run by the worker processes.
+        """
+        return {
+            getattr(backend, "value", backend): {
+                "calls": calls,
+                "average_ms": self.seconds[backend] * 1000 / calls,
+            }
+            for backend, calls in self.calls.items()
+        }
+
+    def _tesserocr_image_to_data(self, array) -> str:
+        tesserocr = _import_tesserocr()
+        api = getattr(self._local, "api", None)
+        if api is None:
+            # Tesseract is only loaded once per thread, even if loading it fails.
+            try:
+                api = tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGE)
+            except RuntimeError as e:
+                api = str(e)
+            self._local.api = api
+        if isinstance(api, str):
+            raise RuntimeError("Unable to load Tesseract: %s" % api)
+
+        array = np.ascontiguousarray(array)
+        height, width = array.shape[:2]
+        channels = 1 if array.ndim == 2 else array.shape[2]
+        api.SetImageBytes(array.tobytes(), width, height, channels, width * channels)
+        rows = api.GetTSVText(0)
+        api.Clear()
+        return "%s\n%s" % (TSV_HEADER, rows)
+
+    def _record(self, backend, seconds):
+        with self._lock:
+            self.calls[backend] = self.calls.get(backend, 0) + 1
+            self.seconds[backend] = self.seconds.get(backend, 0.0) + seconds
+
+
+def is_tesserocr_installed() -> bool:
+    """Checks if tesserocr is installed, without importing it."""
+    return _tesserocr_found and _tesserocr_error is None
+
+
+def _import_tesserocr():
+    """Imports tesserocr once, raising ImportError if it is not installed."""
+    global _tesserocr, _tesserocr_error
+    if _tesserocr is None and _tesserocr_error is None:
+        if not _tesserocr_found:
+            raise ImportError("tesserocr is not installed.")
+        try:
+            import tesserocr
+
+            _tesserocr = tesserocr
+        except ImportError as e:
+            _tesserocr_error = str(e)
+    if _tesserocr is None:
+        raise ImportError("Unable to import tesserocr: %s" % _tesserocr_error)
+    return _tesserocr
+
+
+def _init_worker():
+    """Sets the OpenMP thread limit in the environment of a worker process.
+
+    It is read by Tesseract when the first text search of the worker loads it, and by the
+    tesseract processes started by pytesseract. The environment of Iris is left unchanged.
+    """
+    os.environ["OMP_THREAD_LIMIT"] = str(OCR_WORKER_THREAD_LIMIT)
+
+
+def _worker_image_to_data(array, backend):
+    return OcrEngine.image_to_data(array, backend)
+
+
+OcrEngine = _OcrEngine()
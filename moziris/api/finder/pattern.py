@@ -3,16 +3,21 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 
-import inspect
 import logging
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
 
+from moziris.api.enums import MatcherType
 from moziris.api.errors import APIHelperError, FindError
+from moziris.api.finder.image_index import ImageIndex
+from moziris.api.finder.matchers import get_matcher
+from moziris.api.finder.pattern_cache import PatternCache, PatternImage
+from moziris.api.finder.pattern_store import PatternStore, write_store
 from moziris.api.location import Location
-from moziris.api.os_helpers import OSHelper
 from moziris.api.settings import Settings
 
 try:
@@ -22,6 +27,9 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+PRELOAD_WORKERS = 4
+
 
 class Pattern:
     """A Pattern represents a file on disk that will be used in an on-screen find operation.
@@ -32,9 +40,10 @@ class Pattern:
     """
 
     def __init__(self, image_name: str, from_path: str = None):
-        self.caller = inspect.stack()[1][1]
+        self.caller = sys._getframe(1).f_code.co_filename
         self.temp_name = image_name
         self.similarity = Settings.min_similarity
+        self.matcher = None
         self.loaded = False
         if from_path is not None:
             self.load_pattern(path=from_path)
@@ -47,17 +56,19 @@ class Pattern:
             path = _get_image_path(self.caller, self.temp_name)
 
         name, scale = _parse_name(os.path.split(path)[1])
-        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        image = PatternCache.get(path, scale, lambda: _load_image(path, scale))
 
         self.image_name = name
         self.image_path = path
         self.scale_factor = scale
         self._target_offset = None
-        self._size = _get_pattern_size(image, scale)
-        self.rgb_array = _get_array_from_image(image)
-        self.color_image = _get_image_from_array(scale, self.rgb_array)
-        self.gray_image = _get_gray_image(self.color_image)
-        self.gray_array = _get_array_from_image(self.gray_image)
+        self._image = image
+        self._size = _get_pattern_size(image.rgb_array, scale)
+        self.rgb_array = image.rgb_array
+        self.color_array = image.color_array
+        self.color_image = None
+        self.gray_image = None
+        self.gray_array = image.gray_array
         self.loaded = True
 
     def __str__(self):
@@ -119,11 +130,15 @@ class Pattern:
     def get_color_image(self):
         """Getter for the color_image property."""
         self.load_pattern()
+        if self.color_image is None:
+            self.color_image = _get_image_from_array(1, self.color_array)
         return self.color_image
 
     def get_gray_image(self):
         """Getter for the gray_image property."""
         self.load_pattern()
+        if self.gray_image is None:
+            self.gray_image = _get_image_from_array(1, self.gray_array)
         return self.gray_image
 
     def get_gray_array(self):
@@ -146,6 +161,15 @@ class Pattern:
         self.similarity = 0.99
         return self
 
+    def use_matcher(self, matcher: MatcherType):
+        """Set the matching engine used when the given Pattern object is searched, instead of Settings.matcher."""
+        get_matcher(matcher)
+        try:
+            self.matcher = MatcherType(matcher)
+        except ValueError:
+            self.matcher = matcher
+        return self
+
     def get_size(self):
         """Getter for the _size property."""
         self.load_pattern()
@@ -154,7 +178,90 @@ class Pattern:
     def get_color_array(self):
         """Encode color image to BGR2RGB """
         self.load_pattern()
-        return cv2.cvtColor(np.array(self.color_image), cv2.COLOR_BGR2RGB)
+        return self._image.get_rgb_color_array()
+
+
+def preload_patterns(module_directories: list) -> list:
+    """Loads the images of test modules into the PatternCache on background threads.
+
+    Images are loaded in the order of the test modules, so the first tests are the first to
+    find their images decoded. A Pattern created before the preloading reached its image
+    decodes it as usual and doesn't wait for the preloading threads.
+
+    :param module_directories: Directories of the test modules to run.
+    :return: List of futures of the loading tasks, they can be cancelled at the end of the run.
+    """
+    paths = []
+    for directory in module_directories:
+        for path in ImageIndex.get_images(directory):
+            if path.lower().endswith(IMAGE_EXTENSIONS) and path not in paths:
+                paths.append(path)
+
+    executor = ThreadPoolExecutor(
+        max_workers=PRELOAD_WORKERS, thread_name_prefix="pattern_preload"
+    )
+    futures = [executor.submit(_preload_image, path) for path in paths]
+    executor.shutdown(wait=False)
+    logger.debug("Preloading %s pattern images." % len(paths))
+    return futures
+
+
+def _preload_image(path: str):
+    if PatternCache.is_full():
+        return
+    scale = _parse_name(os.path.split(path)[1])[1]
+    try:
+        PatternCache.get(path, scale, lambda: _load_image(path, scale))
+    except Exception as e:
+        logger.debug("Unable to preload %s: %s" % (path, e))
+
+
+def compile_patterns(target: str, directory: str) -> int:
+    """Decodes all images of a target into its pattern store.
+
+    :param target: Name of the target.
+    :param directory: Directory of the target tests, searched for 'images' directories.
+    :return: Number of images in the store.
+    """
+    entries = {}
+    for dir_path, sub_dirs, all_files in os.walk(directory):
+        if "images" not in os.path.relpath(dir_path, directory).split(os.sep):
+            continue
+        for file_name in all_files:
+            if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(dir_path, file_name)
+            scale = _parse_name(file_name)[1]
+            rgb_array, color_array, gray_array = _decode_image(path, scale)
+            if rgb_array is None:
+                logger.warning("Unable to decode image %s" % path)
+                continue
+            entries[path] = (
+                os.stat(path).st_mtime_ns,
+                scale,
+                {"rgb": rgb_array, "color": color_array, "gray": gray_array},
+            )
+    write_store(target, entries)
+    return len(entries)
+
+
+def _load_image(path: str, scale: float) -> PatternImage:
+    """Reads an image from the pattern store, or from its file if it isn't stored."""
+    stored = PatternStore.get(path)
+    if stored is not None:
+        return PatternImage(stored["rgb"], stored["color"], stored["gray"])
+    return PatternImage(*_decode_image(path, scale))
+
+
+def _decode_image(path: str, scale: float):
+    """Reads an image file.
+
+    :return: Tuple of the image array, the color array scaled to the display resolution
+    and the gray array of the scaled image.
+    """
+    rgb_array = _get_array_from_image(cv2.imread(path, cv2.IMREAD_COLOR))
+    color_array = _get_array_from_image(_get_image_from_array(scale, rgb_array))
+    return rgb_array, color_array, _get_gray_array(color_array)
 
 
 def _parse_name(full_name: str) -> (str, int):
@@ -220,11 +327,11 @@ def _get_image_from_array(scale: int, array) -> Image:
     return Image.fromarray(_apply_scale(scale, array))
 
 
-def _get_gray_image(colored_image: Image) -> Image:
-    """Converts colored image to gray image."""
-    if colored_image is None:
+def _get_gray_array(color_array):
+    """Converts a BGR array to gray, with the same channel weights as the screenshots."""
+    if color_array is None:
         return None
-    return colored_image.convert("L")
+    return cv2.cvtColor(color_array, cv2.COLOR_BGR2GRAY)
 
 
 def _get_image_path(caller, image: str) -> str:
@@ -241,52 +348,17 @@ def _get_image_path(caller, image: str) -> str:
     - current platform root
     - common root
 
-    Each directory is scanned for four possible file names, depending on resolution.
+    Each directory is scanned for two possible file names, depending on resolution.
+    The directories are listed once by ImageIndex, so this doesn't probe the file system.
     If we find nothing, we will raise an exception.
     """
 
     module = os.path.split(caller)[1]
     module_directory = os.path.split(caller)[0]
-    file_name = image.split(".")[0]
-    names = [image, "%s@2x.png" % file_name]
-
-    if OSHelper.get_os_version() == "win7":
-        os_version = "win7"
-    else:
-        os_version = OSHelper.get_os().value
-    paths = []
-
-    current_locale = Settings.locale
-    platform_directory = os.path.join(module_directory, "images", os_version)
-
-    if current_locale != "":
-        platform_locale_directory = os.path.join(platform_directory, current_locale)
-        for name in names:
-            paths.append(os.path.join(platform_locale_directory, name))
-
-    common_directory = os.path.join(module_directory, "images", "common")
-
-    if current_locale != "":
-        common_locale_directory = os.path.join(common_directory, current_locale)
-        for name in names:
-            paths.append(os.path.join(common_locale_directory, name))
-
-    for name in names:
-        paths.append(os.path.join(platform_directory, name))
-
-    for name in names:
-        paths.append(os.path.join(common_directory, name))
-
-    found = False
-    image_path = None
-    for path in paths:
-        if os.path.exists(path):
-            found = True
-            image_path = path
-            break
+    image_path = ImageIndex.find(module_directory, image)
 
     logger.debug("Module %s requests image %s" % (module, image))
-    if found:
+    if image_path is not None:
         logger.debug("Found %s" % image_path)
         return image_path
     else:
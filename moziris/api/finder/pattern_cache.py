@@ -0,0 +1,124 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import logging
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from moziris.api.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class PatternImage:
+    """Decoded pixels of a pattern image, shared by all Pattern objects of that image.
+
+    The arrays are read only, since every Pattern of the same image gets the same objects.
+    """
+
+    def __init__(self, rgb_array, color_array, gray_array):
+        self.rgb_array = _freeze(rgb_array)
+        self.color_array = _freeze(color_array)
+        self.gray_array = _freeze(gray_array)
+        self._rgb_color_array = None
+        self.nbytes = sum(
+            array.nbytes
+            for array in (rgb_array, color_array, gray_array)
+            if array is not None
+        )
+
+    def get_rgb_color_array(self):
+        """Returns the scaled color array converted from BGR to RGB, converted once."""
+        if self._rgb_color_array is None and self.color_array is not None:
+            self._rgb_color_array = _freeze(
+                cv2.cvtColor(self.color_array, cv2.COLOR_BGR2RGB)
+            )
+        return self._rgb_color_array
+
+
+class _PatternCache:
+    """Process wide LRU cache of PatternImage objects, keyed by image path and scale.
+
+    The cache holds at most Settings.pattern_cache_size megabytes of pixels, the least
+    recently used images are dropped first. Images are decoded outside of the lock, so
+    several threads can load different images at the same time.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, scale: float, load):
+        """Returns the PatternImage of an image file.
+
+        :param path: Path of the image file.
+        :param scale: Scale factor of the image.
+        :param load: Function creating the PatternImage on a cache miss.
+        :return: PatternImage object.
+        """
+        key = (path, scale)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        image = load()
+        with self._lock:
+            if key in self._images:
+                return self._images[key]
+            self._images[key] = image
+            self.nbytes += image.nbytes
+            self._evict()
+        return image
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._images
+
+    def is_full(self) -> bool:
+        """Returns True if adding an image to the cache would evict another one."""
+        return self.nbytes >= Settings.pattern_cache_size * 1024 * 1024
+
+    def clear(self):
+        """Removes all images from the cache."""
+        with self._lock:
+            self._images.clear()
+            self.nbytes = 0
+
+    def get_stats(self) -> dict:
+        """Returns the hit, miss and eviction counters and the size of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "images": len(self._images),
+            "bytes": self.nbytes,
+        }
+
+    def _evict(self):
+        max_bytes = Settings.pattern_cache_size * 1024 * 1024
+        while self.nbytes > max_bytes and len(self._images) > 1:
+            key, image = self._images.popitem(last=False)
+            self.nbytes -= image.nbytes
+            self.evictions += 1
+            logger.debug("Evicted %s from the pattern cache." % key[0])
+
+
+def _freeze(array):
+    if array is not None:
+        array.flags.writeable = False
+    return array
+
+
+PatternCache = _PatternCache()
@@ -0,0 +1,176 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from moziris.api.settings import Settings
+from moziris.util.arg_parser import get_core_args
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR_NAME = "pattern_store"
+# Arrays start on cache line boundaries inside the store.
+STORE_ALIGNMENT = 64
+
+
+class _PatternStore:
+    """Read access to the compiled pattern store of the current target.
+
+    The store is made of two files in the working directory: a single memory-mapped array
+    holding the decoded pixels of every pattern image of the target, and a JSON index with
+    the name of that data file and the offset and shape of each array, keyed by image path.
+    Arrays returned by the store are read only views of the mapped file, so loading a
+    Pattern copies nothing.
+
+    Entries are only used while the modification time of the image matches the one recorded
+    at compile time, otherwise Pattern decodes the image file as usual.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._data = None
+        self._lock = threading.Lock()
+
+    def get(self, path: str):
+        """Returns the stored arrays of an image.
+
+        :param path: Path of the image file.
+        :return: Dict with the scale factor and the 'rgb', 'color' and 'gray' arrays, or None
+        if the image is not in the store or changed since the store was compiled.
+        """
+        index = self._get_index()
+        entry = index.get(os.path.abspath(path))
+        if entry is None:
+            return None
+
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        if modified != entry["mtime"]:
+            self.misses += 1
+            logger.debug(
+                "Image %s changed since the pattern store was compiled." % path
+            )
+            return None
+
+        self.hits += 1
+        result = {"scale": entry["scale"]}
+        for name, (offset, shape) in entry["arrays"].items():
+            size = int(np.prod(shape))
+            result[name] = np.asarray(self._data[offset : offset + size]).reshape(shape)
+        return result
+
+    def _get_index(self) -> dict:
+        with self._lock:
+            if self._index is None:
+                self._index = {}
+                self._open(get_core_args().target)
+            return self._index
+
+    def _open(self, target):
+        if target is None:
+            return
+        index_path = get_index_path(target)
+        if not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, "r") as f:
+                store = json.load(f)
+            data_path = os.path.join(os.path.dirname(index_path), store["data"])
+            self._data = np.load(data_path, mmap_mode="r")
+            self._index = store["images"]
+            logger.debug(
+                "Opened pattern store %s with %s images."
+                % (data_path, len(self._index))
+            )
+        except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Unable to open pattern store: %s" % e)
+
+
+def get_index_path(target: str) -> str:
+    """Returns the path of the index file of the pattern store of a target."""
+    return os.path.join(Settings.work_dir, STORE_DIR_NAME, "%s.json" % target)
+
+
+def _get_data_files(directory: str, target: str) -> list:
+    """Returns the names of the data files written for a target, oldest first."""
+    versions = []
+    for name in os.listdir(directory):
+        version = name[len(target) + 1 : -len(".npy")]
+        if (
+            name.startswith(target + ".")
+            and name.endswith(".npy")
+            and version.isdigit()
+        ):
+            versions.append((int(version), name))
+    return [name for version, name in sorted(versions)]
+
+
+def write_store(target: str, entries: dict):
+    """Writes a pattern store, replacing the previous one of the target.
+
+    The pixels are written to a new data file and the index is then replaced to point to it.
+    The previous data file may still be mapped by a running process, and a mapped file
+    can't be replaced or removed on Windows, so it is removed only if possible. The data
+    files left over are removed by the next compilation.
+
+    :param target: Name of the target.
+    :param entries: Dict of image path to a tuple (mtime, scale, arrays), where arrays is a
+    dict of array name to uint8 array.
+    """
+    index_path = get_index_path(target)
+    directory = os.path.dirname(index_path)
+    os.makedirs(directory, exist_ok=True)
+    data_name = "%s.%s.npy" % (target, time.time_ns())
+    data_path = os.path.join(directory, data_name)
+
+    index = {}
+    offset = 0
+    for path, (modified, scale, arrays) in entries.items():
+        layout = {}
+        for name, array in arrays.items():
+            layout[name] = (offset, list(array.shape))
+            offset += -(-array.size // STORE_ALIGNMENT) * STORE_ALIGNMENT
+        index[os.path.abspath(path)] = {
+            "mtime": modified,
+            "scale": scale,
+            "arrays": layout,
+        }
+
+    data = np.lib.format.open_memmap(
+        data_path, mode="w+", dtype=np.uint8, shape=(max(offset, 1),)
+    )
+    for path, (modified, scale, arrays) in entries.items():
+        layout = index[os.path.abspath(path)]["arrays"]
+        for name, array in arrays.items():
+            start = layout[name][0]
+            data[start : start + array.size] = np.ascontiguousarray(array).ravel()
+    data.flush()
+    del data
+
+    temp_index_path = index_path + ".tmp"
+    with open(temp_index_path, "w") as f:
+        json.dump({"data": data_name, "images": index}, f)
+    os.replace(temp_index_path, index_path)
+    logger.debug("Wrote pattern store %s with %s images." % (data_path, len(index)))
+
+    for name in _get_data_files(directory, target):
+        if name != data_name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                logger.debug("Unable to remove old pattern store %s: %s" % (name, e))
+
+
+PatternStore = _PatternStore()
@@ -3,20 +3,30 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 
-import difflib
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 
-import pytesseract
+import numpy as np
 from PIL import ImageEnhance
 
+from moziris.api.finder.fuzzy_match import TokenArray, get_close_matches
+from moziris.api.finder.image_search import get_region_screenshot
+from moziris.api.finder.ocr_engine import OcrEngine
 from moziris.api.rectangle import Rectangle
 from moziris.api.save_debug_image.save_image import save_debug_ocr_image
 from moziris.api.screen.display import DisplayCollection
 from moziris.api.screen.screenshot_image import ScreenshotImage
+from moziris.api.settings import Settings
 
 TRY_RESIZE_IMAGES = 2
 OCR_RESULT_COLUMNS_COUNT = 12
 WORD_PROXIMITY = 5
+# Distance in pixels between the tops of two words on the same line.
+LINE_TOLERANCE = 5
+# Space in pixels allowed between the end of a word and the start of the next one.
+NEXT_WORD_GAP = 10
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +38,73 @@ cutoffs = {
 digit_chars = [".", "%", ","]
 
 
+class _OcrCache:
+    """LRU cache of the OCR words of screenshots, keyed by a hash of their gray pixels.
+
+    A text search on a screen identical to the one of a previous search, e.g. exists()
+    followed by click() on the same text, reuses its word boxes instead of running OCR
+    again. The cache holds at most Settings.ocr_cache_size screenshots.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, gray_array, load):
+        """Returns the OCR words of a screenshot.
+
+        :param gray_array: Gray pixels of the screenshot.
+        :param load: Function running OCR on a cache miss.
+        :return: _WordTable of the screenshot, which must not be changed.
+        """
+        if Settings.ocr_cache_size <= 0:
+            return load()
+
+        key = (OcrEngine.get_backend(), _hash_pixels(gray_array))
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = load()
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > Settings.ocr_cache_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return data
+
+    def clear(self):
+        """Removes all screenshots from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """Returns the hit, miss and eviction counters and the size of the cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+
+def _hash_pixels(array) -> bytes:
+    """Returns a digest of the shape and the pixels of an array."""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(str(array.shape).encode(), digest_size=16)
+    digest.update(array.data)
+    return digest.digest()
+
+
 def _is_similar_result(result_list, x: int, y: int, pixels: int):
     """Checks if current result is similar to previous results based on pixel proximity."""
     if len(result_list) == 0:
@@ -41,13 +118,6 @@ def _is_similar_result(result_list, x: int, y: int, pixels: int):
     return False
 
 
-def _is_next_word(prev_word, x, y):
-    """Checks if previous - current word are located correctly."""
-    if (prev_word.x + prev_word.width + 10 >= x) and (y - 5 <= prev_word.y <= y + 5):
-        return True
-    return False
-
-
 def _replace_multiple(main_string, replace_string, replace_with_string):
     """Replace a string with a list of substrings."""
     for elem in replace_string:
@@ -81,54 +151,139 @@ def _assemble_results(result_list):
     return Rectangle(x, y, width, height)
 
 
+class _WordTable:
+    """Words recognized by OCR in the processed images of a screenshot, parsed once.
+
+    Each word has its text, its Rectangle in screenshot coordinates, its confidence and the
+    block, paragraph and line numbers given by Tesseract for its image. Words are kept in
+    the order of the OCR data and indexed by the top of their Rectangle, so the words which
+    can follow another word are found with a binary search instead of a scan of all words.
+    """
+
+    def __init__(self, data_list):
+        self.texts = []
+        self.rectangles = []
+        self.lines = []
+        self.confidences = []
+        for data in data_list:
+            try:
+                rectangle = _create_rectangle_from_ocr_data(data, data[12])
+                line = (int(data[2]), int(data[3]), int(data[4]))
+                confidence = float(data[10])
+            except ValueError:
+                continue
+            self.texts.append(data[11])
+            self.rectangles.append(rectangle)
+            self.lines.append(line)
+            self.confidences.append(confidence)
+
+        self.tokens = TokenArray(self.texts)
+        self._lefts = np.array([r.x for r in self.rectangles], dtype=np.int64)
+        tops = np.array([r.y for r in self.rectangles], dtype=np.int64)
+        self._by_top = np.argsort(tops, kind="stable")
+        self._sorted_tops = tops[self._by_top]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def get_next_words(self, previous: Rectangle) -> list:
+        """Returns the words which can follow a word, nearest to its end first.
+
+        A word can follow when its top is at most LINE_TOLERANCE pixels away from the top
+        of the previous word, and it starts at most NEXT_WORD_GAP pixels after its end.
+
+        :param previous: Rectangle of the previous word.
+        :return: List of word indices.
+        """
+        start = np.searchsorted(self._sorted_tops, previous.y - LINE_TOLERANCE, "left")
+        end = np.searchsorted(self._sorted_tops, previous.y + LINE_TOLERANCE, "right")
+        indices = self._by_top[start:end]
+        end_x = previous.x + previous.width
+        indices = indices[self._lefts[indices] <= end_x + NEXT_WORD_GAP]
+        distances = np.abs(self._lefts[indices] - end_x)
+        return indices[np.argsort(distances, kind="stable")].tolist()
+
+
 def _get_processed_data(image_list):
-    """Get all OCR data from images."""
-    data = []
-    for index_image, stack_image in enumerate(image_list):
-        for index_scale, scale in enumerate(range(1, TRY_RESIZE_IMAGES + 1)):
-            stack_image = stack_image.resize(
-                [stack_image.width * scale, stack_image.height * scale]
+    """Get all OCR data from images, each image being processed at every scale in parallel."""
+    variants = []
+    for stack_image in image_list:
+        for scale in range(1, TRY_RESIZE_IMAGES + 1):
+            variants.append(
+                (
+                    scale,
+                    stack_image.resize(
+                        [stack_image.width * scale, stack_image.height * scale]
+                    ),
+                )
             )
-            processed_data = pytesseract.image_to_data(stack_image)
-            for index_data, line in enumerate(processed_data.split("\n")[1:]):
-                d = line.split()
-                if len(d) == OCR_RESULT_COLUMNS_COUNT:
-                    d.append(scale)
-                    data.append(d)
+
+    data = []
+    all_processed_data = OcrEngine.image_to_data_all([image for _, image in variants])
+    for (scale, _), processed_data in zip(variants, all_processed_data):
+        for line in processed_data.split("\n")[1:]:
+            d = line.split()
+            if len(d) == OCR_RESULT_COLUMNS_COUNT:
+                d.append(scale)
+                data.append(tuple(d))
     return data
 
 
-def _get_first_word(word, data_list):
-    """Finds all occurrences of the first searched word."""
-    words_found = []
-    cutoff_type = (
+def _get_cutoff_steps(word):
+    """Returns the cutoffs from max_cutoff down to min_cutoff for a searched word."""
+    table = cutoffs[
         "digit" if _replace_multiple(word, digit_chars, "").isdigit() else "string"
-    )
-    for data in data_list:
-        cutoff = cutoffs[cutoff_type]["max_cutoff"]
-        while cutoff >= cutoffs[cutoff_type]["min_cutoff"]:
-            if difflib.get_close_matches(word, [data[11]], cutoff=cutoff):
-                try:
-                    vd = _create_rectangle_from_ocr_data(data, data[12])
-                    if not _is_similar_result(words_found, vd.x, vd.y, WORD_PROXIMITY):
-                        words_found.append(vd)
-                except ValueError:
-                    continue
-            cutoff -= cutoffs[cutoff_type]["step"]
+    ]
+    steps = [table["max_cutoff"]]
+    while steps[-1] - table["step"] >= table["min_cutoff"]:
+        steps.append(steps[-1] - table["step"])
+    return steps
+
+
+def _get_cutoff(word):
+    """Returns the minimum similarity of an OCR word to a searched word.
+
+    A word matches if it is similar at any of its cutoff steps, i.e. at the last one. With
+    floating point steps, that is just above 0.7 for words and just below 0.8 for numbers.
+    """
+    return _get_cutoff_steps(word)[-1]
+
+
+def _get_first_word(word, word_table):
+    """Finds all occurrences of the first searched word, the most similar first."""
+    words_found = []
+    for index in get_close_matches(word, word_table.tokens, _get_cutoff(word)):
+        rectangle = word_table.rectangles[index]
+        if not _is_similar_result(
+            words_found, rectangle.x, rectangle.y, WORD_PROXIMITY
+        ):
+            # Copied as results are moved to the region, the table may be cached.
+            words_found.append(
+                Rectangle(rectangle.x, rectangle.y, rectangle.width, rectangle.height)
+            )
     return words_found
 
 
-def _text_search(text, region: Rectangle = None, multiple_search=False):
+def _text_search(
+    text,
+    region: Rectangle = None,
+    multiple_search=False,
+    stack_image: ScreenshotImage = None,
+):
     """Search text in region or screen."""
     if region is None:
         region = DisplayCollection[0].bounds
 
     logger.debug("Text find: '{}'".format(text))
-    img = ScreenshotImage(region=region)
-    raw_gray_image = img.get_gray_image()
-    enhanced_image = ImageEnhance.Contrast(img.get_gray_image()).enhance(10.0)
-    data_list = _get_processed_data([raw_gray_image, enhanced_image])
-    first_word_occurrences = _get_first_word(text.split()[0], data_list)
+    img = stack_image if stack_image is not None else get_region_screenshot(region)
+
+    def load():
+        raw_gray_image = img.get_gray_image()
+        enhanced_image = ImageEnhance.Contrast(img.get_gray_image()).enhance(10.0)
+        return _WordTable(_get_processed_data([raw_gray_image, enhanced_image]))
+
+    word_table = OcrCache.get(img.get_gray_array(), load)
+    first_word_occurrences = _get_first_word(text.split()[0], word_table)
     word_count = len(text.split())
 
     if not multiple_search:
@@ -153,32 +308,23 @@ def _text_search(text, region: Rectangle = None, multiple_search=False):
         sentence.append([data])
 
     for index, word in enumerate(first_word):
-        for index_word, word_to_search in enumerate(text.split()[1:]):
-            found = False
-            cutoff_type = (
-                "digit"
-                if _replace_multiple(word_to_search, digit_chars, "").isdigit()
-                else "string"
+        for word_to_search in text.split()[1:]:
+            next_words = word_table.get_next_words(sentence[index][-1])
+            matches = set(
+                get_close_matches(
+                    word_to_search,
+                    word_table.tokens,
+                    _get_cutoff(word_to_search),
+                    next_words,
+                )
             )
-            for d in data_list:
-                if not found:
-                    cutoff = cutoffs[cutoff_type]["max_cutoff"]
-                    while cutoff >= cutoffs[cutoff_type]["min_cutoff"]:
-                        if difflib.get_close_matches(
-                            word_to_search, [d[11]], cutoff=cutoff
-                        ):
-                            try:
-                                vd = _create_rectangle_from_ocr_data(d, d[12])
-                                if _is_next_word(
-                                    sentence[index][-1], vd.x, vd.y
-                                ) and not _is_similar_result(
-                                    sentence[index], vd.x, vd.y, WORD_PROXIMITY
-                                ):
-                                    sentence[index].append(vd)
-                                    found = True
-                            except ValueError:
-                                continue
-                        cutoff -= cutoffs[cutoff_type]["step"]
+            for next_index in next_words:
+                vd = word_table.rectangles[next_index]
+                if next_index in matches and not _is_similar_result(
+                    sentence[index], vd.x, vd.y, WORD_PROXIMITY
+                ):
+                    sentence[index].append(vd)
+                    break
     final_result = []
     for words in sentence:
         if len(words) == word_count:
@@ -193,9 +339,12 @@ def _text_search(text, region: Rectangle = None, multiple_search=False):
     return final_result
 
 
-def text_find(text, region):
-    return _text_search(text, region, False)
+def text_find(text, region, stack_image=None):
+    return _text_search(text, region, False, stack_image)
 
 
 def text_find_all(text, region):
     return _text_search(text, region, True)
+
+
+OcrCache = _OcrCache()
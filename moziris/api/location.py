@@ -3,6 +3,9 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 
+import numpy as np
+
+
 class Location:
     """Class handle single points on the screen directly by its position (x, y). It is mainly used in the actions on a
     region, to directly denote the click point. It contains methods, to move a point around on the screen."""
@@ -61,3 +64,62 @@ class Location:
         """
         self.x += away_x
         return self
+
+
+class LocationCollection:
+    """Sequence of Locations backed by a compact array of positions and their similarity scores.
+
+    It is returned by find operations, which can produce many matches. Location objects are
+    only created when an item is accessed, so changing one does not change the collection.
+    """
+
+    def __init__(self, positions=None, scores=None):
+        if positions is None:
+            positions = np.zeros((0, 2), dtype=int)
+        self._positions = np.asarray(positions).reshape(-1, 2)
+        if scores is None:
+            scores = np.ones(len(self._positions))
+        self._scores = np.asarray(scores, dtype=float).reshape(-1)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LocationCollection(self._positions[index], self._scores[index])
+        x, y = self._positions[index].tolist()
+        return Location(x, y)
+
+    def __iter__(self):
+        for x, y in self._positions.tolist():
+            yield Location(x, y)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+    @property
+    def positions(self):
+        """Array of (x, y) positions, one row per Location."""
+        return self._positions
+
+    @property
+    def scores(self):
+        """Array of similarity scores, in the same order as the positions."""
+        return self._scores
+
+    def offset(self, away_x: int, away_y: int):
+        """Return a new collection with every location moved away_x and away_y pixels.
+
+        :param away_x: Offset added to each location x parameter.
+        :param away_y: Offset added to each location y parameter.
+        :return: LocationCollection object.
+        """
+        return LocationCollection(self._positions + (away_x, away_y), self._scores)
+
+    def sort_by_position(self):
+        """Return a new collection with the locations from top to bottom and left to right.
+
+        :return: LocationCollection object.
+        """
+        order = np.lexsort((self._positions[:, 0], self._positions[:, 1]))
+        return LocationCollection(self._positions[order], self._scores[order])
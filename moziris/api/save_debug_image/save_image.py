@@ -52,17 +52,17 @@ def save_debug_image(needle, haystack, locations):
     not_found_txt = " <<< Pattern not found!"
 
     if len(locations) > 0:
+        # Draw on a copy, the haystack arrays may be shared with a frozen screenshot.
+        debug_array = haystack.get_gray_array().copy()
         for loc in locations:
             cv2.rectangle(
-                haystack.get_gray_array(),
+                debug_array,
                 (loc.x, loc.y),
                 (loc.x + w, loc.y + h),
                 (0, 0, 255),
                 2,
             )
-        cv2.imwrite(
-            file_name, haystack.get_gray_array(), [int(cv2.IMWRITE_JPEG_QUALITY), 50]
-        )
+        cv2.imwrite(file_name, debug_array, [int(cv2.IMWRITE_JPEG_QUALITY), 50])
     else:
         gray_img = haystack.get_gray_image()
         search_for_image = needle.get_color_image()
@@ -125,17 +125,16 @@ def save_debug_ocr_image(text, haystack, text_occurrences):
     not_found_txt = " '{}' not found!".format(text)
 
     if text_occurrences and len(text_occurrences) > 0:
+        debug_array = haystack.get_gray_array().copy()
         for occurrence in text_occurrences:
             cv2.rectangle(
-                haystack.get_gray_array(),
+                debug_array,
                 (occurrence.x, occurrence.y),
                 (occurrence.x + occurrence.width, occurrence.y + occurrence.height),
                 (0, 0, 255),
                 2,
             )
-        cv2.imwrite(
-            file_name, haystack.get_gray_array(), [int(cv2.IMWRITE_JPEG_QUALITY), 50]
-        )
+        cv2.imwrite(file_name, debug_array, [int(cv2.IMWRITE_JPEG_QUALITY), 50])
     else:
         gray_img = haystack.get_gray_image()
         v_align_pos = int(gray_img.size[1] / 2 - 20 / 2)
@@ -0,0 +1,96 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import logging
+import sys
+import threading
+import weakref
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of free buffers kept for each shape and type.
+POOL_MAX_FREE_BUFFERS = 4
+
+
+class _BufferPool:
+    """Pool of preallocated arrays for screenshots and the arrays computed from them.
+
+    Polling a region converts every new screenshot into arrays of the same shapes, so the
+    arrays of dropped screenshots are given back to the pool and reused as the dst argument
+    of the OpenCV conversions of the next ones, instead of allocating new ones each time.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self.peak_bytes = 0
+        self._free = {}
+        # Reentrant, as the finalizer of a collected buffer can run while the lock is held.
+        self._lock = threading.RLock()
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Returns an array with undefined content, from the pool if one is free.
+
+        :param shape: Shape of the array.
+        :param dtype: Data type of the array.
+        :return: numpy array.
+        """
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self.hits += 1
+                return free.pop()
+            self.misses += 1
+
+        array = np.empty(key[0], key[1])
+        with self._lock:
+            self.bytes += array.nbytes
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+        weakref.finalize(array, self._forget, array.nbytes)
+        return array
+
+    def release(self, array):
+        """Gives an array back to the pool, the caller must not use it afterwards."""
+        if array is None:
+            return
+        key = (array.shape, array.dtype)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) < POOL_MAX_FREE_BUFFERS:
+                free.append(array)
+
+    def release_unused(self, arrays: list):
+        """Gives back the arrays of a list that are not referenced anywhere else.
+
+        Arrays still used elsewhere, e.g. returned by a getter and kept by the caller, are
+        left to the garbage collector. The list is emptied.
+        """
+        while len(arrays) > 0:
+            array = arrays.pop()
+            # One reference for the local variable and one for the getrefcount argument.
+            if sys.getrefcount(array) <= 2:
+                self.release(array)
+
+    def get_stats(self) -> dict:
+        """Returns the hit rate and the current and peak size of the pool buffers."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "bytes": self.bytes,
+            "peak_bytes": self.peak_bytes,
+        }
+
+    def _forget(self, nbytes):
+        with self._lock:
+            self.bytes -= nbytes
+
+
+BufferPool = _BufferPool()
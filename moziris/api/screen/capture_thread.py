@@ -0,0 +1,163 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import logging
+import threading
+import time
+from collections import deque
+
+from moziris.api.errors import ScreenshotError
+from moziris.api.screen.display import DisplayCollection
+from moziris.api.screen.screenshot_image import ScreenshotImage
+from moziris.api.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Number of capture intervals a consumer waits for a new frame before grabbing the screen itself.
+FRAME_WAIT_INTERVALS = 2
+
+
+class _CaptureThread:
+    """Background thread grabbing every display at Settings.capture_fps frames per second.
+
+    The frames of each display are kept in a ring buffer of Settings.capture_buffer_size
+    ScreenshotImage objects, the oldest frame being dropped when a new one is added. Each
+    frame has the monotonic time its grab started as its timestamp.
+
+    Waiting operations take the newest frame instead of grabbing the screen, so capturing
+    the next frame overlaps with matching the current one. A consumer only takes frames
+    grabbed after a given time, e.g. the start of the wait, so it never searches a frame
+    older than its own actions. Recorders can read all buffered frames with get_frames().
+    """
+
+    def __init__(self):
+        self.fps = 0
+        self.captured = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._condition = threading.Condition()
+
+    def start(self, fps: float = None, buffer_size: int = None):
+        """Starts capturing, or restarts with the new rate and buffer size if already running.
+
+        :param fps: Frames captured per second, Settings.capture_fps if None.
+        :param buffer_size: Frames kept for each display, Settings.capture_buffer_size if None.
+        """
+        if fps is None:
+            fps = Settings.capture_fps
+        if buffer_size is None:
+            buffer_size = Settings.capture_buffer_size
+        if fps <= 0:
+            raise ValueError("Capture rate must be positive, got %s." % fps)
+
+        self.stop()
+        self.fps = fps
+        with self._condition:
+            self._frames = {
+                index: deque(maxlen=max(buffer_size, 1))
+                for index in range(len(DisplayCollection))
+            }
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="Iris capture", daemon=True
+        )
+        self._thread.start()
+        logger.debug("Capturing %s displays at %s FPS." % (len(self._frames), fps))
+
+    def stop(self):
+        """Stops capturing and drops the buffered frames."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        with self._condition:
+            self._frames = {}
+            self._condition.notify_all()
+
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def get_frame(self, screen_id: int, after: float):
+        """Returns the newest frame of a display grabbed after a given time.
+
+        Waits up to two capture intervals for such a frame.
+
+        :param screen_id: Index of the display.
+        :param after: Monotonic time the frame must be grabbed after.
+        :return: ScreenshotImage of the whole display, or None if no frame is available.
+        """
+        if not self.is_running():
+            return None
+        deadline = time.monotonic() + FRAME_WAIT_INTERVALS / self.fps
+        with self._condition:
+            while True:
+                frames = self._frames.get(screen_id)
+                if frames is None:
+                    return None
+                if len(frames) > 0 and frames[-1].timestamp > after:
+                    self.hits += 1
+                    return frames[-1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    self.misses += 1
+                    return None
+
+    def get_frames(self, screen_id: int, after: float = None) -> list:
+        """Returns the buffered frames of a display, oldest first.
+
+        :param screen_id: Index of the display.
+        :param after: Only return the frames grabbed after this monotonic time, if not None.
+        :return: List of ScreenshotImage objects of the whole display.
+        """
+        with self._condition:
+            frames = list(self._frames.get(screen_id, ()))
+        if after is None:
+            return frames
+        return [frame for frame in frames if frame.timestamp > after]
+
+    def get_stats(self) -> dict:
+        """Returns the frame counters of the capture thread."""
+        return {
+            "fps": self.fps,
+            "captured": self.captured,
+            "failures": self.failures,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            for screen_id in list(self._frames):
+                self._capture(screen_id)
+            next_time = max(next_time + interval, time.monotonic())
+            self._stop_event.wait(next_time - time.monotonic())
+
+    def _capture(self, screen_id):
+        try:
+            frame = ScreenshotImage(
+                DisplayCollection[screen_id].bounds, screen_id, frozen=False
+            )
+            # Searches use the gray array, convert it here rather than in the wait loops.
+            frame.get_gray_array()
+        except ScreenshotError as e:
+            self.failures += 1
+            logger.debug("Capture of display %s failed: %s" % (screen_id, e))
+            return
+        with self._condition:
+            frames = self._frames.get(screen_id)
+            if frames is not None:
+                frames.append(frame)
+                self.captured += 1
+                self._condition.notify_all()
+
+
+CaptureThread = _CaptureThread()
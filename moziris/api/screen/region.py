@@ -8,8 +8,11 @@ from moziris.api.finder.finder import (
     wait,
     find,
     find_all,
+    find_any,
     exists,
+    freeze,
     highlight,
+    wait_any,
     wait_vanish,
 )
 from moziris.api.location import Location
@@ -151,13 +154,37 @@ class Region:
         """
         return find(ps, self._area)
 
-    def find_all(self, ps=None):
+    def find_all(self, ps=None, max_results=None):
         """Look for multiple matches of a Pattern or image.
 
         :param ps: Pattern or String.
+        :param max_results: Maximum number of Pattern matches.
         :return: Call the find_all() method.
         """
-        return find_all(ps, self._area)
+        return find_all(ps, self._area, max_results)
+
+    def find_any(self, ps_list=None):
+        """Look for the first match of several Patterns or strings, using a single screenshot.
+
+        :param ps_list: List of Patterns or Strings.
+        :return: Call the find_any() method.
+        """
+        return find_any(ps_list, self._area)
+
+    def freeze(self):
+        """Capture the region once and reuse the frame for all finds inside it.
+
+        Waiting finds inside the block make a single attempt instead of waiting.
+
+        Usage::
+
+            with region.freeze():
+                region.exists(first_pattern)
+                region.find(second_pattern)
+
+        :return: Context manager yielding the frozen ScreenshotImage.
+        """
+        return freeze(self._area)
 
     def hover(self, lps=None, align=None):
         """Mouse hover.
@@ -176,6 +203,15 @@ class Region:
         """
         return wait(ps, timeout, self._area)
 
+    def wait_any(self, ps_list=None, timeout=None):
+        """Wait for one of several Patterns or strings to appear.
+
+        :param ps_list: List of Patterns or Strings.
+        :param timeout: Number as maximum waiting time in seconds.
+        :return: Call the wait_any() method.
+        """
+        return wait_any(ps_list, timeout, self._area)
+
     def wait_vanish(self, ps=None, timeout=None) -> bool or FindError:
         """Wait for a Pattern or image to disappear.
 
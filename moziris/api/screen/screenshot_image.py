@@ -7,13 +7,23 @@ import cv2
 import mss
 import numpy as np
 import logging
+import threading
+import time
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from pyautogui import screenshot
 
+from moziris.api.enums import CaptureBackend
 from moziris.api.errors import ScreenshotError
 from moziris.api.os_helpers import OSHelper
+from moziris.api.screen.buffer_pool import BufferPool
 from moziris.api.screen.display import DisplayCollection
+from moziris.api.screen.x11_shm import X11ShmGrabber
 from moziris.api.rectangle import Rectangle
+from moziris.api.settings import Settings
 
 try:
     import Image
@@ -21,64 +31,175 @@ except ImportError:
     from PIL import Image
 
 logger = logging.getLogger(__name__)
-_mss = mss.mss()
+_grabbers = threading.local()
+# Finalizers closing the X11 grabbers of the threads, when they end or at session teardown.
+_grabber_closers = []
+_grabber_closers_lock = threading.Lock()
+_frozen_images = []
+_display_executor = None
+_display_executor_lock = threading.Lock()
 
 
 class ScreenshotImage:
-    """This class represents the visual representation of a region/screen."""
-
-    def __init__(self, region: Rectangle = None, screen_id: int = None):
-        if screen_id is None:
-            screen_id = 0
-
+    """This class represents the visual representation of a region/screen.
+
+    :param Rectangle region: Area of the screen, the whole display if None.
+    :param int screen_id: Index of the display containing the region, found from the region
+    if None. A region spanning several displays is stitched from the parts of each display.
+    :param ScreenshotImage source: Screenshot containing the region, e.g. a frame of the
+    capture thread, to crop instead of grabbing the screen.
+    :param bool frozen: Crop the region from a frozen screenshot containing it, if any. Frozen
+    screenshots take precedence over the source.
+    """
+
+    def __init__(
+        self,
+        region: Rectangle = None,
+        screen_id: int = None,
+        source=None,
+        frozen: bool = True,
+    ):
         if region is None:
+            if screen_id is None:
+                screen_id = 0
             region = DisplayCollection[screen_id].bounds
+        elif screen_id is None:
+            screen_id = _region_in_display_list(region)
 
-        if OSHelper.is_linux():
-            screen_region = region
+        self._buffers = []
+        self.region = region
+        self.screen_id = screen_id
+        self._gray_array = None
+        self._color_array = None
+        self._source_crop = None
+
+        if screen_id is None:
+            # Stitched screenshots have the resolution of the region, whatever the display scales.
+            self._scale = 1
         else:
-            screen_region = {
-                "top": int(region.y),
-                "left": int(region.x),
-                "width": int(region.width),
-                "height": int(region.height),
-            }
+            self._scale = DisplayCollection[screen_id].scale
 
-        self._raw_image = _region_to_image(screen_region)
-        self._gray_array = _convert_image_to_gray(self._raw_image)
-        self._color_array = _convert_image_to_color(self._raw_image)
+        frozen_image = _get_frozen_image(region, screen_id) if frozen else None
+        if frozen_image is not None:
+            source = frozen_image
+        if source is not None:
+            self._crop_source_image(source)
+            return
 
-        height, width = self._gray_array.shape
+        # Monotonic time the grab started, frames of the capture thread are ordered by it.
+        self.timestamp = time.monotonic()
+        if screen_id is None:
+            self._raw_image = self._stitch_displays()
+        else:
+            self._raw_image = _region_to_image(region)
+
+        height, width = self._raw_image.shape[:2]
         self.width = width
         self.height = height
 
-        scale = DisplayCollection[screen_id].scale
+        if self._scale != 1:
+            self.width = int(width / self._scale)
+            self.height = int(height / self._scale)
+
+    def _crop_source_image(self, source_image):
+        """Reuses the arrays of a screenshot that contains this region.
+
+        The gray and color arrays are cropped from the source screenshot when first requested.
+        """
+        x = int(self.region.x - source_image.region.x)
+        y = int(self.region.y - source_image.region.y)
+        width = int(self.region.width)
+        height = int(self.region.height)
+
+        self._source_crop = (source_image, x, y, width, height)
+        self.timestamp = source_image.timestamp
+        self._raw_image = source_image._raw_image[
+            int(y * self._scale) : int((y + height) * self._scale),
+            int(x * self._scale) : int((x + width) * self._scale),
+        ]
+        self.width = min(width, source_image.width - x)
+        self.height = min(height, source_image.height - y)
+
+    def _stitch_displays(self):
+        """Grabs the part of the region on each display concurrently and joins them.
+
+        Each part is scaled to the region resolution. Areas of the region outside of every
+        display are black.
+        """
+        parts = []
+        for index, display in enumerate(DisplayCollection):
+            intersection = _get_intersection(self.region, display.bounds)
+            if intersection is not None:
+                parts.append((index, intersection))
+        grabs = get_display_executor().map(
+            lambda part: ScreenshotImage(part[1], part[0]).get_raw_array(), parts
+        )
 
-        if scale != 1:
-            self.width = int(width / scale)
-            self.height = int(height / scale)
-            self._color_array = cv2.resize(
-                self._color_array,
-                dsize=(self.width, self.height),
-                interpolation=cv2.INTER_CUBIC,
-            )
-            self._gray_array = cv2.resize(
-                self._gray_array,
+        width, height = int(self.region.width), int(self.region.height)
+        stitched = BufferPool.acquire((height, width, 4))
+        stitched.fill(0)
+        self._buffers.append(stitched)
+        for (index, part), raw in zip(parts, grabs):
+            x = int(part.x - self.region.x)
+            y = int(part.y - self.region.y)
+            target = stitched[y : y + int(part.height), x : x + int(part.width)]
+            if raw.shape[:2] == target.shape[:2]:
+                target[:] = raw
+            else:
+                cv2.resize(
+                    raw,
+                    dsize=(target.shape[1], target.shape[0]),
+                    dst=target,
+                    interpolation=cv2.INTER_CUBIC,
+                )
+        return stitched
+
+    def __del__(self):
+        # Give the arrays back to the pool, unless a caller still uses them.
+        self._gray_array = None
+        self._color_array = None
+        BufferPool.release_unused(getattr(self, "_buffers", []))
+
+    def _get_array(self, get_source_array, convert, channels):
+        """Computes one representation of the screenshot, cropped or converted and scaled.
+
+        The arrays are taken from the BufferPool and converted in place.
+        """
+        if self._source_crop is not None:
+            source_image, x, y, width, height = self._source_crop
+            return get_source_array(source_image)[y : y + height, x : x + width]
+
+        height, width = self._raw_image.shape[:2]
+        array = convert(
+            self._raw_image, dst=BufferPool.acquire(_get_shape(height, width, channels))
+        )
+        if self._scale != 1:
+            scaled_array = cv2.resize(
+                array,
                 dsize=(self.width, self.height),
+                dst=BufferPool.acquire(_get_shape(self.height, self.width, channels)),
                 interpolation=cv2.INTER_CUBIC,
             )
+            BufferPool.release(array)
+            array = scaled_array
+        self._buffers.append(array)
+        return array
 
     def get_gray_array(self):
-        """Getter for the gray_array property."""
+        """Getter for the gray_array property, converted from the raw image on first use."""
+        if self._gray_array is None:
+            self._gray_array = self._get_array(
+                ScreenshotImage.get_gray_array, _convert_image_to_gray, 1
+            )
         return self._gray_array
 
     def get_gray_image(self):
         """Getter for the gray_image property."""
-        return Image.fromarray(self._gray_array)
+        return Image.fromarray(self.get_gray_array())
 
     def binarize(self):
         return cv2.threshold(
-            self._gray_array, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU
+            self.get_gray_array(), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU
         )[1]
 
     def get_raw_image(self):
@@ -90,7 +211,11 @@ class ScreenshotImage:
         return self._raw_image
 
     def get_color_array(self):
-        """Getter color array property."""
+        """Getter color array property, converted from the raw image on first use."""
+        if self._color_array is None:
+            self._color_array = self._get_array(
+                ScreenshotImage.get_color_array, _convert_image_to_color, 3
+            )
         return self._color_array
 
     def show_image(self):
@@ -100,52 +225,236 @@ class ScreenshotImage:
         return image.show()
 
 
-def _region_to_image(region) -> Image or ScreenshotError:
-    # On Linux, try to use pyautogui to take screenshots, and revert to mss if it fails.
-    # On Windows/Mac, do the reverse.
+@contextmanager
+def frozen_screenshot(stack_image: ScreenshotImage):
+    """Context manager that makes every ScreenshotImage of an area inside stack_image a crop of it,
+    instead of grabbing the screen again. The frozen screenshot is released on exit.
+
+    :param ScreenshotImage stack_image: The screenshot to reuse.
+    """
+    _frozen_images.append(stack_image)
     try:
+        yield stack_image
+    finally:
+        _frozen_images.remove(stack_image)
+
+
+def _get_frozen_image(region, screen_id):
+    """Returns the most recent frozen screenshot that contains the region, if any."""
+    for frozen_image in reversed(_frozen_images):
+        frozen_region = frozen_image.region
+        if (
+            frozen_image.screen_id == screen_id
+            and frozen_region.x <= region.x
+            and frozen_region.y <= region.y
+            and region.x + region.width <= frozen_region.x + frozen_region.width
+            and region.y + region.height <= frozen_region.y + frozen_region.height
+        ):
+            return frozen_image
+    return None
+
+
+def is_frozen(region: Rectangle = None) -> bool:
+    """Checks if the screenshots of a region are crops of a frozen screenshot.
+
+    :param Rectangle region: Region to check, the first display if None.
+    :return: True inside a frozen_screenshot() block containing the region.
+    """
+    if region is None:
+        region = DisplayCollection[0].bounds
+    return _get_frozen_image(region, _region_in_display_list(region)) is not None
+
+
+def get_display_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool used to grab and search the displays concurrently.
+
+    It has one thread per display. OpenCV and the screenshot backends release the GIL, so
+    the displays are really processed in parallel.
+    """
+    global _display_executor
+    with _display_executor_lock:
+        if _display_executor is None:
+            _display_executor = ThreadPoolExecutor(
+                max_workers=max(len(DisplayCollection), 1),
+                thread_name_prefix="Iris display",
+            )
+        return _display_executor
+
+
+def _region_in_display_list(region=None):
+    r_x = region.x
+    r_y = region.y
+    r_w = region.width
+    r_h = region.height
+
+    for index, display in enumerate(DisplayCollection):
+        d_x = display.bounds.x
+        d_y = display.bounds.y
+        d_w = display.bounds.width
+        d_h = display.bounds.height
+
+        if (
+            r_x >= d_x
+            and r_x - d_x + r_w <= d_w
+            and r_y >= d_y
+            and r_y - d_y + r_h <= d_h
+        ):
+            return index
+
+
+def _get_intersection(first, second):
+    """Returns the Rectangle shared by two rectangles, or None if they don't overlap."""
+    x = max(first.x, second.x)
+    y = max(first.y, second.y)
+    x_end = min(first.x + first.width, second.x + second.width)
+    y_end = min(first.y + first.height, second.y + second.height)
+    if x_end <= x or y_end <= y:
+        return None
+    return Rectangle(x, y, x_end - x, y_end - y)
+
+
+def _region_to_image(region) -> Image or ScreenshotError:
+    # Use the selected backend, and revert to the next ones if it fails.
+    errors = []
+    for backend in _get_capture_backends():
+        try:
+            return _CAPTURE_FUNCTIONS[backend](region)
+        except ScreenshotError as e:
+            logger.debug(e)
+            errors.append(str(e))
+    logger.error("Screenshot failed: %s" % errors[-1])
+    raise ScreenshotError("Cannot create screenshot: %s" % errors[-1])
+
+
+def _get_capture_backends() -> list:
+    """Returns the backends to try for a screenshot, from the selected one to the fallbacks."""
+    backend = Settings.capture_backend
+    if backend == CaptureBackend.AUTO:
         if OSHelper.is_linux():
-            try:
-                grabbed_area = _pyautogui_screenshot(region)
-            except ScreenshotError as e:
-                logger.debug(e)
-                grabbed_area = _mss_screenshot(region)
+            backend = CaptureBackend.X11_SHM
         else:
-            try:
-                grabbed_area = _mss_screenshot(region)
-            except ScreenshotError as e:
-                logger.debug(e)
-                grabbed_area = _pyautogui_screenshot(region)
-    except ScreenshotError as e:
-        logger.error("Screenshot failed: %s" % e)
-        raise ScreenshotError("Cannot create screenshot: %s" % e)
-    return grabbed_area
-
-
-def _convert_image_to_gray(image):
+            backend = CaptureBackend.MSS
+    backends = [CaptureBackend.X11_SHM, CaptureBackend.MSS, CaptureBackend.PYAUTOGUI]
+    return backends[backends.index(backend) :]
+
+
+def _get_shape(height, width, channels):
+    if channels == 1:
+        return height, width
+    return height, width, channels
+
+
+def _convert_image_to_gray(image, dst=None):
     """Converts an Image to Gray
     :returns np array"""
-    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
 
 
-def _convert_image_to_color(image):
+def _convert_image_to_color(image, dst=None):
     """Converts an Image to Color
      :returns np array"""
 
-    return cv2.cvtColor(np.array(image), cv2.COLOR_BGR2RGB)
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_BGR2RGB, dst=dst)
+
+
+def _get_mss():
+    """Returns the mss instance of the current thread, mss instances can't be shared."""
+    grabber = getattr(_grabbers, "mss", None)
+    if grabber is None:
+        grabber = mss.mss()
+        _grabbers.mss = grabber
+    return grabber
+
+
+class _ThreadToken:
+    """Object kept in the local data of a thread, which is dropped when the thread ends."""
+
+
+def _get_x11_shm():
+    """Returns the X11 shared memory grabber of the current thread.
+
+    The grabber is only created once per thread, so an X server without MIT-SHM is not
+    queried again on every screenshot. It is closed when the thread ends.
+    """
+    grabber = getattr(_grabbers, "x11_shm", None)
+    if grabber is None or (
+        isinstance(grabber, X11ShmGrabber) and grabber.display is None
+    ):
+        try:
+            grabber = X11ShmGrabber()
+        except ScreenshotError as e:
+            grabber = str(e)
+        else:
+            _grabbers.x11_shm_token = _ThreadToken()
+            with _grabber_closers_lock:
+                _grabber_closers[:] = [c for c in _grabber_closers if c.alive]
+                _grabber_closers.append(
+                    weakref.finalize(_grabbers.x11_shm_token, grabber.close)
+                )
+        _grabbers.x11_shm = grabber
+    if isinstance(grabber, str):
+        raise ScreenshotError("X11 shared memory capture unavailable: %s" % grabber)
+    return grabber
+
+
+def close_grabbers():
+    """Closes the X11 grabbers of all threads, a thread grabbing again gets a new one."""
+    with _grabber_closers_lock:
+        closers = list(_grabber_closers)
+        del _grabber_closers[:]
+    for closer in closers:
+        closer()
+
+
+def _x11_shm_screenshot(region):
+    """Grabs a region with the MIT-SHM extension, cropped by the X server.
+
+    :return: BGRA array, a view of the shared memory segment without copying it.
+    """
+    return _get_x11_shm().grab(
+        int(region.x), int(region.y), int(region.width), int(region.height)
+    )
 
 
 def _mss_screenshot(region):
+    """Grabs a region with mss.
+
+    :return: BGRA array, a view of the pixels grabbed by mss without copying them.
+    """
     try:
-        return np.array(_mss.grab(region))
+        grabbed = _get_mss().grab(
+            {
+                "top": int(region.y),
+                "left": int(region.x),
+                "width": int(region.width),
+                "height": int(region.height),
+            }
+        )
+        return np.frombuffer(grabbed.raw, np.uint8).reshape(
+            grabbed.height, grabbed.width, 4
+        )
     except Exception as e:
         raise ScreenshotError("Call to _mss.grab failed: %s" % e)
 
 
 def _pyautogui_screenshot(region):
+    """Grabs a region with pyautogui.
+
+    :return: BGRA array, like the mss screenshots.
+    """
     try:
-        return np.array(
-            screenshot(region=(region.x, region.y, region.width, region.height))
+        return cv2.cvtColor(
+            np.array(
+                screenshot(region=(region.x, region.y, region.width, region.height))
+            ),
+            cv2.COLOR_RGB2BGRA,
         )
     except (IOError, OSError):
         raise ScreenshotError("Call to pyautogui.screenshot failed.")
+
+
+_CAPTURE_FUNCTIONS = {
+    CaptureBackend.X11_SHM: _x11_shm_screenshot,
+    CaptureBackend.MSS: _mss_screenshot,
+    CaptureBackend.PYAUTOGUI: _pyautogui_screenshot,
+}
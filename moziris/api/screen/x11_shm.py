@@ -0,0 +1,338 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+import contextlib
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from moziris.api.errors import ScreenshotError
+
+logger = logging.getLogger(__name__)
+
+ZPIXMAP = 2
+ALL_PLANES = 0xFFFFFFFF
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+# Number of free segments kept for each grab size.
+SHM_MAX_FREE_SEGMENTS = 4
+# Bytes of all free segments of a grabber, the least recently grabbed sizes are detached first.
+SHM_MAX_FREE_BYTES = 128 * 1024 * 1024
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class _XImage(ctypes.Structure):
+    # Leading fields of the XImage structure, allocated and freed by Xlib.
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+    ]
+
+
+_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+_libraries = None
+_libraries_lock = threading.Lock()
+_error_handler_lock = threading.Lock()
+
+
+def _on_x_error(display, event):
+    # The default handler exits the process, failed requests are reported by their status.
+    return 0
+
+
+_error_handler = _ERROR_HANDLER(_on_x_error)
+
+
+@contextlib.contextmanager
+def _trap_x_errors(x11, display):
+    """Ignores the X errors of the requests made in the block, for all X connections.
+
+    The error handler of Xlib is global, so the one of the process, e.g. the one of Tk, is
+    restored once the errors of the block have been received.
+    """
+    with _error_handler_lock:
+        previous = x11.XSetErrorHandler(ctypes.cast(_error_handler, ctypes.c_void_p))
+        try:
+            yield
+        finally:
+            x11.XSync(display, 0)
+            x11.XSetErrorHandler(previous)
+
+
+def _load_libraries():
+    """Loads libX11, libXext and libc once and declares the functions used."""
+    global _libraries
+    with _libraries_lock:
+        if _libraries is not None:
+            return _libraries
+
+        paths = [ctypes.util.find_library(name) for name in ("X11", "Xext", "c")]
+        if None in paths:
+            raise ScreenshotError("libX11 or libXext not found.")
+        x11, xext = ctypes.CDLL(paths[0]), ctypes.CDLL(paths[1])
+        libc = ctypes.CDLL(paths[2], use_errno=True)
+
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultVisual.restype = ctypes.c_void_p
+        x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDestroyImage.argtypes = [ctypes.POINTER(_XImage)]
+        x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+        x11.XSetErrorHandler.restype = ctypes.c_void_p
+
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+            ctypes.c_uint,
+            ctypes.c_int,
+            ctypes.c_void_p,
+            ctypes.POINTER(_XShmSegmentInfo),
+            ctypes.c_uint,
+            ctypes.c_uint,
+        ]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_ulong,
+            ctypes.POINTER(_XImage),
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_ulong,
+        ]
+
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        _libraries = (x11, xext, libc)
+        return _libraries
+
+
+class _Segment:
+    """A shared memory segment attached to the X server, with the XImage describing it."""
+
+    def __init__(self, grabber, width: int, height: int):
+        x11, xext, libc = grabber.libraries
+        self.size = (width, height)
+        self.info = _XShmSegmentInfo()
+        self.image = xext.XShmCreateImage(
+            grabber.display,
+            grabber.visual,
+            grabber.depth,
+            ZPIXMAP,
+            None,
+            ctypes.byref(self.info),
+            width,
+            height,
+        )
+        if not self.image:
+            raise ScreenshotError("XShmCreateImage failed.")
+        image = self.image.contents
+        if image.bits_per_pixel != 32:
+            x11.XDestroyImage(self.image)
+            raise ScreenshotError(
+                "Unsupported X11 pixel format with %s bits per pixel."
+                % image.bits_per_pixel
+            )
+
+        self.nbytes = image.bytes_per_line * height
+        self.info.shmid = libc.shmget(IPC_PRIVATE, self.nbytes, IPC_CREAT | 0o600)
+        if self.info.shmid < 0:
+            x11.XDestroyImage(self.image)
+            raise ScreenshotError("shmget failed: %s" % os.strerror(ctypes.get_errno()))
+        address = libc.shmat(self.info.shmid, None, 0)
+        if address is None or address == ctypes.c_void_p(-1).value:
+            libc.shmctl(self.info.shmid, IPC_RMID, None)
+            x11.XDestroyImage(self.image)
+            raise ScreenshotError("shmat failed.")
+        self.info.shmaddr = address
+        self.info.readOnly = 0
+        image.data = address
+
+        with _trap_x_errors(x11, grabber.display):
+            attached = xext.XShmAttach(grabber.display, ctypes.byref(self.info))
+        # The segment is removed by the kernel once the X server and Iris detach from it,
+        # including when the process is killed.
+        libc.shmctl(self.info.shmid, IPC_RMID, None)
+        if not attached:
+            libc.shmdt(address)
+            x11.XDestroyImage(self.image)
+            raise ScreenshotError("XShmAttach failed.")
+        self.buffer = (ctypes.c_uint8 * self.nbytes).from_address(address)
+
+    def destroy(self, libraries, display):
+        """Detaches the segment, display is None once the X connection closed and detached it."""
+        x11, xext, libc = libraries
+        if display is not None:
+            with _trap_x_errors(x11, display):
+                xext.XShmDetach(display, ctypes.byref(self.info))
+        # The XImage of a shared memory segment does not own its data.
+        x11.XDestroyImage(self.image)
+        libc.shmdt(self.info.shmaddr)
+
+
+class X11ShmGrabber:
+    """Grabs screen regions through the MIT-SHM extension of the X server.
+
+    The X server copies the requested rectangle of the root window straight into a shared
+    memory segment, which is returned as a NumPy view without any copy. The segment stays
+    in use while the view, or any array derived from it, is referenced. It is then reused
+    by the next grab of the same size, so polling a region attaches its segments once.
+
+    X connections can't be shared between threads, use one grabber per thread.
+    """
+
+    def __init__(self, display_name: str = None):
+        self.libraries = _load_libraries()
+        x11, xext, libc = self.libraries
+        self.display = x11.XOpenDisplay(
+            display_name.encode() if display_name is not None else None
+        )
+        if not self.display:
+            raise ScreenshotError("Unable to open X display %s." % display_name)
+        if not xext.XShmQueryExtension(self.display):
+            x11.XCloseDisplay(self.display)
+            self.display = None
+            raise ScreenshotError("The X server does not support MIT-SHM.")
+        screen = x11.XDefaultScreen(self.display)
+        self.root = x11.XDefaultRootWindow(self.display)
+        self.visual = x11.XDefaultVisual(self.display, screen)
+        self.depth = x11.XDefaultDepth(self.display, screen)
+        self._free = OrderedDict()
+        self._free_bytes = 0
+        self._released = []
+        self._lock = threading.Lock()
+
+    def grab(self, x: int, y: int, width: int, height: int):
+        """Grabs a rectangle of the screen.
+
+        :param x: Left coordinate of the rectangle.
+        :param y: Top coordinate of the rectangle.
+        :param width: Width of the rectangle.
+        :param height: Height of the rectangle.
+        :return: BGRA array, a view of the shared memory segment.
+        """
+        if self.display is None:
+            raise ScreenshotError("The X display is closed.")
+        self._recycle()
+        segment = self._acquire(width, height)
+        x11, xext, libc = self.libraries
+        with _trap_x_errors(x11, self.display):
+            grabbed = xext.XShmGetImage(
+                self.display, self.root, segment.image, x, y, ALL_PLANES
+            )
+        if not grabbed:
+            self._release(segment)
+            raise ScreenshotError(
+                "XShmGetImage failed for %sx%s at %s,%s." % (width, height, x, y)
+            )
+
+        buffer = (ctypes.c_uint8 * segment.nbytes).from_buffer(segment.buffer)
+        weakref.finalize(buffer, self._release, segment)
+        stride = segment.image.contents.bytes_per_line
+        return np.ndarray((height, width, 4), np.uint8, buffer, strides=(stride, 4, 1))
+
+    def close(self):
+        """Detaches the free segments and closes the X connection.
+
+        Segments still used by grabbed arrays are freed once the arrays are dropped.
+        """
+        with self._lock:
+            display, self.display = self.display, None
+            segments = [segment for free in self._free.values() for segment in free]
+            segments += self._released
+            self._free.clear()
+            self._free_bytes = 0
+            self._released = []
+        if display is None:
+            return
+        for segment in segments:
+            segment.destroy(self.libraries, display)
+        x11, xext, libc = self.libraries
+        x11.XCloseDisplay(display)
+
+    def _acquire(self, width, height):
+        with self._lock:
+            free = self._free.get((width, height))
+            if free:
+                segment = free.pop()
+                self._free_bytes -= segment.nbytes
+                if not free:
+                    del self._free[segment.size]
+                return segment
+        return _Segment(self, width, height)
+
+    def _release(self, segment):
+        # Called by the finalizer of the last view, possibly from another thread, so the
+        # segments to destroy are only collected here and detached by the owning thread.
+        with self._lock:
+            closed = self.display is None
+            if not closed:
+                self._keep_free(segment)
+        if closed:
+            # Closing the X connection detached the segment, only its memory is left to free.
+            segment.destroy(self.libraries, None)
+
+    def _keep_free(self, segment):
+        """Adds a segment to the free ones, the lock must be held."""
+        free = self._free.setdefault(segment.size, [])
+        self._free.move_to_end(segment.size)
+        if len(free) >= SHM_MAX_FREE_SEGMENTS:
+            self._released.append(segment)
+            return
+        free.append(segment)
+        self._free_bytes += segment.nbytes
+        while self._free_bytes > SHM_MAX_FREE_BYTES:
+            size, oldest = next(iter(self._free.items()))
+            evicted = oldest.pop(0)
+            self._free_bytes -= evicted.nbytes
+            self._released.append(evicted)
+            if not oldest:
+                del self._free[size]
+
+    def _recycle(self):
+        with self._lock:
+            released, self._released = self._released, []
+        for segment in released:
+            segment.destroy(self.libraries, self.display)
@@ -2,14 +2,14 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import inspect
 import logging
 import os
 import subprocess
 import sys
 import tempfile
 
-from moziris.api.enums import Color
+from moziris.api.enums import CaptureBackend, Color, MatcherType, OcrBackend
+from moziris.api.finder.matchers import get_matcher
 from moziris.api.os_helpers import OSHelper
 from moziris.util.system import init_tesseract_path
 from moziris.util.arg_parser import get_core_args
@@ -33,6 +33,8 @@ class _Settings:
 
     wait_scan_rate              -   The number of times actual pattern search operations are performed per second.
                                     (default - 3)
+    wait_scan_backoff           -   Lower the scan rate after every unsuccessful search of a waiting operation.
+                                    (default - False)
     type_delay                  -   The number of seconds between each keyboard press. (default - 0)
     move_mouse_delay            -   duration of mouse movement from current location to target location. (default - 0.5
                                     or value selected from Control Center)
@@ -47,11 +49,44 @@ class _Settings:
     slow_motion_delay           -   Controls the duration of the visual effect (seconds).
     observe_scan_rate           -   The number of times actual search operations are performed per second while waiting
                                     for a pattern to appear or vanish.
-    observe_min_changed_pixels  -   The minimum size in pixels of a change to trigger a change event.
+    observe_min_changed_pixels  -   The minimum size in pixels of a change to trigger a change event. Waiting for a
+                                    pattern to appear or vanish skips searching until at least this many pixels changed.
     highlight_duration          -   The duration of the highlight effect.
     highlight_color             -   The rectangle/circle border color for the highlight effect.
     highlight_thickness         -   The rectangle/circle border thickness for the highlight effect.
     mouse_scroll_step           -   The number of pixels for a vertical/horizontal scroll event.
+    max_find_results            -   The maximum number of matches returned when searching all occurrences of a pattern.
+                                    (default - 100)
+    location_hints              -   Search a single match around the location where the same image was last found,
+                                    before searching the whole region. A match found there is returned even if a
+                                    better one exists elsewhere on the screen. (default - False)
+    persist_location_hints      -   Load and save the last known locations in the working directory, so later runs
+                                    start with them. (default - False)
+    matcher                     -   The template matching engine used by find operations, one of MatcherType or the
+                                    name of a backend added with register_matcher(). Can be overridden per Pattern
+                                    with Pattern.use_matcher() and from the command line with --matcher.
+                                    (default - auto)
+    pattern_cache_size          -   The maximum size in megabytes of the decoded Pattern images kept in memory and
+                                    shared by all Pattern objects of the same image. (default - 256)
+    preload_patterns            -   Load the images of the selected tests into memory on background threads when the
+                                    test session starts. (default - True)
+    capture_backend             -   The screenshot backend, one of CaptureBackend. Auto uses the X11 shared memory
+                                    backend when the X server supports it, then mss, and pyautogui if both fail. Can
+                                    be set from the command line with --capture_backend. (default - auto)
+    capture_fps                 -   The number of frames per second grabbed from every display by a background thread.
+                                    Searches then use the newest frame instead of grabbing the screen. Can be set from
+                                    the command line with --capture_fps. (default - 0, disabled)
+    capture_buffer_size         -   The number of frames of each display kept by the capture thread. (default - 4)
+    search_all_displays         -   Search every display when no region is given, instead of the first one only.
+                                    (default - False)
+    ocr_backend                 -   The OCR engine used by text search, one of OcrBackend. Auto uses tesserocr, which
+                                    keeps Tesseract loaded, when it is installed and pytesseract otherwise.
+                                    (default - auto)
+    ocr_workers                 -   The maximum number of worker processes recognizing the variants of a text search
+                                    image in parallel, always leaving one core free. 1 runs OCR in the test process.
+                                    (default - 4)
+    ocr_cache_size              -   The number of screenshots whose OCR results are kept, so that searching text again
+                                    on an unchanged screen skips OCR. 0 disables the cache. (default - 32)
     """
 
     DEFAULT_MIN_SIMILARITY = 0.8
@@ -61,6 +96,7 @@ class _Settings:
     DEFAULT_MOVE_MOUSE_DELAY = 0.5
     DEFAULT_CLICK_DELAY = 0
     DEFAULT_WAIT_SCAN_RATE = 3
+    DEFAULT_WAIT_SCAN_BACKOFF = False
     DEFAULT_OBSERVE_SCAN_RATE = 3
     DEFAULT_AUTO_WAIT_TIMEOUT = 3
     DEFAULT_DELAY_BEFORE_MOUSE_DOWN = 0.3
@@ -70,6 +106,19 @@ class _Settings:
     DEFAULT_HIGHLIGHT_COLOR = Color.RED
     DEFAULT_HIGHLIGHT_THICKNESS = 2
     DEFAULT_MOUSE_SCROLL_STEP = 100
+    DEFAULT_MATCHER = MatcherType.AUTO
+    DEFAULT_MAX_FIND_RESULTS = 100
+    DEFAULT_LOCATION_HINTS = False
+    DEFAULT_PERSIST_LOCATION_HINTS = False
+    DEFAULT_PATTERN_CACHE_SIZE = 256
+    DEFAULT_PRELOAD_PATTERNS = True
+    DEFAULT_CAPTURE_BACKEND = CaptureBackend.AUTO
+    DEFAULT_CAPTURE_FPS = 0
+    DEFAULT_CAPTURE_BUFFER_SIZE = 4
+    DEFAULT_SEARCH_ALL_DISPLAYS = False
+    DEFAULT_OCR_BACKEND = OcrBackend.AUTO
+    DEFAULT_OCR_WORKERS = 4
+    DEFAULT_OCR_CACHE_SIZE = 32
     DEFAULT_SITE_LOAD_TIMEOUT = 30
     DEFAULT_HEAVY_SITE_LOAD_TIMEOUT = 90
     DEFAULT_KEY_SHORTCUT_DELAY = 0.1
@@ -83,6 +132,7 @@ class _Settings:
     def __init__(
         self,
         wait_scan_rate=DEFAULT_WAIT_SCAN_RATE,
+        wait_scan_backoff=DEFAULT_WAIT_SCAN_BACKOFF,
         type_delay=DEFAULT_TYPE_DELAY,
         move_mouse_delay=DEFAULT_MOVE_MOUSE_DELAY,
         click_delay=DEFAULT_CLICK_DELAY,
@@ -101,9 +151,23 @@ class _Settings:
         mouse_scroll_step=DEFAULT_MOUSE_SCROLL_STEP,
         key_shortcut_delay=DEFAULT_KEY_SHORTCUT_DELAY,
         site_load_timeout=DEFAULT_SITE_LOAD_TIMEOUT,
+        matcher=DEFAULT_MATCHER,
+        max_find_results=DEFAULT_MAX_FIND_RESULTS,
+        location_hints=DEFAULT_LOCATION_HINTS,
+        persist_location_hints=DEFAULT_PERSIST_LOCATION_HINTS,
+        pattern_cache_size=DEFAULT_PATTERN_CACHE_SIZE,
+        preload_patterns=DEFAULT_PRELOAD_PATTERNS,
+        capture_backend=DEFAULT_CAPTURE_BACKEND,
+        capture_fps=DEFAULT_CAPTURE_FPS,
+        capture_buffer_size=DEFAULT_CAPTURE_BUFFER_SIZE,
+        search_all_displays=DEFAULT_SEARCH_ALL_DISPLAYS,
+        ocr_backend=DEFAULT_OCR_BACKEND,
+        ocr_workers=DEFAULT_OCR_WORKERS,
+        ocr_cache_size=DEFAULT_OCR_CACHE_SIZE,
     ):
 
         self.wait_scan_rate = wait_scan_rate
+        self.wait_scan_backoff = wait_scan_backoff
         self._type_delay = type_delay
         self.move_mouse_delay = move_mouse_delay
         self._click_delay = click_delay
@@ -122,6 +186,19 @@ class _Settings:
         self.mouse_scroll_step = mouse_scroll_step
         self.key_shortcut_delay = key_shortcut_delay
         self.site_load_timeout = site_load_timeout
+        self.matcher = matcher
+        self.max_find_results = max_find_results
+        self.location_hints = location_hints
+        self.persist_location_hints = persist_location_hints
+        self.pattern_cache_size = pattern_cache_size
+        self.preload_patterns = preload_patterns
+        self.capture_backend = capture_backend
+        self.capture_fps = capture_fps
+        self.capture_buffer_size = capture_buffer_size
+        self.search_all_displays = search_all_displays
+        self.ocr_backend = ocr_backend
+        self.ocr_workers = ocr_workers
+        self.ocr_cache_size = ocr_cache_size
         self.locale = ""
         self.highlight = False
         self.virtual_keyboard = False
@@ -130,6 +207,22 @@ class _Settings:
         self._code_root = get_active_root()
         sys.path.append(self._code_root)
 
+    @property
+    def capture_backend(self):
+        return self._capture_backend
+
+    @capture_backend.setter
+    def capture_backend(self, value):
+        self._capture_backend = CaptureBackend(value)
+
+    @property
+    def ocr_backend(self):
+        return self._ocr_backend
+
+    @ocr_backend.setter
+    def ocr_backend(self, value):
+        self._ocr_backend = OcrBackend(value)
+
     @property
     def click_delay(self):
         return self._click_delay
@@ -173,6 +266,20 @@ class _Settings:
     def locale(self, value):
         self._locale = value
 
+    @property
+    def matcher(self):
+        return self._matcher
+
+    @matcher.setter
+    def matcher(self, value):
+        # Raises ValueError with the registered names, instead of failing in every find.
+        get_matcher(value)
+        try:
+            self._matcher = MatcherType(value)
+        except ValueError:
+            # Backends added with register_matcher() are selected by name.
+            self._matcher = value
+
     @property
     def min_similarity(self):
         return self._min_similarity
@@ -222,7 +329,7 @@ class _Settings:
 
     @staticmethod
     def set_code_root_from_caller():
-        caller = inspect.stack()[1][1]
+        caller = sys._getframe(1).f_code.co_filename
         Settings.code_root = os.path.split(caller)[0]
 
     @property
@@ -12,6 +12,15 @@ import time
 import pytest
 
 from moziris.api import *
+from moziris.api.finder.image_index import ImageIndex
+from moziris.api.finder.location_hints import LocationHints
+from moziris.api.finder.ocr_engine import OcrEngine
+from moziris.api.finder.pattern import preload_patterns
+from moziris.api.finder.pattern_cache import PatternCache
+from moziris.api.finder.text_search import OcrCache
+from moziris.api.screen.buffer_pool import BufferPool
+from moziris.api.screen.capture_thread import CaptureThread
+from moziris.api.screen.screenshot_image import close_grabbers
 from moziris.util.arg_parser import get_core_args, set_core_arg
 from moziris.util.json_utils import update_run_index, create_run_log
 from moziris.util.path_manager import PathManager
@@ -56,8 +65,19 @@ class BaseTarget:
             {"name": "override", "type": "checkbox", "label": "Run disabled tests"},
         ]
         self.clean_run = True
+        self.preload_tasks = []
         Settings.debug_image = True
         Settings.locale = core_args.locale
+        if core_args.matcher is not None:
+            try:
+                Settings.matcher = core_args.matcher
+            except ValueError as e:
+                logger.error(e)
+                exit(1)
+        if core_args.capture_backend is not None:
+            Settings.capture_backend = core_args.capture_backend
+        if core_args.capture_fps is not None:
+            Settings.capture_fps = core_args.capture_fps
 
     def get_target_args(self):
         parser = argparse.ArgumentParser(
@@ -112,6 +132,14 @@ class BaseTarget:
         )
         update_run_index(self, False)
 
+        if Settings.preload_patterns:
+            self.preload_tasks = preload_patterns(
+                _get_test_directories(session.config.args)
+            )
+
+        if Settings.capture_fps > 0:
+            CaptureThread.start()
+
     def pytest_sessionfinish(self, session):
         """ called after whole test run finished, right before returning the exit status to the system.
 
@@ -124,6 +152,26 @@ class BaseTarget:
 
         self.end_time = time.time()
 
+        for task in self.preload_tasks:
+            task.cancel()
+        CaptureThread.stop()
+        OcrEngine.shutdown()
+        close_grabbers()
+
+        if Settings.persist_location_hints:
+            LocationHints.save()
+        logger.debug("Location hint stats: %s" % LocationHints.get_stats())
+        logger.debug("Pattern cache stats: %s" % PatternCache.get_stats())
+        logger.debug("Buffer pool stats: %s" % BufferPool.get_stats())
+        logger.debug("Capture thread stats: %s" % CaptureThread.get_stats())
+        logger.debug("OCR engine stats: %s" % OcrEngine.get_stats())
+        logger.debug("OCR cache stats: %s" % OcrCache.get_stats())
+        image_report = ImageIndex.get_report()
+        for image in image_report["missing"]:
+            logger.warning("Image not found: %s" % image)
+        for image, hidden in image_report["shadowed"].items():
+            logger.debug("Image %s hides %s" % (image, ", ".join(hidden)))
+
         update_run_index(self, True)
         footer = create_footer(self)
         result = footer.print_report_footer()
@@ -275,3 +323,13 @@ def reason_for_failure(report):
         return ""
     else:
         return report.longreprtext
+
+
+def _get_test_directories(test_paths: list) -> list:
+    """Returns the directories of the test files given to pytest, in order."""
+    directories = []
+    for test_path in test_paths:
+        directory = os.path.dirname(str(test_path).split("::")[0])
+        if os.path.isdir(directory) and directory not in directories:
+            directories.append(directory)
+    return directories
@@ -0,0 +1,502 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import argparse
+import difflib
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from moziris.api.enums import MatchTemplateType, MatcherType, OcrBackend
+from moziris.api.errors import ScreenshotError
+from moziris.api.finder import ocr_engine
+from moziris.api.finder.fuzzy_match import TokenArray, get_close_matches
+from moziris.api.finder.matchers import get_matcher, get_matcher_names
+from moziris.api.finder.ocr_engine import OcrEngine
+from moziris.api.finder.pattern import Pattern
+from moziris.api.finder.pattern_cache import PatternCache
+from moziris.api.finder.text_search import _get_cutoff_steps
+from moziris.api.rectangle import Rectangle
+from moziris.api.screen.buffer_pool import BufferPool
+from moziris.api.screen.display import DisplayCollection
+from moziris.api.screen.screenshot_image import (
+    _CAPTURE_FUNCTIONS,
+    _convert_image_to_color,
+    _convert_image_to_gray,
+)
+from moziris.api.settings import Settings
+
+FRAME_SIZES = [(1920, 1080), (3840, 2160)]
+PATTERN_SIZES = [24, 48, 96, 640]
+ZOOM_FACTORS = [0.8, 1.0, 1.25, 1.5, 2.0]
+PATTERN_COUNT = 100
+# Approximate depth of the call stack of a test run by pytest.
+STACK_DEPTH = 60
+OCR_WORDS = [
+    "Firefox",
+    "Bookmarks",
+    "History",
+    "Library",
+    "Settings",
+    "Private",
+    "1.25%",
+]
+TOKEN_COUNTS = [500, 5000]
+
+
+def _create_synthetic_frame(width, height, seed=0):
+    """Creates a gray frame with enough texture and UI-like shapes to give unique matches."""
+    rng = np.random.RandomState(seed)
+    frame = cv2.GaussianBlur(
+        rng.randint(0, 256, (height, width)).astype(np.uint8), (5, 5), 0
+    )
+    for _ in range(int(width * height / 20000)):
+        x, y = rng.randint(0, width), rng.randint(0, height)
+        color = int(rng.randint(0, 256))
+        cv2.rectangle(
+            frame, (x, y), (x + rng.randint(8, 120), y + rng.randint(8, 40)), color, -1
+        )
+        cv2.putText(
+            frame, "Iris", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 255 - color, 1
+        )
+    return frame
+
+
+def _create_text_image(width, height, seed=0):
+    """Creates a gray image with lines of UI words, as found on a browser page."""
+    rng = np.random.RandomState(seed)
+    image = np.full((height, width), 255, np.uint8)
+    for y in range(24, height, 24):
+        x = 8
+        while True:
+            word = OCR_WORDS[rng.randint(len(OCR_WORDS))]
+            text_width = cv2.getTextSize(word, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][0]
+            if x + text_width >= width:
+                break
+            cv2.putText(image, word, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 0, 1)
+            x += text_width + 12
+    return image
+
+
+def _create_ocr_tokens(count, seed=0):
+    """Creates OCR words with some characters misread, dropped or added."""
+    rng = np.random.RandomState(seed)
+    characters = "abcdefghijklmnopqrstuvwxyz0123456789.%"
+    tokens = []
+    for _ in range(count):
+        token = list(OCR_WORDS[rng.randint(len(OCR_WORDS))])
+        for _ in range(rng.randint(0, 3)):
+            position = rng.randint(len(token))
+            operation = rng.randint(3)
+            if operation == 0:
+                token[position] = characters[rng.randint(len(characters))]
+            elif operation == 1 and len(token) > 1:
+                del token[position]
+            else:
+                token.insert(position, characters[rng.randint(len(characters))])
+        tokens.append("".join(token))
+    return tokens
+
+
+def _time_call(func, repeat):
+    """Returns the median duration in milliseconds and the result of the last call."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return float(np.median(durations)), result
+
+
+def match_template_benchmark(args):
+    """Runs every registered matcher on the same frames and compares it with the reference.
+
+    The speedup is relative to the single pass OpenCV matcher. A matcher agrees with the
+    NumPy reference when it finds the same position, the score error is the difference
+    between their similarities.
+    """
+    precision = Settings.DEFAULT_MIN_SIMILARITY
+    reference = get_matcher(MatcherType.NUMPY)
+    baseline_name = MatcherType.OPENCV.value
+    matcher_names = sorted(get_matcher_names(), key=lambda name: name != baseline_name)
+    rng = np.random.RandomState(1)
+
+    print(
+        "%-11s %-8s %-9s %10s %8s %6s %7s %9s"
+        % (
+            "Frame",
+            "Pattern",
+            "Matcher",
+            "Median ms",
+            "Speedup",
+            "Found",
+            "Agrees",
+            "Score err",
+        )
+    )
+    for width, height in FRAME_SIZES:
+        frame = _create_synthetic_frame(width, height)
+        for size in PATTERN_SIZES:
+            x, y = rng.randint(0, width - size), rng.randint(0, height - size)
+            pattern = frame[y : y + size, x : x + size].copy()
+            ref_positions, ref_scores = reference(
+                frame, pattern, precision, MatchTemplateType.SINGLE
+            )
+
+            durations = {}
+            for name in matcher_names:
+                match = get_matcher(name)
+                durations[name], (positions, scores) = _time_call(
+                    lambda: match(frame, pattern, precision, MatchTemplateType.SINGLE),
+                    args.repeat,
+                )
+                found = len(positions) == 1 and tuple(positions[0]) == (x, y)
+                agrees = len(positions) == len(ref_positions) and np.array_equal(
+                    positions, ref_positions
+                )
+                score_error = (
+                    float(np.abs(scores - ref_scores).max())
+                    if agrees and len(scores) > 0
+                    else float("nan")
+                )
+                print(
+                    "%-11s %-8s %-9s %10.1f %7.1fx %6s %7s %9.1e"
+                    % (
+                        "%sx%s" % (width, height),
+                        "%sx%s" % (size, size),
+                        name,
+                        durations[name],
+                        durations.get(baseline_name, durations[name]) / durations[name],
+                        found,
+                        agrees,
+                        score_error,
+                    )
+                )
+
+
+def scaled_match_benchmark(args):
+    """Searches patterns in zoomed frames, as with browser zoom or a different DPI.
+
+    A pattern counts as found when the center of the match is within two pixels of the
+    center of the zoomed pattern.
+    """
+    precision = Settings.DEFAULT_MIN_SIMILARITY
+    matcher_names = [MatcherType.OPENCV.value, MatcherType.FEATURES.value]
+    width, height = FRAME_SIZES[0]
+    frame = _create_synthetic_frame(width, height)
+    rng = np.random.RandomState(2)
+
+    print(
+        "%-8s %-6s %-9s %10s %6s %6s"
+        % ("Pattern", "Zoom", "Matcher", "Median ms", "Found", "Score")
+    )
+    for size in [size for size in PATTERN_SIZES if size < min(width, height) / 2]:
+        x, y = rng.randint(0, width - size), rng.randint(0, height - size)
+        pattern = frame[y : y + size, x : x + size].copy()
+        for zoom in ZOOM_FACTORS:
+            zoomed_frame = cv2.resize(frame, None, fx=zoom, fy=zoom)
+            center = ((x + size / 2) * zoom, (y + size / 2) * zoom)
+            for name in matcher_names:
+                match = get_matcher(name)
+                duration, (positions, scores) = _time_call(
+                    lambda: match(
+                        zoomed_frame, pattern, precision, MatchTemplateType.SINGLE
+                    ),
+                    args.repeat,
+                )
+                found = (
+                    len(positions) == 1
+                    and np.abs(positions[0] + size / 2 - center).max() <= 2
+                )
+                print(
+                    "%-8s %-6s %-9s %10.1f %6s %6.3f"
+                    % (
+                        "%sx%s" % (size, size),
+                        zoom,
+                        name,
+                        duration,
+                        found,
+                        scores[0] if len(scores) > 0 else 0,
+                    )
+                )
+
+
+def pattern_benchmark(args):
+    """Measures the cost of creating Pattern objects.
+
+    Compares the caller lookup through inspect.stack() with sys._getframe(), and loading
+    images by decoding them for every Pattern with the shared PatternCache.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        rng = np.random.RandomState(3)
+        paths = []
+        for index in range(PATTERN_COUNT):
+            size = int(rng.randint(16, 97))
+            path = os.path.join(directory, "pattern_%s.png" % index)
+            cv2.imwrite(path, rng.randint(0, 256, (size, size, 3)).astype(np.uint8))
+            paths.append(path)
+
+        def load_all(cached):
+            for path in paths:
+                if not cached:
+                    PatternCache.clear()
+                Pattern(os.path.basename(path), from_path=path).target_offset(1, 1)
+
+        measurements = [
+            (
+                "Caller with inspect.stack()",
+                lambda: _call_at_depth(STACK_DEPTH, lambda: inspect.stack()[1][1]),
+            ),
+            (
+                "Caller with sys._getframe()",
+                lambda: _call_at_depth(
+                    STACK_DEPTH, lambda: sys._getframe(1).f_code.co_filename
+                ),
+            ),
+            ("%s Patterns, decoded each time" % PATTERN_COUNT, lambda: load_all(False)),
+            ("%s Patterns, shared cache" % PATTERN_COUNT, lambda: load_all(True)),
+        ]
+        print("%-36s %10s" % ("Operation", "Median ms"))
+        for name, func in measurements:
+            duration, result = _time_call(func, args.repeat)
+            print("%-36s %10.3f" % (name, duration))
+        print("Pattern cache: %s" % PatternCache.get_stats())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def conversion_benchmark(args):
+    """Measures the per-poll cost of converting a raw BGRA grab for a gray search.
+
+    Converting both representations is what ScreenshotImage did for every screenshot, the
+    lazy conversion only computes and scales the gray array used by the search.
+    """
+    print("%-11s %-6s %-22s %10s" % ("Frame", "Scale", "Conversion", "Median ms"))
+    for width, height in FRAME_SIZES:
+        for scale in [1, 2]:
+            raw = np.zeros((height, width, 4), np.uint8)
+            raw[:, :, :3] = _create_synthetic_frame(width, height)[:, :, np.newaxis]
+            size = (int(width / scale), int(height / scale))
+
+            def convert(converters):
+                for converter in converters:
+                    array = converter(raw)
+                    if scale != 1:
+                        cv2.resize(array, dsize=size, interpolation=cv2.INTER_CUBIC)
+
+            for name, converters in [
+                ("Gray and color", [_convert_image_to_gray, _convert_image_to_color]),
+                ("Gray only (lazy)", [_convert_image_to_gray]),
+            ]:
+                duration, result = _time_call(lambda: convert(converters), args.repeat)
+                print(
+                    "%-11s %-6s %-22s %10.1f"
+                    % ("%sx%s" % (width, height), scale, name, duration)
+                )
+
+
+def buffer_pool_benchmark(args):
+    """Simulates polling a scaled 4K display, converting each grab to a scaled gray array.
+
+    Compares allocating new arrays for every poll with taking them from the BufferPool.
+    """
+    width, height = FRAME_SIZES[-1]
+    size = (int(width / 2), int(height / 2))
+    raw = np.zeros((height, width, 4), np.uint8)
+    polls = 20
+
+    def poll(pooled):
+        for _ in range(polls):
+            if pooled:
+                gray = _convert_image_to_gray(
+                    raw, dst=BufferPool.acquire((height, width))
+                )
+                scaled = cv2.resize(
+                    gray,
+                    dsize=size,
+                    dst=BufferPool.acquire((size[1], size[0])),
+                    interpolation=cv2.INTER_CUBIC,
+                )
+                BufferPool.release(gray)
+                BufferPool.release(scaled)
+            else:
+                gray = _convert_image_to_gray(raw)
+                cv2.resize(gray, dsize=size, interpolation=cv2.INTER_CUBIC)
+
+    print("%-14s %10s %16s" % ("Buffers", "Median ms", "Peak traced MB"))
+    for name, pooled in [("New arrays", False), ("Buffer pool", True)]:
+        tracemalloc.start()
+        duration, result = _time_call(lambda: poll(pooled), args.repeat)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("%-14s %10.1f %16.1f" % (name, duration / polls, peak / 1024 / 1024))
+    print("Buffer pool: %s" % BufferPool.get_stats())
+
+
+def capture_benchmark(args):
+    """Measures the capture rate of each screenshot backend on the first display.
+
+    Grabs the full display and a toolbar sized region, which is the usual size of a region
+    polled by a wait. Needs a display, e.g. Xvfb on Linux.
+    """
+    bounds = DisplayCollection[0].bounds
+    regions = [
+        bounds,
+        Rectangle(bounds.x, bounds.y, min(bounds.width, 800), min(bounds.height, 100)),
+    ]
+
+    print("%-10s %-11s %10s %8s" % ("Backend", "Size", "Median ms", "FPS"))
+    for backend, capture in _CAPTURE_FUNCTIONS.items():
+        for region in regions:
+            size = "%sx%s" % (region.width, region.height)
+            try:
+                duration, result = _time_call(lambda: capture(region), args.repeat)
+            except ScreenshotError as e:
+                print("%-10s %-11s unavailable: %s" % (backend.value, size, e))
+                break
+            print(
+                "%-10s %-11s %10.2f %8.1f"
+                % (backend.value, size, duration, 1000 / duration)
+            )
+
+
+def ocr_benchmark(args):
+    """Measures the OCR of a page of UI words with each backend.
+
+    A single pass is one image recognized in this process. A text search recognizes the
+    raw and enhanced images at scale 1 and 2, compared here in this process and on the
+    worker processes.
+    """
+    image = _create_text_image(800, 480)
+    enhanced = cv2.convertScaleAbs(image, alpha=2.0, beta=-128)
+    variants = [
+        cv2.resize(variant, None, fx=scale, fy=scale)
+        for variant in [image, enhanced]
+        for scale in [1, 2]
+    ]
+    workers = Settings.ocr_workers
+
+    print("%-12s %-24s %10s" % ("Backend", "Operation", "Median ms"))
+    for backend in [OcrBackend.TESSEROCR, OcrBackend.PYTESSERACT]:
+        if backend == OcrBackend.TESSEROCR and not ocr_engine.is_tesserocr_installed():
+            print("%-12s unavailable: tesserocr is not installed" % backend.value)
+            continue
+        Settings.ocr_backend = backend
+        measurements = [
+            ("Single pass", 1, lambda: OcrEngine.image_to_data(image)),
+            ("Text search", 1, lambda: OcrEngine.image_to_data_all(variants)),
+            (
+                "Text search, %s workers" % workers,
+                workers,
+                lambda: OcrEngine.image_to_data_all(variants),
+            ),
+        ]
+        try:
+            for name, worker_count, func in measurements:
+                Settings.ocr_workers = worker_count
+                duration, result = _time_call(func, args.repeat)
+                print("%-12s %-24s %10.1f" % (backend.value, name, duration))
+        except EnvironmentError as e:
+            print("%-12s unavailable: %s" % (backend.value, e))
+        finally:
+            Settings.ocr_workers = workers
+    OcrEngine.shutdown()
+    print("OCR engine: %s" % OcrEngine.get_stats())
+
+
+def fuzzy_benchmark(args):
+    """Compares finding the OCR words similar to a searched word with difflib and with
+    the batched matcher.
+
+    The difflib loop tries each token at decreasing cutoffs, as text searches did. The
+    batched matcher scores all tokens at once, packing them is done once per screenshot.
+    """
+    print(
+        "%-7s %-10s %-16s %10s %8s %6s"
+        % ("Tokens", "Query", "Matcher", "Median ms", "Speedup", "Found")
+    )
+    for count in TOKEN_COUNTS:
+        tokens = _create_ocr_tokens(count)
+        duration, token_array = _time_call(lambda: TokenArray(tokens), args.repeat)
+        print("%-7s %-10s %-16s %10.2f" % (count, "", "Pack tokens", duration))
+        for query in OCR_WORDS[:2] + OCR_WORDS[-1:]:
+            baseline, expected = _time_call(
+                lambda: [
+                    index
+                    for index, token in enumerate(tokens)
+                    if any(
+                        difflib.get_close_matches(query, [token], cutoff=cutoff)
+                        for cutoff in _get_cutoff_steps(query)
+                    )
+                ],
+                args.repeat,
+            )
+            duration, found = _time_call(
+                lambda: get_close_matches(
+                    query, token_array, _get_cutoff_steps(query)[-1]
+                ),
+                args.repeat,
+            )
+            for name, milliseconds, result in [
+                ("difflib", baseline, expected),
+                ("Batched", duration, found),
+            ]:
+                print(
+                    "%-7s %-10s %-16s %10.2f %7.1fx %6s"
+                    % (
+                        count,
+                        query,
+                        name,
+                        milliseconds,
+                        baseline / milliseconds,
+                        len(result),
+                    )
+                )
+
+
+def _call_at_depth(depth, func):
+    """Calls a function from a call stack of the given depth."""
+    if depth <= 0:
+        return func()
+    return _call_at_depth(depth - 1, func)
+
+
+BENCHMARKS = {
+    "match_template": match_template_benchmark,
+    "scaled_match": scaled_match_benchmark,
+    "pattern": pattern_benchmark,
+    "conversion": conversion_benchmark,
+    "buffer_pool": buffer_pool_benchmark,
+    "capture": capture_benchmark,
+    "ocr": ocr_benchmark,
+    "fuzzy": fuzzy_benchmark,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Iris performance benchmarks", prog="iris-benchmark"
+    )
+    parser.add_argument(
+        "benchmark", choices=sorted(BENCHMARKS), help="Benchmark to run"
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="Number of timed runs per measurement",
+        type=int,
+        action="store",
+        default=10,
+    )
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
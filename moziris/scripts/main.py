@@ -15,6 +15,7 @@ from mozprofile import Profile as MozProfile
 from mozrunner import FirefoxRunner
 
 
+from moziris.api.finder.pattern import compile_patterns
 from moziris.api.keyboard.key import KeyModifier
 from moziris.api.keyboard.keyboard import type
 from moziris.api.keyboard.keyboard_util import check_keyboard_state
@@ -44,6 +45,8 @@ def main():
     initialize_logger()
     migrate_data()
     validate_config_ini(args)
+    if args.compile_patterns:
+        compile_pattern_store(args)
     if verify_config(args):
         pytest_args = None
         settings = None
@@ -153,6 +156,19 @@ def get_test_params():
     return pytest_args
 
 
+def compile_pattern_store(args):
+    """Compiles the images of the target tests into a pattern store and closes Iris."""
+    if args.target is None:
+        exit_iris("No target specified, closing Iris.", status=1)
+    tests_dir = os.path.join(PathManager.get_tests_dir(), args.target)
+    if not os.path.exists(tests_dir):
+        path_warning(tests_dir)
+        exit_iris("", status=1)
+    PathManager.create_working_directory()
+    count = compile_patterns(args.target, tests_dir)
+    exit_iris("Compiled %s images for %s target." % (count, args.target), status=0)
+
+
 def verify_config(args):
     """Checks keyboard state is correct, and that Tesseract and 7zip are installed."""
     try:
@@ -0,0 +1,69 @@
+import sys
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.finder import image_search
+    from moziris.api.finder.pattern import Pattern
+    from moziris.api.screen import screenshot_image
+
+
+class FakeClock:
+    """Monotonic clock advanced only by the sleeps of the code under test."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(image_search, "time", fake_clock)
+    return fake_clock
+
+
+class FakeScreen:
+    """BGRA pixels of the first display, counting the grabs of the screenshot backends."""
+
+    def __init__(self, seed=0):
+        rng = np.random.RandomState(seed)
+        self.pixels = cv2.GaussianBlur(
+            rng.randint(0, 256, (1080, 1920, 4)).astype(np.uint8), (3, 3), 0
+        )
+        self.grabs = 0
+
+    def grab(self, region):
+        self.grabs += 1
+        x, y = int(region.x), int(region.y)
+        return self.pixels[y : y + int(region.height), x : x + int(region.width)].copy()
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    fake_screen = FakeScreen()
+    monkeypatch.setattr(screenshot_image, "_region_to_image", fake_screen.grab)
+    return fake_screen
+
+
+@pytest.fixture
+def save_pattern(tmp_path):
+    """Returns a function saving BGRA or BGR pixels as a Pattern image."""
+
+    def save(pixels, name="pattern.png"):
+        path = str(tmp_path / name)
+        cv2.imwrite(path, pixels[:, :, :3])
+        return Pattern(name, from_path=path)
+
+    return save
@@ -0,0 +1,112 @@
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.errors import FindError
+    from moziris.api.finder import finder
+    from moziris.api.finder.pattern import Pattern
+    from moziris.api.location import Location, LocationCollection
+    from moziris.api.settings import Settings
+
+
+def _pattern(name):
+    pattern = MagicMock(spec=Pattern)
+    pattern.get_filename.return_value = name
+    return pattern
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    """Screen showing the patterns of visible, a dict of patterns to their Location."""
+    screen = MagicMock()
+    screen.visible = {}
+    screen.screenshots = 0
+
+    def get_region_screenshot(region=None):
+        screen.screenshots += 1
+        return "screenshot %s" % screen.screenshots
+
+    def match_template(pattern, region, match_type, stack_image):
+        location = screen.visible.get(pattern)
+        return [] if location is None else [location]
+
+    monkeypatch.setattr(finder, "get_region_screenshot", get_region_screenshot)
+    monkeypatch.setattr(finder, "match_template", match_template)
+    monkeypatch.setattr(Settings, "highlight", False)
+    return screen
+
+
+class TestFindAny:
+    def test_first_item_in_list_order(self, screen):
+        first, second = _pattern("first.png"), _pattern("second.png")
+        screen.visible = {first: Location(1, 1), second: Location(2, 2)}
+        index, location = finder.find_any([first, second])
+        assert (index, location.x, location.y) == (0, 1, 1)
+        index, location = finder.find_any([second, first])
+        assert (index, location.x, location.y) == (0, 2, 2)
+
+    def test_later_item_and_single_screenshot(self, screen):
+        first, second = _pattern("first.png"), _pattern("second.png")
+        screen.visible = {second: Location(2, 2)}
+        index, location = finder.find_any([first, second])
+        assert index == 1
+        assert (location.x, location.y) == (2, 2)
+        assert screen.screenshots == 1
+
+    def test_nothing_found(self, screen):
+        with pytest.raises(FindError, match="first.png, second.png"):
+            finder.find_any([_pattern("first.png"), _pattern("second.png")])
+
+    def test_invalid_item(self, screen):
+        with pytest.raises(ValueError):
+            finder.find_any([_pattern("first.png"), 42])
+
+
+class TestFindAll:
+    def test_matches_in_reading_order(self, screen, monkeypatch):
+        best_first = LocationCollection(
+            [(50, 20), (10, 40), (90, 5), (10, 20)], [0.99, 0.95, 0.9, 0.85]
+        )
+        monkeypatch.setattr(
+            finder, "match_template", lambda *args, **kwargs: best_first
+        )
+        found = finder.find_all(_pattern("first.png"))
+        assert [(l.x, l.y) for l in found] == [(90, 5), (10, 20), (50, 20), (10, 40)]
+        assert list(found.scores) == [0.9, 0.85, 0.99, 0.95]
+
+
+class TestWaitAny:
+    def test_found_after_attempts(self, screen, clock, monkeypatch):
+        first, second = _pattern("first.png"), _pattern("second.png")
+
+        def sleep(seconds):
+            clock.now += seconds
+            clock.sleeps.append(seconds)
+            if len(clock.sleeps) == 2:
+                screen.visible = {second: Location(5, 5)}
+
+        monkeypatch.setattr(clock, "sleep", sleep)
+        index, location = finder.wait_any([first, second], timeout=3)
+        assert index == 1
+        assert (location.x, location.y) == (5, 5)
+        assert screen.screenshots == 3
+
+    def test_timeout(self, screen, clock, monkeypatch):
+        monkeypatch.setattr(Settings, "wait_scan_rate", 2)
+        monkeypatch.setattr(Settings, "wait_scan_backoff", False)
+        start = clock.now
+        with pytest.raises(FindError):
+            finder.wait_any([_pattern("first.png")], timeout=1.5)
+        assert clock.now - start == pytest.approx(1.5)
+        # At 0, 0.5, 1.0 and the final attempt at the deadline.
+        assert screen.screenshots == 4
+
+    def test_single_attempt_when_frozen(self, screen, clock, monkeypatch):
+        monkeypatch.setattr(finder, "is_frozen", lambda region: True)
+        with pytest.raises(FindError):
+            finder.wait_any([_pattern("first.png")], timeout=3)
+        assert screen.screenshots == 1
+        assert clock.sleeps == []
@@ -0,0 +1,116 @@
+import difflib
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.finder.fuzzy_match import (
+        TokenArray,
+        get_close_matches,
+        get_similarities,
+    )
+
+CUTOFFS = [0.6, 0.7, 0.75, 0.8, 0.9]
+
+
+def _ratio(query, token):
+    return difflib.SequenceMatcher(None, token, query).ratio()
+
+
+def _longest_common_subsequence(a, b):
+    lengths = np.zeros((len(a) + 1, len(b) + 1), dtype=int)
+    for i, a_char in enumerate(a):
+        for j, b_char in enumerate(b):
+            if a_char == b_char:
+                lengths[i + 1, j + 1] = lengths[i, j] + 1
+            else:
+                lengths[i + 1, j + 1] = max(lengths[i, j + 1], lengths[i + 1, j])
+    return lengths[-1, -1]
+
+
+def _random_texts(count, seed, alphabet="abcde1.%é"):
+    rng = np.random.RandomState(seed)
+    return [
+        "".join(alphabet[rng.randint(len(alphabet))] for _ in range(rng.randint(0, 10)))
+        for _ in range(count)
+    ]
+
+
+FIXED_PAIRS = [
+    ("Bookmarks", "Bookmarks"),
+    ("Bookmarks", "Bookmark"),
+    ("Bookmarks", "Bookkm2r2s"),
+    ("History", "Hstory"),
+    ("1.25", "1.28"),
+    ("1.25", "1.255"),
+    ("100%", "100"),
+    ("abcdefghij", "abcdefgxyz"),
+    ("Private", "etavirP"),
+    ("", ""),
+    ("Tab", ""),
+]
+
+
+class TestSimilarities:
+    def test_longest_common_subsequence(self):
+        tokens = _random_texts(300, 1)
+        for query in _random_texts(20, 2):
+            similarities = get_similarities(query, TokenArray(tokens))
+            for token, similarity in zip(tokens, similarities):
+                total = len(query) + len(token)
+                expected = (
+                    2 * _longest_common_subsequence(query, token) / total
+                    if total > 0
+                    else 1.0
+                )
+                assert similarity == pytest.approx(expected)
+
+    def test_upper_bound_of_difflib(self):
+        tokens = _random_texts(300, 3)
+        for query in _random_texts(20, 4):
+            similarities = get_similarities(query, TokenArray(tokens))
+            for token, similarity in zip(tokens, similarities):
+                assert similarity >= _ratio(query, token)
+
+    def test_indices(self):
+        tokens = TokenArray(["abc", "abd", "xyz"])
+        assert list(get_similarities("abc", tokens, [2, 0])) == [0.0, 1.0]
+        assert len(get_similarities("abc", TokenArray([]))) == 0
+
+
+class TestCloseMatches:
+    @pytest.mark.parametrize("query, token", FIXED_PAIRS)
+    @pytest.mark.parametrize("cutoff", CUTOFFS)
+    def test_fixed_pairs(self, query, token, cutoff):
+        found = get_close_matches(query, TokenArray([token]), cutoff)
+        assert (len(found) > 0) == (_ratio(query, token) >= cutoff)
+
+    @pytest.mark.parametrize("cutoff", CUTOFFS)
+    def test_random_pairs(self, cutoff):
+        tokens = _random_texts(500, 5)
+        token_array = TokenArray(tokens)
+        for query in _random_texts(30, 6):
+            found = get_close_matches(query, token_array, cutoff)
+            expected = [
+                index
+                for index, token in enumerate(tokens)
+                if _ratio(query, token) >= cutoff
+            ]
+            assert sorted(found) == expected
+
+    def test_ranked(self):
+        tokens = TokenArray(["Bkmarks", "Bookmarks", "Bookmark", "History"])
+        assert get_close_matches("Bookmarks", tokens, 0.7) == [1, 2, 0]
+        assert difflib.get_close_matches("Bookmarks", tokens.texts, cutoff=0.7) == [
+            "Bookmarks",
+            "Bookmark",
+            "Bkmarks",
+        ]
+
+    def test_indices(self):
+        tokens = TokenArray(["Tab", "Tabs", "Tab", "Window"])
+        assert get_close_matches("Tab", tokens, 0.8, indices=[3, 2, 1]) == [2, 1]
+        assert get_close_matches("Tab", tokens, 0.8, indices=[]) == []
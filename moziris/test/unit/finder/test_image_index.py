@@ -0,0 +1,41 @@
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.finder import image_index
+    from moziris.api.settings import Settings
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    index = image_index._ImageIndex()
+    index._os_directory = "osx"
+    monkeypatch.setattr(Settings, "locale", "")
+    directory = tmp_path / "images" / "osx"
+    directory.mkdir(parents=True)
+    (directory / "Home.png").write_bytes(b"")
+    return index, str(tmp_path), str(directory)
+
+
+class TestImageIndex:
+    def test_case_sensitive(self, images, monkeypatch):
+        index, module_directory, directory = images
+        monkeypatch.setattr(image_index, "CASE_INSENSITIVE_FILE_SYSTEM", False)
+        assert index.find(module_directory, "Home.png") == os.path.join(
+            directory, "Home.png"
+        )
+        assert index.find(module_directory, "home.png") is None
+
+    def test_case_insensitive(self, images, monkeypatch):
+        index, module_directory, directory = images
+        monkeypatch.setattr(image_index, "CASE_INSENSITIVE_FILE_SYSTEM", True)
+        assert index.find(module_directory, "home.PNG") == os.path.join(
+            directory, "Home.png"
+        )
+        assert index.get_images(module_directory) == [
+            os.path.join(directory, "Home.png")
+        ]
@@ -0,0 +1,205 @@
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.finder import image_search
+    from moziris.api.rectangle import Rectangle
+    from moziris.api.screen.screenshot_image import ScreenshotImage
+    from moziris.api.settings import Settings
+
+REGION = Rectangle(0, 0, 400, 300)
+
+
+class TestFreeze:
+    def test_frozen_block_reuses_one_capture(self, screen, clock, save_pattern):
+        shown = save_pattern(screen.pixels[100:140, 200:260], "shown.png")
+        hidden = save_pattern(screen.pixels[600:640, 900:960], "hidden.png")
+        with image_search.freeze(REGION):
+            location = image_search.image_find(shown, 3, REGION)
+            assert (location.x, location.y) == (200, 100)
+            assert image_search.image_find(hidden, 3, REGION) is None
+            assert image_search.image_vanish(shown, 3, REGION) is None
+            assert image_search.WaitScheduler.last_attempts == 1
+        assert screen.grabs == 1
+        assert clock.sleeps == []
+
+    def test_waits_outside_frozen_region(self, screen, clock, save_pattern):
+        hidden = save_pattern(screen.pixels[600:640, 900:960], "hidden.png")
+        with image_search.freeze(Rectangle(0, 0, 100, 100)):
+            assert image_search.image_find(hidden, 1, REGION) is None
+        assert screen.grabs > 2
+        assert sum(clock.sleeps) == 1
+
+
+def _attempt_times(clock, scheduler, success_at=None):
+    times = []
+    while scheduler.next_attempt():
+        times.append(clock.now - 1000.0)
+        if len(times) == success_at:
+            break
+    return times
+
+
+class TestWaitScheduler:
+    def test_attempts_paced_by_scan_rate(self, clock):
+        scheduler = image_search.WaitScheduler("test", 1, scan_rate=4, backoff=False)
+        times = _attempt_times(clock, scheduler)
+        assert times == pytest.approx([0, 0.25, 0.5, 0.75, 1])
+
+    def test_final_attempt_at_deadline(self, clock):
+        scheduler = image_search.WaitScheduler("test", 1, scan_rate=3, backoff=False)
+        times = _attempt_times(clock, scheduler)
+        assert times == pytest.approx([0, 1 / 3, 2 / 3, 1])
+        assert clock.now - 1000.0 == pytest.approx(1)
+
+    def test_slow_attempt_is_not_delayed(self, clock):
+        scheduler = image_search.WaitScheduler("test", 2, scan_rate=2, backoff=False)
+        assert scheduler.next_attempt()
+        clock.now += 0.8
+        assert scheduler.next_attempt()
+        assert clock.sleeps == []
+        assert scheduler.remaining() == pytest.approx(1.2)
+
+    def test_zero_timeout_makes_one_attempt(self, clock):
+        scheduler = image_search.WaitScheduler("test", 0, scan_rate=3, backoff=False)
+        assert _attempt_times(clock, scheduler) == [0]
+        assert clock.sleeps == []
+
+    def test_backoff_grows_interval_up_to_maximum(self, clock):
+        scheduler = image_search.WaitScheduler("test", 5, scan_rate=4, backoff=True)
+        times = _attempt_times(clock, scheduler)
+        intervals = [second - first for first, second in zip(times, times[1:])]
+        assert intervals[:4] == pytest.approx([0.375, 0.5625, 0.84375, 1.0])
+        assert max(intervals) == pytest.approx(image_search.WAIT_BACKOFF_MAX_INTERVAL)
+        assert times[-1] == pytest.approx(5)
+
+    def test_finish_records_attempts(self, clock):
+        scheduler = image_search.WaitScheduler("test", 3, scan_rate=3, backoff=False)
+        _attempt_times(clock, scheduler, success_at=2)
+        assert scheduler.finish(True) is True
+        assert image_search.WaitScheduler.last_attempts == 2
+
+
+def _area(rectangle):
+    if rectangle is None:
+        return None
+    return rectangle.x, rectangle.y, rectangle.width, rectangle.height
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Search areas of the match_template calls of image_find and image_vanish."""
+    search_areas = []
+    match_template = image_search.match_template
+
+    def spy(pattern, region, match_type, stack_image, search_area=None):
+        search_areas.append(_area(search_area))
+        return match_template(pattern, region, match_type, stack_image, search_area)
+
+    monkeypatch.setattr(image_search, "match_template", spy)
+    return search_areas
+
+
+def _change_screen_at_sleep(clock, monkeypatch, change, sleep_count=1):
+    """Applies a change to the screen during a sleep of the waiting operation."""
+    sleep = clock.sleep
+
+    def sleep_and_change(seconds):
+        sleep(seconds)
+        if len(clock.sleeps) == sleep_count:
+            change()
+
+    monkeypatch.setattr(clock, "sleep", sleep_and_change)
+
+
+class TestChangedArea:
+    def test_unchanged_frames(self, screen):
+        first = ScreenshotImage(REGION)
+        second = ScreenshotImage(REGION)
+        assert image_search._get_changed_area(first, second) is None
+
+    def test_local_change(self, screen):
+        first = ScreenshotImage(REGION)
+        screen.pixels[50:60, 100:120] = 255 - screen.pixels[50:60, 100:120]
+        second = ScreenshotImage(REGION)
+        assert _area(image_search._get_changed_area(first, second)) == (100, 50, 20, 10)
+
+    def test_change_below_minimum(self, screen, monkeypatch):
+        monkeypatch.setattr(Settings, "observe_min_changed_pixels", 50)
+        first = ScreenshotImage(REGION)
+        screen.pixels[50:55, 100:109] = 255 - screen.pixels[50:55, 100:109]
+        second = ScreenshotImage(REGION)
+        assert image_search._get_changed_area(first, second) is None
+
+    def test_different_sizes(self, screen):
+        first = ScreenshotImage(REGION)
+        second = ScreenshotImage(Rectangle(0, 0, 200, 100))
+        assert _area(image_search._get_changed_area(first, second)) == (0, 0, 200, 100)
+
+
+class TestChangeGatedSearch:
+    def test_unchanged_region_is_not_searched_again(
+        self, screen, clock, save_pattern, searches
+    ):
+        hidden = save_pattern(screen.pixels[600:640, 900:960])
+        assert image_search.image_find(hidden, 1, REGION) is None
+        assert screen.grabs > 2
+        assert searches == [None]
+
+    def test_search_limited_to_changed_area(
+        self, screen, clock, save_pattern, searches, monkeypatch
+    ):
+        pixels = screen.pixels[600:640, 900:960].copy()
+        hidden = save_pattern(pixels)
+
+        def show():
+            screen.pixels[200:240, 300:360] = pixels
+
+        _change_screen_at_sleep(clock, monkeypatch, show)
+        location = image_search.image_find(hidden, 1, REGION)
+        assert (location.x, location.y) == (300, 200)
+        # The changed pixels expanded by the pattern size, clipped to the region.
+        assert searches == [None, (241, 161, 159, 118)]
+
+    def test_vanish_ignores_changes_away_from_match(
+        self, screen, clock, save_pattern, searches, monkeypatch
+    ):
+        shown = save_pattern(screen.pixels[100:140, 200:260])
+
+        def change_elsewhere():
+            screen.pixels[250:280, 0:50] = 0
+
+        _change_screen_at_sleep(clock, monkeypatch, change_elsewhere)
+        assert image_search.image_vanish(shown, 1, REGION) is None
+        assert searches == [None]
+
+    def test_vanish_searches_when_match_changes(
+        self, screen, clock, save_pattern, searches, monkeypatch
+    ):
+        shown = save_pattern(screen.pixels[100:140, 200:260])
+
+        def hide():
+            screen.pixels[100:140, 200:260] = 0
+
+        _change_screen_at_sleep(clock, monkeypatch, hide)
+        assert image_search.image_vanish(shown, 1, REGION) is True
+        assert searches == [None, None]
+
+
+class TestColorPatterns:
+    def test_exact_crop_matches_screenshot(self, screen, save_pattern):
+        # Blue and red differ on every pixel, so swapped channel weights change the gray.
+        screen.pixels[100:140, 200:260, 0] = 230
+        screen.pixels[100:140, 200:260, 2] = 20
+        pattern = save_pattern(screen.pixels[100:140, 200:260])
+        stack_image = ScreenshotImage(REGION)
+        assert np.array_equal(
+            pattern.get_gray_array(), stack_image.get_gray_array()[100:140, 200:260]
+        )
+        found = image_search.match_template(pattern, REGION, stack_image=stack_image)
+        assert (found[0].x, found[0].y) == (200, 100)
+        assert found.scores[0] == pytest.approx(1.0, abs=1e-4)
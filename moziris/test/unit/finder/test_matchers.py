@@ -0,0 +1,189 @@
+import cv2
+import numpy as np
+import pytest
+
+from moziris.api.enums import MatchTemplateType
+from moziris.api.finder import matchers
+
+# Largest score difference allowed between a backend and cv2.matchTemplate.
+SCORE_TOLERANCE = 1e-3
+
+
+def _random_image(height, width, seed, channels=None):
+    rng = np.random.RandomState(seed)
+    shape = (height, width) if channels is None else (height, width, channels)
+    return cv2.GaussianBlur(rng.randint(0, 256, shape).astype(np.uint8), (3, 3), 0)
+
+
+def _flat_image(height, width, seed):
+    """Random image with large areas of a single color, giving flat matching windows."""
+    image = _random_image(height, width, seed)
+    image[: height // 2, :] = 128
+    image[:, : width // 3] = 0
+    return image
+
+
+def _images():
+    image = _random_image(120, 160, 1)
+    yield "random", image, image[40:64, 70:102].copy()
+    color = _random_image(120, 160, 2, channels=3)
+    yield "color", color, color[30:50, 20:60].copy()
+    flat = _flat_image(120, 160, 3)
+    yield "flat", flat, flat[80:104, 100:130].copy()
+
+
+def _opencv_result(image, template):
+    return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+
+
+class TestMatcherScores:
+    @pytest.mark.parametrize("name, image, template", list(_images()))
+    def test_fft_result(self, name, image, template):
+        res = matchers._fft_ccoeff_normed(image, template)
+        expected = _opencv_result(image, template)
+        assert res.shape == expected.shape
+        assert np.abs(res - expected).max() < SCORE_TOLERANCE, name
+
+    @pytest.mark.parametrize("name, image, template", list(_images()))
+    def test_numpy_result(self, name, image, template):
+        res = matchers._numpy_ccoeff_normed(image, template)
+        expected = _opencv_result(image, template)
+        assert res.shape == expected.shape
+        assert np.abs(res - expected).max() < SCORE_TOLERANCE, name
+
+    @pytest.mark.parametrize("name, image, template", list(_images()))
+    @pytest.mark.parametrize(
+        "matcher", [matchers.match_fft, matchers.match_umat, matchers.match_numpy]
+    )
+    def test_matches(self, name, image, template, matcher):
+        for match_type in [MatchTemplateType.SINGLE, MatchTemplateType.MULTIPLE]:
+            positions, scores = matcher(image, template, 0.8, match_type)
+            expected_positions, expected_scores = matchers.match_opencv(
+                image, template, 0.8, match_type
+            )
+            assert np.array_equal(positions, expected_positions), name
+            assert np.abs(scores - expected_scores).max() < SCORE_TOLERANCE, name
+
+
+class TestPeaks:
+    def test_peaks_are_local_maxima(self):
+        template = np.zeros((10, 10), np.uint8)
+        res = np.zeros((50, 50), np.float32)
+        res[10, 10], res[11, 11], res[10, 12] = 0.95, 0.9, 0.92
+        res[30, 40] = 0.85
+        res[31, 41] = 0.5
+
+        positions, scores = matchers._get_peaks(res, template, 0.8)
+        assert sorted(map(tuple, positions)) == [(10, 10), (40, 30)]
+        assert sorted(scores) == pytest.approx([0.85, 0.95])
+
+    def test_no_peak_below_precision(self):
+        res = np.full((20, 20), 0.5, np.float32)
+        positions, scores = matchers._get_peaks(res, np.zeros((4, 4)), 0.8)
+        assert len(positions) == 0 and len(scores) == 0
+
+    def test_plateau_is_suppressed(self):
+        template = np.zeros((10, 10), np.uint8)
+        res = np.zeros((50, 50), np.float32)
+        res[20:23, 20:23] = 0.9
+        positions, scores = matchers._select_peaks(
+            *matchers._get_peaks(res, template, 0.8), template
+        )
+        assert len(positions) == 1
+        assert scores[0] == pytest.approx(0.9)
+
+    def test_best_first_and_limited(self):
+        template = np.zeros((4, 4), np.uint8)
+        res = np.zeros((40, 40), np.float32)
+        res[5, 5], res[20, 20], res[35, 35] = 0.85, 0.99, 0.9
+        positions, scores = matchers._select_peaks(
+            *matchers._get_peaks(res, template, 0.8), template, max_results=2
+        )
+        assert [tuple(p) for p in positions] == [(20, 20), (35, 35)]
+        assert list(scores) == pytest.approx([0.99, 0.9])
+
+    @pytest.mark.parametrize("max_results", [None, 50])
+    def test_same_as_greedy_suppression(self, max_results):
+        template = np.zeros((12, 16), np.uint8)
+        res = np.random.RandomState(6).rand(120, 160).astype(np.float32)
+        ys, xs = np.nonzero(res >= 0.5)
+        positions, scores = np.column_stack((xs, ys)), res[ys, xs]
+        expected = _greedy_suppression(positions, scores, 8, 6, max_results)
+        selected, selected_scores = matchers._select_peaks(
+            positions, scores, template, max_results
+        )
+        assert [tuple(p) for p in selected] == expected
+        assert np.all(np.diff(selected_scores) <= 0)
+
+    def test_large_plateau(self):
+        template = np.zeros((20, 20), np.uint8)
+        res = np.full((1061, 1901), 0.9, np.float32)
+        positions, scores = matchers._select_peaks(
+            *matchers._get_peaks(res, template, 0.8), template
+        )
+        # A grid of positions 10 pixels apart, from the top left corner.
+        assert len(positions) == 191 * 107
+        assert [tuple(p) for p in positions[:3]] == [(0, 0), (10, 0), (20, 0)]
+        assert tuple(positions[191]) == (0, 10)
+
+
+def _greedy_suppression(positions, scores, min_dx, min_dy, max_results):
+    """Reference non-maximum suppression, checking each position against the kept ones."""
+    kept = []
+    for index in np.argsort(-scores, kind="stable"):
+        x, y = positions[index]
+        if all(abs(x - kx) >= min_dx or abs(y - ky) >= min_dy for kx, ky in kept):
+            kept.append((x, y))
+            if len(kept) == max_results:
+                break
+    return kept
+
+
+def _ui_frame(width, height, seed):
+    """Textured frame with UI-like boxes and labels, giving keypoints to match."""
+    rng = np.random.RandomState(seed)
+    frame = _random_image(height, width, seed)
+    for _ in range(int(width * height / 20000)):
+        x, y = rng.randint(0, width), rng.randint(0, height)
+        color = int(rng.randint(0, 256))
+        cv2.rectangle(
+            frame, (x, y), (x + rng.randint(8, 120), y + rng.randint(8, 40)), color, -1
+        )
+        cv2.putText(
+            frame, "Iris", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 255 - color, 1
+        )
+    return frame
+
+
+class TestFeatures:
+    @pytest.mark.parametrize("size, x, y", [(96, 715, 645), (160, 300, 200)])
+    def test_exact_copy_is_found(self, size, x, y):
+        frame = _ui_frame(1920, 1080, 0)
+        pattern = frame[y : y + size, x : x + size].copy()
+        positions, scores = matchers.match_features(
+            frame, pattern, 0.9, MatchTemplateType.SINGLE
+        )
+        assert [tuple(p) for p in positions] == [(x, y)]
+        assert scores[0] > 0.99
+
+    def test_scale_close_to_one_is_snapped(self, monkeypatch):
+        frame = _random_image(300, 400, 4)
+        pattern = frame[100:196, 150:246].copy()
+        monkeypatch.setattr(
+            matchers, "_estimate_scale", lambda image, template: (0.988, 151.0, 99.0)
+        )
+        positions, scores = matchers.match_features(
+            frame, pattern, 0.9, MatchTemplateType.SINGLE
+        )
+        assert [tuple(p) for p in positions] == [(150, 100)]
+
+    def test_unverified_estimate_falls_back_to_pattern_size(self, monkeypatch):
+        frame = _random_image(300, 400, 5)
+        pattern = frame[40:88, 200:248].copy()
+        monkeypatch.setattr(
+            matchers, "_estimate_scale", lambda image, template: (1.6, 10.0, 10.0)
+        )
+        positions, scores = matchers.match_features(
+            frame, pattern, 0.9, MatchTemplateType.SINGLE
+        )
+        assert [tuple(p) for p in positions] == [(200, 40)]
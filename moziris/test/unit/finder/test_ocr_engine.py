@@ -0,0 +1,67 @@
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.finder import ocr_engine
+    from moziris.api.settings import Settings
+
+
+class FakeExecutor:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def shutdown(self, wait=True):
+        pass
+
+
+@pytest.fixture
+def no_limit(monkeypatch):
+    monkeypatch.delenv("OMP_THREAD_LIMIT", raising=False)
+
+
+class TestWorkers:
+    def test_pool_workers_set_thread_limit(self, monkeypatch, no_limit):
+        monkeypatch.setattr(ocr_engine, "ProcessPoolExecutor", FakeExecutor)
+        monkeypatch.setattr(ocr_engine.os, "cpu_count", lambda: 8)
+        monkeypatch.setattr(Settings, "ocr_workers", 3)
+        pool = ocr_engine._OcrEngine()._get_pool(4)
+        assert pool.kwargs["max_workers"] == 3
+        assert pool.kwargs["initializer"] is ocr_engine._init_worker
+        assert pool.kwargs["mp_context"].get_start_method() == "spawn"
+        assert "OMP_THREAD_LIMIT" not in os.environ
+
+    def test_worker_environment(self, no_limit):
+        ocr_engine._init_worker()
+        assert os.environ["OMP_THREAD_LIMIT"] == str(ocr_engine.OCR_WORKER_THREAD_LIMIT)
+
+    def test_single_worker_runs_in_process(self, monkeypatch):
+        monkeypatch.setattr(Settings, "ocr_workers", 1)
+        assert ocr_engine._OcrEngine()._get_pool(4) is None
+
+
+class TestTesserocrImport:
+    def test_missing_tesserocr(self, monkeypatch):
+        monkeypatch.setattr(ocr_engine, "_tesserocr_found", False)
+        monkeypatch.setattr(ocr_engine, "_tesserocr", None)
+        monkeypatch.setattr(ocr_engine, "_tesserocr_error", None)
+        monkeypatch.setattr(Settings, "ocr_backend", ocr_engine.OcrBackend.AUTO)
+        assert not ocr_engine.is_tesserocr_installed()
+        assert ocr_engine.OcrEngine.get_backend() == ocr_engine.OcrBackend.PYTESSERACT
+        with pytest.raises(ImportError):
+            ocr_engine._import_tesserocr()
+
+    def test_failed_import_is_not_retried(self, monkeypatch):
+        monkeypatch.setattr(ocr_engine, "_tesserocr_found", True)
+        monkeypatch.setattr(ocr_engine, "_tesserocr", None)
+        monkeypatch.setattr(ocr_engine, "_tesserocr_error", None)
+        monkeypatch.setitem(sys.modules, "tesserocr", None)
+        with pytest.raises(ImportError):
+            ocr_engine._import_tesserocr()
+        assert not ocr_engine.is_tesserocr_installed()
+        monkeypatch.delitem(sys.modules, "tesserocr")
+        with pytest.raises(ImportError, match="Unable to import"):
+            ocr_engine._import_tesserocr()
@@ -0,0 +1,75 @@
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.finder import pattern_cache
+    from moziris.api.settings import Settings
+
+# Gray images of a quarter of a megabyte, four of them fit in a cache of one megabyte.
+IMAGE_SIZE = 512
+
+
+def _image():
+    return pattern_cache.PatternImage(
+        None, None, np.zeros((IMAGE_SIZE, IMAGE_SIZE), np.uint8)
+    )
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(Settings, "pattern_cache_size", 1)
+    return pattern_cache._PatternCache()
+
+
+def _load(cache, name, loads):
+    def load():
+        loads.append(name)
+        return _image()
+
+    return cache.get(name, 1, load)
+
+
+class TestPatternCache:
+    def test_hits_and_misses(self, cache):
+        loads = []
+        first = _load(cache, "first.png", loads)
+        assert _load(cache, "first.png", loads) is first
+        assert cache.get("first.png", 2, _image) is not first
+        assert loads == ["first.png"]
+        stats = cache.get_stats()
+        assert (stats["hits"], stats["misses"], stats["images"]) == (1, 2, 2)
+        assert stats["bytes"] == 2 * IMAGE_SIZE * IMAGE_SIZE
+
+    def test_least_recently_used_is_evicted(self, cache):
+        loads = []
+        for name in ["a.png", "b.png", "c.png", "d.png"]:
+            _load(cache, name, loads)
+        assert cache.is_full()
+        _load(cache, "a.png", loads)
+        _load(cache, "e.png", loads)
+        assert ("b.png", 1) not in cache
+        assert all((name, 1) in cache for name in ["a.png", "c.png", "d.png", "e.png"])
+
+        _load(cache, "f.png", loads)
+        assert ("c.png", 1) not in cache
+        assert cache.get_stats()["evictions"] == 2
+        assert cache.nbytes == 4 * IMAGE_SIZE * IMAGE_SIZE
+
+        _load(cache, "b.png", loads)
+        assert loads == ["a.png", "b.png", "c.png", "d.png", "e.png", "f.png", "b.png"]
+
+    def test_image_larger_than_cache_is_kept(self, cache, monkeypatch):
+        monkeypatch.setattr(Settings, "pattern_cache_size", 0)
+        image = _load(cache, "a.png", [])
+        assert _load(cache, "a.png", []) is image
+        _load(cache, "b.png", [])
+        assert ("a.png", 1) not in cache
+        assert cache.get_stats()["images"] == 1
+
+    def test_arrays_are_read_only(self):
+        with pytest.raises(ValueError):
+            _image().gray_array[0, 0] = 1
@@ -0,0 +1,92 @@
+import os
+import sys
+from argparse import Namespace
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.finder import pattern, pattern_store
+    from moziris.api.settings import Settings
+
+TARGET = "sample"
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    # work_dir is a read only property of the Settings class.
+    monkeypatch.setattr(type(Settings), "work_dir", str(tmp_path))
+    monkeypatch.setattr(
+        pattern_store, "get_core_args", lambda: Namespace(target=TARGET)
+    )
+    return tmp_path
+
+
+def _store_files(work_dir):
+    return sorted(os.listdir(str(work_dir / pattern_store.STORE_DIR_NAME)))
+
+
+def _write_images(directory, seed):
+    rng = np.random.RandomState(seed)
+    images = directory / "tests" / "images"
+    images.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, shape in [("button.png", (17, 31, 3)), ("icon@2x.png", (40, 40, 3))]:
+        path = str(images / name)
+        cv2.imwrite(path, rng.randint(0, 256, shape).astype(np.uint8))
+        paths.append(path)
+    return paths
+
+
+class TestPatternStore:
+    def test_compiled_arrays_are_loaded(self, work_dir):
+        paths = _write_images(work_dir, 0)
+        assert pattern.compile_patterns(TARGET, str(work_dir)) == 2
+
+        store = pattern_store._PatternStore()
+        for path, scale in zip(paths, [1, 2.0]):
+            stored = store.get(path)
+            assert stored["scale"] == scale
+            decoded = pattern._decode_image(path, scale)
+            for name, array in zip(["rgb", "color", "gray"], decoded):
+                assert np.array_equal(stored[name], array)
+                assert np.shares_memory(stored[name], store._data)
+                assert not stored[name].flags.writeable
+        assert store.hits == 2
+
+    def test_changed_image_is_not_used(self, work_dir):
+        path = _write_images(work_dir, 0)[0]
+        pattern.compile_patterns(TARGET, str(work_dir))
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        store = pattern_store._PatternStore()
+        assert store.get(path) is None
+        assert store.misses == 1
+
+    def test_store_is_replaced_while_mapped(self, work_dir):
+        paths = _write_images(work_dir, 0)
+        pattern.compile_patterns(TARGET, str(work_dir))
+        mapped = pattern_store._PatternStore().get(paths[0])["rgb"]
+        previous = mapped.copy()
+
+        _write_images(work_dir, 1)
+        pattern.compile_patterns(TARGET, str(work_dir))
+        stored = pattern_store._PatternStore().get(paths[0])
+        assert np.array_equal(stored["rgb"], pattern._decode_image(paths[0], 1)[0])
+        assert not np.array_equal(stored["rgb"], previous)
+        # The previous mapping still reads the previous pixels.
+        assert np.array_equal(mapped, previous)
+        assert len([f for f in _store_files(work_dir) if f.endswith(".npy")]) == 1
+
+    def test_store_of_other_target_is_kept(self, work_dir):
+        _write_images(work_dir, 0)
+        pattern.compile_patterns(TARGET + ".beta", str(work_dir))
+        pattern.compile_patterns(TARGET, str(work_dir))
+        pattern.compile_patterns(TARGET, str(work_dir))
+        files = _store_files(work_dir)
+        assert len(files) == 4
+        assert TARGET + ".json" in files and TARGET + ".beta.json" in files
@@ -0,0 +1,210 @@
+import difflib
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Settings parses the command line when it is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.enums import OcrBackend
+    from moziris.api.finder import text_search
+    from moziris.api.finder.fuzzy_match import TokenArray, get_close_matches
+    from moziris.api.rectangle import Rectangle
+    from moziris.api.settings import Settings
+
+
+def _difflib_match(word, token):
+    """Matching of an OCR word with difflib at every cutoff step."""
+    return any(
+        difflib.get_close_matches(word, [token], cutoff=cutoff)
+        for cutoff in text_search._get_cutoff_steps(word)
+    )
+
+
+def _batched_match(word, token):
+    return (
+        len(get_close_matches(word, TokenArray([token]), text_search._get_cutoff(word)))
+        > 0
+    )
+
+
+def _ocr_pairs(count, seed):
+    rng = np.random.RandomState(seed)
+    words = ["Bookmarks", "History", "Settings", "1.25", "100%", "3,5", "Tab"]
+    characters = "abcdefghiklmnorstuBHST0123589.,%"
+    for _ in range(count):
+        word = words[rng.randint(len(words))]
+        token = list(word)
+        for _ in range(rng.randint(0, 4)):
+            position = rng.randint(len(token))
+            if rng.randint(2) == 0:
+                token[position] = characters[rng.randint(len(characters))]
+            else:
+                token.insert(position, characters[rng.randint(len(characters))])
+        yield word, "".join(token)
+
+
+class TestCutoffs:
+    def test_cutoff_floors(self):
+        assert 0.7 < text_search._get_cutoff("Bookmarks") < 0.7001
+        assert 0.7999 < text_search._get_cutoff("1.25") <= 0.8
+        assert text_search._get_cutoff("100%") == text_search._get_cutoff("1.25")
+
+    @pytest.mark.parametrize(
+        "word, token, expected",
+        [
+            ("1.25", "1.25", True),
+            ("1.25", "1.28", False),
+            ("1.25", "1.255", True),
+            ("12345", "12346", True),
+            ("100%", "100", True),
+            ("Bookmarks", "Bookmark", True),
+            ("Bookmarks", "Bkmx", False),
+            ("abcdefghij", "abcdefgxyz", False),
+            ("Bookmarks", "Bookkm2r2s", False),
+        ],
+    )
+    def test_fixed_pairs(self, word, token, expected):
+        assert _difflib_match(word, token) is expected
+        assert _batched_match(word, token) is expected
+
+    def test_random_pairs(self):
+        for word, token in _ocr_pairs(2000, 0):
+            assert _batched_match(word, token) == _difflib_match(word, token), (
+                word,
+                token,
+            )
+
+
+@pytest.fixture
+def ocr_cache(monkeypatch):
+    monkeypatch.setattr(Settings, "ocr_cache_size", 2)
+    monkeypatch.setattr(Settings, "ocr_backend", OcrBackend.PYTESSERACT)
+    return text_search._OcrCache()
+
+
+class Loads:
+    """OCR function counting its calls, returning a new result each time."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return "words %s" % self.count
+
+
+def _screenshot(seed):
+    return np.random.RandomState(seed).randint(0, 256, (30, 40)).astype(np.uint8)
+
+
+class TestOcrCache:
+    def test_same_pixels_hit(self, ocr_cache):
+        load = Loads()
+        assert ocr_cache.get(_screenshot(0), load) == "words 1"
+        assert ocr_cache.get(_screenshot(0).copy(), load) == "words 1"
+        assert load.count == 1
+        stats = ocr_cache.get_stats()
+        assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+    def test_changed_pixel_misses(self, ocr_cache):
+        load = Loads()
+        screenshot = _screenshot(0)
+        ocr_cache.get(screenshot, load)
+        screenshot[12, 7] ^= 1
+        assert ocr_cache.get(screenshot, load) == "words 2"
+        assert ocr_cache.get(screenshot.reshape(40, 30), load) == "words 3"
+        assert ocr_cache.get_stats()["misses"] == 3
+
+    def test_backend_is_part_of_the_key(self, ocr_cache, monkeypatch):
+        load = Loads()
+        ocr_cache.get(_screenshot(0), load)
+        monkeypatch.setattr(Settings, "ocr_backend", OcrBackend.TESSEROCR)
+        assert ocr_cache.get(_screenshot(0), load) == "words 2"
+
+    def test_least_recently_used_is_evicted(self, ocr_cache):
+        load = Loads()
+        ocr_cache.get(_screenshot(0), load)
+        ocr_cache.get(_screenshot(1), load)
+        ocr_cache.get(_screenshot(0), load)
+        ocr_cache.get(_screenshot(2), load)
+        assert ocr_cache.get_stats()["evictions"] == 1
+        assert ocr_cache.get_stats()["entries"] == 2
+        assert ocr_cache.get(_screenshot(0), load) == "words 1"
+        assert ocr_cache.get(_screenshot(1), load) == "words 4"
+        assert load.count == 4
+
+    def test_disabled(self, ocr_cache, monkeypatch):
+        monkeypatch.setattr(Settings, "ocr_cache_size", 0)
+        load = Loads()
+        ocr_cache.get(_screenshot(0), load)
+        ocr_cache.get(_screenshot(0), load)
+        assert load.count == 2
+        assert ocr_cache.get_stats()["entries"] == 0
+
+
+def _ocr_row(text, left, top, width=30, height=12, line=1, scale=1, conf="90"):
+    """Row of the Tesseract TSV output, followed by the scale of the image."""
+    return ("5", "1", "1", "1", str(line), "1", str(left), str(top), str(width),
+            str(height), conf, text, scale)  # fmt: skip
+
+
+def _is_next_word(previous, rectangle):
+    """Condition of the linear scan of all words that the table replaces."""
+    return (previous.x + previous.width + 10 >= rectangle.x) and (
+        rectangle.y - 5 <= previous.y <= rectangle.y + 5
+    )
+
+
+def _next_words_by_scan(table, previous):
+    return {
+        index
+        for index, rectangle in enumerate(table.rectangles)
+        if _is_next_word(previous, rectangle)
+    }
+
+
+class TestWordTable:
+    def test_same_words_as_linear_scan(self):
+        rng = np.random.RandomState(0)
+        rows = [
+            _ocr_row("w%s" % i, rng.randint(0, 400), top, rng.randint(5, 60))
+            for i, top in enumerate(rng.choice([10, 12, 15, 16, 21, 40, 44], 80))
+        ]
+        # Words of the image scaled twice, at half their TSV coordinates.
+        rows += [_ocr_row("s%s" % i, 100 + 40 * i, 30, scale=2) for i in range(5)]
+        table = text_search._WordTable(rows)
+        assert len(table) == 85
+        for previous in table.rectangles + [Rectangle(380, 13, 40, 12)]:
+            next_words = table.get_next_words(previous)
+            assert len(next_words) == len(set(next_words))
+            assert set(next_words) == _next_words_by_scan(table, previous)
+
+    def test_nearest_first(self):
+        table = text_search._WordTable(
+            [
+                _ocr_row("far", 100, 10),
+                _ocr_row("first", 0, 10),
+                _ocr_row("next", 40, 14),
+                _ocr_row("gap", 50, 6),
+                _ocr_row("below", 40, 16),
+                _ocr_row("after_gap", 41, 10),
+                _ocr_row("nearest", 35, 12),
+            ]
+        )
+        assert table.get_next_words(table.rectangles[1]) == [6, 2, 1]
+
+    def test_last_word(self):
+        table = text_search._WordTable(
+            [_ocr_row("first", 0, 10), _ocr_row("last", 40, 10)]
+        )
+        assert table.get_next_words(table.rectangles[1]) == [1, 0]
+        assert table.get_next_words(Rectangle(0, 100, 30, 12)) == []
+
+    def test_invalid_rows_are_skipped(self):
+        table = text_search._WordTable(
+            [_ocr_row("word", 0, 10), _ocr_row("bad", "x", 10), _ocr_row("", 5, 5)]
+        )
+        assert table.texts == ["word", ""]
+        assert text_search._WordTable([]).get_next_words(Rectangle(0, 0, 1, 1)) == []
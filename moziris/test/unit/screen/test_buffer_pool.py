@@ -0,0 +1,88 @@
+import sys
+from unittest.mock import patch
+
+import numpy as np
+
+# Settings parses the command line when moziris.api is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.rectangle import Rectangle
+    from moziris.api.screen import buffer_pool, screenshot_image
+    from moziris.api.screen.screenshot_image import ScreenshotImage
+
+REGION = Rectangle(0, 0, 40, 30)
+
+
+class TestBufferPool:
+    def test_released_buffer_is_reused(self):
+        pool = buffer_pool._BufferPool()
+        first = pool.acquire((10, 20))
+        pool.release(first)
+        assert pool.acquire((10, 20)) is first
+        assert (pool.hits, pool.misses) == (1, 1)
+
+    def test_shapes_and_types_are_not_mixed(self):
+        pool = buffer_pool._BufferPool()
+        first = pool.acquire((10, 20))
+        pool.release(first)
+        assert pool.acquire((20, 10)) is not first
+        assert pool.acquire((10, 20), np.float32) is not first
+        assert pool.acquire((10, 20)) is first
+
+    def test_referenced_buffer_is_not_reused(self):
+        pool = buffer_pool._BufferPool()
+        kept = pool.acquire((10, 20))
+        pool.release_unused([kept])
+        assert pool.acquire((10, 20)) is not kept
+        assert pool.hits == 0
+
+    def test_unreferenced_buffer_is_reused(self):
+        pool = buffer_pool._BufferPool()
+        buffers = [pool.acquire((10, 20))]
+        buffer_id = id(buffers[0])
+        pool.release_unused(buffers)
+        assert buffers == []
+        assert id(pool.acquire((10, 20))) == buffer_id
+        assert pool.hits == 1
+
+    def test_free_buffers_are_limited(self):
+        pool = buffer_pool._BufferPool()
+        arrays = [
+            pool.acquire((4, 4)) for _ in range(buffer_pool.POOL_MAX_FREE_BUFFERS + 2)
+        ]
+        for array in arrays:
+            pool.release(array)
+        assert len(pool._free[((4, 4), np.dtype(np.uint8))]) == (
+            buffer_pool.POOL_MAX_FREE_BUFFERS
+        )
+
+    def test_collected_buffers_are_forgotten(self):
+        pool = buffer_pool._BufferPool()
+        array = pool.acquire((100, 100))
+        assert pool.bytes == pool.peak_bytes == 10000
+        del array
+        assert pool.bytes == 0
+        assert pool.get_stats()["peak_bytes"] == 10000
+
+
+class TestScreenshotBuffers:
+    def test_array_kept_by_caller(self, monkeypatch):
+        monkeypatch.setattr(
+            screenshot_image,
+            "_region_to_image",
+            lambda region: np.zeros((30, 40, 4), np.uint8),
+        )
+        kept = ScreenshotImage(REGION).get_gray_array()
+        kept[:] = 7
+        assert ScreenshotImage(REGION).get_gray_array() is not kept
+        assert np.all(kept == 7)
+
+    def test_array_of_dropped_screenshot(self, monkeypatch):
+        monkeypatch.setattr(
+            screenshot_image,
+            "_region_to_image",
+            lambda region: np.zeros((30, 40, 4), np.uint8),
+        )
+        image = ScreenshotImage(REGION)
+        array_id = id(image.get_gray_array())
+        del image
+        assert id(ScreenshotImage(REGION).get_gray_array()) == array_id
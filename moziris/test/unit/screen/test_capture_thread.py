@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Settings parses the command line when moziris.api is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.errors import ScreenshotError
+    from moziris.api.screen import capture_thread, screenshot_image
+
+FPS = 100
+
+
+class StubGrab:
+    """Grab function numbering its screenshots, the pixels of each are its number."""
+
+    def __init__(self):
+        self.count = 0
+        self.fail = False
+        self.lock = threading.Lock()
+
+    def __call__(self, region):
+        if self.fail:
+            raise ScreenshotError("Stub failure.")
+        with self.lock:
+            self.count += 1
+            return np.full((4, 6, 4), self.count % 256, np.uint8)
+
+
+@pytest.fixture
+def grab(monkeypatch):
+    stub_grab = StubGrab()
+    monkeypatch.setattr(screenshot_image, "_region_to_image", stub_grab)
+    return stub_grab
+
+
+@pytest.fixture
+def capture(grab, monkeypatch):
+    # Wait up to half a second for a frame, so a slow machine doesn't miss it.
+    monkeypatch.setattr(capture_thread, "FRAME_WAIT_INTERVALS", FPS // 2)
+    thread = capture_thread._CaptureThread()
+    yield thread
+    thread.stop()
+
+
+class TestCaptureThread:
+    def test_frames_are_grabbed_after_the_request(self, capture, grab):
+        capture.start(FPS, 3)
+        after = time.monotonic()
+        frame = capture.get_frame(0, after)
+        assert frame.timestamp > after
+        newer = capture.get_frame(0, frame.timestamp)
+        assert newer.timestamp > frame.timestamp
+        assert newer.get_gray_array()[0, 0] != frame.get_gray_array()[0, 0]
+        assert capture.hits == 2
+
+    def test_buffered_frames(self, capture):
+        capture.start(FPS, 3)
+        capture.get_frame(0, time.monotonic())
+        newest = capture.get_frame(0, time.monotonic())
+        frames = capture.get_frames(0)
+        assert len(frames) <= 3
+        timestamps = [frame.timestamp for frame in frames]
+        assert timestamps == sorted(timestamps)
+        assert (
+            capture.get_frames(0, newest.timestamp)
+            == frames[frames.index(newest) + 1 :]
+        )
+
+    def test_stop_joins_the_thread(self, capture, grab):
+        capture.start(FPS, 3)
+        thread = capture._thread
+        capture.get_frame(0, time.monotonic())
+        capture.stop()
+        assert not thread.is_alive()
+        assert not capture.is_running()
+        count = grab.count
+        time.sleep(3.0 / FPS)
+        assert grab.count == count
+        assert capture.get_frame(0, 0) is None
+        assert capture.get_frames(0) == []
+
+    def test_failed_grabs(self, capture, grab):
+        grab.fail = True
+        capture.start(FPS, 3)
+        assert capture.get_frame(0, time.monotonic()) is None
+        assert capture.failures > 0
+        assert capture.misses == 1
+
+    def test_invalid_rate(self, capture):
+        with pytest.raises(ValueError):
+            capture.start(0)
+        assert not capture.is_running()
@@ -0,0 +1,118 @@
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Settings parses the command line when moziris.api is imported.
+with patch.object(sys, "argv", ["iris", "sample", "-n"]):
+    from moziris.api.screen import screenshot_image, x11_shm
+
+DISPLAY = 42
+
+
+class FakeSegment:
+    def __init__(self, grabber, width, height):
+        self.size = (width, height)
+        self.nbytes = width * height * 4
+        self.destroyed_with = []
+
+    def destroy(self, libraries, display):
+        self.destroyed_with.append(display)
+
+
+@pytest.fixture
+def grabber(monkeypatch):
+    x11, xext, libc = MagicMock(), MagicMock(), MagicMock()
+    x11.XOpenDisplay.return_value = DISPLAY
+    monkeypatch.setattr(x11_shm, "_load_libraries", lambda: (x11, xext, libc))
+    monkeypatch.setattr(x11_shm, "_Segment", FakeSegment)
+    return x11_shm.X11ShmGrabber()
+
+
+class TestSegments:
+    def test_released_segment_is_reused(self, grabber):
+        segment = grabber._acquire(10, 20)
+        grabber._release(segment)
+        assert grabber._acquire(20, 10) is not segment
+        assert grabber._acquire(10, 20) is segment
+        assert grabber._free_bytes == 0
+
+    def test_free_segments_of_a_size_are_limited(self, grabber):
+        segments = [
+            grabber._acquire(10, 20) for _ in range(x11_shm.SHM_MAX_FREE_SEGMENTS + 1)
+        ]
+        for segment in segments:
+            grabber._release(segment)
+        assert len(grabber._free[(10, 20)]) == x11_shm.SHM_MAX_FREE_SEGMENTS
+        assert grabber._released == [segments[-1]]
+        # Segments are only detached by the thread of the grabber, on its next grab.
+        assert segments[-1].destroyed_with == []
+        grabber._recycle()
+        assert segments[-1].destroyed_with == [DISPLAY]
+        assert grabber._released == []
+
+    def test_least_recently_released_size_is_evicted(self, grabber, monkeypatch):
+        monkeypatch.setattr(x11_shm, "SHM_MAX_FREE_BYTES", 2 * 100 * 100 * 4)
+        first, second, third = (grabber._acquire(100, 100 - i) for i in range(3))
+        grabber._release(first)
+        grabber._release(second)
+        grabber._release(grabber._acquire(100, 100))
+        grabber._release(third)
+        assert grabber._released == [second]
+        assert list(grabber._free) == [(100, 100), (100, 98)]
+        assert grabber._free_bytes == first.nbytes + third.nbytes
+        grabber._recycle()
+        assert second.destroyed_with == [DISPLAY]
+
+    def test_close(self, grabber):
+        free, released, in_use = (grabber._acquire(10, i) for i in (1, 2, 3))
+        grabber._release(free)
+        grabber._released.append(released)
+        grabber.close()
+        assert free.destroyed_with == released.destroyed_with == [DISPLAY]
+        grabber.libraries[0].XCloseDisplay.assert_called_once_with(DISPLAY)
+        # Closing the connection detached the segment, it is freed once dropped.
+        grabber._release(in_use)
+        assert in_use.destroyed_with == [None]
+        assert grabber._free == {}
+        grabber.close()
+        grabber.libraries[0].XCloseDisplay.assert_called_once_with(DISPLAY)
+
+
+class FakeGrabber(x11_shm.X11ShmGrabber):
+    def __init__(self):
+        self.display = DISPLAY
+        self.closes = 0
+
+    def close(self):
+        self.closes += 1
+        self.display = None
+
+
+@pytest.fixture
+def grabbers(monkeypatch):
+    monkeypatch.setattr(screenshot_image, "X11ShmGrabber", FakeGrabber)
+    monkeypatch.setattr(screenshot_image, "_grabbers", threading.local())
+    monkeypatch.setattr(screenshot_image, "_grabber_closers", [])
+
+
+class TestThreadGrabbers:
+    def test_closed_when_thread_ends(self, grabbers):
+        grabbed = []
+        thread = threading.Thread(
+            target=lambda: grabbed.append(screenshot_image._get_x11_shm())
+        )
+        thread.start()
+        thread.join()
+        assert grabbed[0].closes == 1
+
+    def test_closed_at_teardown(self, grabbers):
+        grabber = screenshot_image._get_x11_shm()
+        assert screenshot_image._get_x11_shm() is grabber
+        screenshot_image.close_grabbers()
+        assert grabber.closes == 1
+        new_grabber = screenshot_image._get_x11_shm()
+        assert new_grabber is not grabber
+        screenshot_image.close_grabbers()
+        assert (grabber.closes, new_grabber.closes) == (1, 1)
@@ -45,9 +45,27 @@ def get_core_args():
         help="Highlight patterns and click actions",
         action="store_true",
     )
+    parser.add_argument(
+        "--capture_backend",
+        help="Screenshot backend: auto, x11_shm, mss or pyautogui",
+        action="store",
+        default=None,
+    )
+    parser.add_argument(
+        "--capture_fps",
+        help="Frames per second grabbed by the background capture thread, 0 to disable",
+        type=float,
+        action="store",
+        default=None,
+    )
     parser.add_argument(
         "-c", "--clear", help="Clear run data", default=False, action="store_true"
     )
+    parser.add_argument(
+        "--compile_patterns",
+        help="Compile the images of the target into a pattern store and exit",
+        action="store_true",
+    )
     parser.add_argument(
         "-d",
         "--directory",
@@ -76,6 +94,12 @@ def get_core_args():
         action="store",
         default="en-US",
     )
+    parser.add_argument(
+        "--matcher",
+        help="Template matching engine used for pattern search",
+        action="store",
+        default=None,
+    )
     parser.add_argument(
         "-m",
         "--max_tries",
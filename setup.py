@@ -42,6 +42,9 @@ TESTS_REQUIRE = []
 
 DEV_REQUIRES = []
 
+# Keeps Tesseract loaded between text searches, see Settings.ocr_backend.
+OCR_REQUIRES = ["tesserocr==2.5.0"]
+
 setup(
     name=PACKAGE_NAME,
     version=PACKAGE_VERSION,
@@ -75,11 +78,15 @@ setup(
     use_2to3=False,
     install_requires=INSTALL_REQUIRES,
     tests_require=TESTS_REQUIRE,
-    extras_require={"dev": DEV_REQUIRES},  # For `pip install -e .[dev]`
+    extras_require={
+        "dev": DEV_REQUIRES,  # For `pip install -e .[dev]`
+        "ocr": OCR_REQUIRES,  # For `pip install -e .[ocr]`
+    },
     entry_points={
         "console_scripts": [
             "iris = moziris.scripts.main:main",
             "api-test = moziris.scripts.test:api_test",
+            "iris-benchmark = moziris.scripts.benchmark:main",
         ]
     },
 )